@@ -0,0 +1,141 @@
+import argparse
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, delete, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+import modelTables
+from catalogSync import prune_tombstones, CATALOG_TOMBSTONE_DAYS
+from database import async_engine, AsyncSessionLocal
+
+# hot/cold split of the issue records
+# returned records issued more than LIBRARY_ARCHIVE_AFTER_DAYS ago are moved from Book_issue_records to
+# Book_issue_archive in batches, each batch its own short transaction, so the live table only holds open loans and
+# recent history; the history endpoints read both tables through history_query
+# (records have no return time, the issue time of a returned loan is what ages it)
+#   python archive.py                 archives everything old enough now, exits
+#   python archive.py --days 30
+
+ARCHIVE_AFTER_DAYS = float(os.getenv("LIBRARY_ARCHIVE_AFTER_DAYS", "180"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("LIBRARY_ARCHIVE_BATCH_SIZE", "1000"))
+# seconds between background runs in each worker, 0 leaves archiving to `python archive.py`
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("LIBRARY_ARCHIVE_INTERVAL_SECONDS", "3600"))
+# pause between batches so the archiver doesn't hold the write lock back to back (sqlite) or flood the binlog
+ARCHIVE_BATCH_PAUSE_SECONDS = 0.05
+
+# columns copied to the archive, updated_at is the archiving time (the column default)
+ISSUE_COLUMNS = ("id", "book_id", "user_id", "issued_by", "issue_time", "issue_status")
+
+archive_log = logging.getLogger("library.archive")
+
+
+# the same query over the live records and the archive, newest (or lowest id) first across both
+# `branch(records)` builds the query for one table, including its own keyset condition, order and limit, so each
+# side reads only one page through its index; `order_and_limit` applies the same order and limit to the union
+def history_query(branch, order_and_limit):
+    history = union_all(*(
+        select(branch(records).subquery())
+        for records in (modelTables.BookIssueRecord, modelTables.BookIssueArchive)
+    )).subquery("issue_history")
+    return order_and_limit(select(history), history)
+
+
+# move one batch, returns how many records were archived; the caller commits
+async def archive_batch(db: AsyncSession, cutoff: datetime, batch_size: int):
+    records = modelTables.BookIssueRecord
+    # rows another worker is archiving right now are skipped instead of waited for (MySQL, sqlite ignores it)
+    ids = list(await db.scalars(
+        select(records.id)
+        .where(records.issue_status == "returned", records.issue_time < cutoff)
+        .order_by(records.issue_time)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ))
+    if not ids:
+        return 0
+    columns = [getattr(records, column) for column in ISSUE_COLUMNS]
+    await db.execute(insert(modelTables.BookIssueArchive).from_select(list(ISSUE_COLUMNS), select(*columns).where(records.id.in_(ids))))
+    await db.execute(delete(records).where(records.id.in_(ids)), execution_options={"synchronize_session": False})
+    return len(ids)
+
+
+class Archiver:
+    def __init__(self):
+        self.archived = 0
+        self.tombstones_pruned = 0
+        self.runs = 0
+        self.last_run = None
+        self.last_error = None
+
+    # archive everything older than `after_days`, one committed batch at a time
+    async def run(self, after_days: float = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE):
+        cutoff = datetime.now() - timedelta(days=after_days)
+        archived = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                moved = await archive_batch(db, cutoff, batch_size)
+                await db.commit()
+            archived += moved
+            self.archived += moved
+            if moved < batch_size:
+                break
+            await asyncio.sleep(ARCHIVE_BATCH_PAUSE_SECONDS)
+        # catalog delete tombstones age out on the same schedule, see catalogSync.py
+        async with AsyncSessionLocal() as db:
+            self.tombstones_pruned += await prune_tombstones(db)
+            await db.commit()
+        self.runs += 1
+        self.last_run = datetime.now()
+        return archived
+
+    # background loop started by the app's lifespan, begins once `ready` (the worker's warm-up) is done
+    async def run_forever(self, ready):
+        await ready
+        while True:
+            started = time.perf_counter()
+            try:
+                archived = await self.run()
+                self.last_error = None
+                if archived:
+                    archive_log.info("archived %d issue records in %.0fms", archived, (time.perf_counter() - started) * 1000)
+            except Exception as error:
+                # e.g. another worker archived the same rows first, the next run picks up what is left
+                self.last_error = repr(error)
+                archive_log.warning("archiving failed: %r", error)
+            await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
+
+    def stats(self):
+        return {
+            "archived": self.archived,
+            "tombstones_pruned": self.tombstones_pruned,
+            "tombstone_days": CATALOG_TOMBSTONE_DAYS,
+            "runs": self.runs,
+            "last_run": self.last_run,
+            "last_error": self.last_error,
+            "after_days": ARCHIVE_AFTER_DAYS,
+            "interval_seconds": ARCHIVE_INTERVAL_SECONDS,
+        }
+
+
+archiver = Archiver()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old returned issue records to the archive table")
+    parser.add_argument("--days", type=float, default=ARCHIVE_AFTER_DAYS, help="archive returned records issued more than this many days ago")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    async def archive():
+        try:
+            return await archiver.run(args.days, args.batch_size)
+        finally:
+            await async_engine.dispose()
+
+    print(f"archived {asyncio.run(archive())} issue records")
+
+
+if __name__ == "__main__":
+    main()
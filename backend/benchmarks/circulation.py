@@ -0,0 +1,121 @@
+# concurrent issue/return load test on one hot book
+# every user repeatedly issues the book and returns it; with more users than copies most issues are rejected,
+# which is exactly the contention the circulation engine has to get right
+#   uvicorn main:app --port 8000
+#   python -m benchmarks.circulation --url http://127.0.0.1:8000 --users 40 --copies 5 --rounds 10
+# exits with status 1 if copies ever went negative or didn't come back to the starting value
+import argparse
+import asyncio
+import json
+import sys
+import time
+import httpx
+from benchmarks.concurrency import percentile
+
+
+async def read_copies(client, book_id):
+    # /books/get_all reads the books table directly, unlike the cached catalog endpoints
+    response = await client.get("/books/get_all", params={"after": book_id - 1, "limit": 1})
+    return response.json()[0]["copies"]
+
+
+async def setup(client, username, password, users, copies, tag):
+    await client.post("/librarians/sign_up", data={"username": username, "password": password})
+    token = (await client.post("/token", data={"username": username, "password": password})).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    book = (await client.post("/books/", headers=headers, json={
+        "title": f"hot-book-{tag}", "author": "Benchmark", "publisher": "Benchmark", "category": "Benchmark", "copies": copies,
+    })).json()
+    user_ids = []
+    for i in range(users):
+        user = (await client.post("/users/", headers=headers, json={
+            "username": f"bench-{tag}-{i}", "email": f"bench-{tag}-{i}@example.com", "password": "x",
+        })).json()
+        user_ids.append(user["id"])
+    return book["id"], user_ids, headers
+
+
+async def hammer(url, users, copies, rounds, username, password, transport=None):
+    tag = str(int(time.time() * 1000))
+    stats = {"issued": 0, "returned": 0, "rejected": 0, "errors": 0, "min_copies_seen": copies}
+    error_samples = []
+    latencies = []
+
+    async with httpx.AsyncClient(base_url=url, timeout=60, transport=transport) as client:
+        book_id, user_ids, headers = await setup(client, username, password, users, copies, tag)
+
+        async def desk(user_id):
+            for _ in range(rounds):
+                started = time.perf_counter()
+                response = await client.post("/bookIssues/", headers=headers, json={"book_id": book_id, "user_id": user_id})
+                latencies.append(time.perf_counter() - started)
+                if response.status_code == 400:
+                    stats["rejected"] += 1
+                    continue
+                if response.status_code != 200:
+                    stats["errors"] += 1
+                    error_samples.append(f"issue {response.status_code} {response.text[:200]}")
+                    continue
+                stats["issued"] += 1
+
+                started = time.perf_counter()
+                response = await client.put(f"/bookIssues/return_bookIssue={response.json()['id']}")
+                latencies.append(time.perf_counter() - started)
+                if response.status_code == 200:
+                    stats["returned"] += 1
+                else:
+                    stats["errors"] += 1
+                    error_samples.append(f"return {response.status_code} {response.text[:200]}")
+
+        async def sampler(done):
+            while not done.is_set():
+                stats["min_copies_seen"] = min(stats["min_copies_seen"], await read_copies(client, book_id))
+                await asyncio.sleep(0.01)
+
+        done = asyncio.Event()
+        sampling = asyncio.create_task(sampler(done))
+        started = time.perf_counter()
+        await asyncio.gather(*(desk(user_id) for user_id in user_ids))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await sampling
+
+        final_copies = await read_copies(client, book_id)
+
+    latencies.sort()
+    operations = stats["issued"] + stats["returned"] + stats["rejected"]
+    return {
+        **stats,
+        "users": users,
+        "copies": copies,
+        "final_copies": final_copies,
+        "seconds": round(elapsed, 3),
+        "operations_per_sec": round(operations / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "never_negative": stats["min_copies_seen"] >= 0,
+        "no_drift": final_copies == copies - (stats["issued"] - stats["returned"]),
+        "error_samples": error_samples[:5],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hammer issue/return on one hot book")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--copies", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--username", default="benchmark-librarian")
+    parser.add_argument("--password", default="benchmark-password")
+    args = parser.parse_args()
+
+    result = asyncio.run(hammer(args.url, args.users, args.copies, args.rounds, args.username, args.password))
+    print(json.dumps(result, indent=2))
+    if not (result["never_negative"] and result["no_drift"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# compare two suite reports scenario by scenario
+#   python -m benchmarks.compare benchmarks/results/<before>.json benchmarks/results/<after>.json
+# exits with status 1 when a scenario's p95 got worse by more than --threshold percent
+import argparse
+import json
+import sys
+
+METRICS = ("requests_per_sec", "p50_ms", "p95_ms", "p99_ms", "queries_per_request")
+
+
+# the login and circulation scenarios nest their numbers, compare their main part
+def headline(result):
+    if "login" in result:
+        return {**result["login"], "queries_per_request": result.get("queries_per_request")}
+    if "operations_per_sec" in result:
+        return {**result, "requests_per_sec": result["operations_per_sec"]}
+    return result
+
+
+def change(before, after):
+    if before in (None, 0) or after is None:
+        return None
+    return (after - before) / before * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark suite reports")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed p95 regression in percent")
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    print(f"{before['meta']['commit']} -> {after['meta']['commit']}")
+    print(f"{'scenario':<20}" + "".join(f"{metric:>28}" for metric in METRICS))
+    regressions = []
+    for name, result in after["scenarios"].items():
+        if name not in before["scenarios"]:
+            continue
+        old, new = headline(before["scenarios"][name]), headline(result)
+        cells = []
+        for metric in METRICS:
+            delta = change(old.get(metric), new.get(metric))
+            delta_text = f" ({delta:+.0f}%)" if delta is not None else ""
+            cells.append(f"{old.get(metric)} -> {new.get(metric)}{delta_text}")
+        print(f"{name:<20}" + "".join(f"{cell:>28}" for cell in cells))
+
+        p95_delta = change(old.get("p95_ms"), new.get("p95_ms"))
+        if p95_delta is not None and p95_delta > args.threshold:
+            regressions.append(name)
+
+    if regressions:
+        print(f"p95 regressed by more than {args.threshold}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
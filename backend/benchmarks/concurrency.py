@@ -0,0 +1,75 @@
+# concurrency benchmark against a running API
+#   uvicorn main:app --port 8000
+#   python -m benchmarks.concurrency --url http://127.0.0.1:8000 --path /books/get_details -c 50 -n 2000
+# run it against the server before and after a change to compare requests/sec
+import argparse
+import asyncio
+import json
+import time
+import httpx
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+# `path` can be a list, requests then cycle through it
+# `transport` lets the suite drive the app in-process instead of over the network
+async def run(url, path, total, concurrency, headers=None, method="GET", data=None, transport=None):
+    latencies = []
+    errors = 0
+    pending = iter(range(total))
+    paths = [path] if isinstance(path, str) else list(path)
+
+    async with httpx.AsyncClient(base_url=url, timeout=60, headers=headers, transport=transport) as client:
+        async def worker():
+            nonlocal errors
+            for i in pending:
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, paths[i % len(paths)], data=data)
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "method": method,
+        "path": paths[0] if len(paths) == 1 else f"{paths[0]} (+{len(paths) - 1} more)",
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "requests_per_sec": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fire concurrent GET requests at the library API")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--path", action="append", help="endpoint to hit, can be repeated (default /books/get_details)")
+    parser.add_argument("-n", "--requests", type=int, default=1000)
+    parser.add_argument("-c", "--concurrency", type=int, default=50)
+    parser.add_argument("--token", help="bearer token for authenticated endpoints")
+    args = parser.parse_args()
+
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else None
+    for path in args.path or ["/books/get_details"]:
+        result = asyncio.run(run(args.url, path, args.requests, args.concurrency, headers))
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
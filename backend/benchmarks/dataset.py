@@ -0,0 +1,118 @@
+# deterministic synthetic library for benchmarks
+# the same seed and sizes always produce the same rows, so runs on different commits load identical data
+# borrowing is skewed: book and user popularity follow a Zipf-like curve, `skew` 0 is uniform
+#   python -m benchmarks.dataset --db-url sqlite:////tmp/library-bench.db --books 20000 --issues 100000
+import argparse
+import json
+import os
+import random
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+from itertools import accumulate
+from sqlalchemy import create_engine, insert
+
+INSERT_BATCH_SIZE = 5000
+# history starts here, so issue times don't depend on when the data was generated
+HISTORY_START = datetime(2024, 1, 1)
+HISTORY_DAYS = 365
+
+
+@dataclass
+class DatasetSpec:
+    books: int = 5000
+    authors: int = 800
+    publishers: int = 60
+    categories: int = 25
+    users: int = 2000
+    issues: int = 20000
+    skew: float = 1.1
+    pending_ratio: float = 0.05
+    seed: int = 42
+
+
+def zipf_weights(n, skew):
+    return list(accumulate(1 / (rank ** skew) for rank in range(1, n + 1)))
+
+
+def _insert(connection, table, rows):
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        connection.execute(insert(table), rows[start:start + INSERT_BATCH_SIZE])
+
+
+# words the titles are built from, so search benchmarks have realistic partial matches
+TITLE_WORDS = (
+    "river", "shadow", "garden", "winter", "empire", "silent", "glass", "harbor", "iron", "lantern",
+    "orchard", "paper", "queen", "storm", "tower", "velvet", "willow", "ember", "atlas", "bridge",
+)
+
+
+def title_of(rng, i):
+    return f"{rng.choice(TITLE_WORDS).title()} {rng.choice(TITLE_WORDS)} {i}"
+
+
+def generate(db_url: str, spec: DatasetSpec):
+    # importing modelTables creates the app's engines from LIBRARY_DB_URL, so it waits until the caller has set it
+    import modelTables
+    from schema import create_schema
+    rng = random.Random(spec.seed)
+    engine = create_engine(db_url)
+    modelTables.Base.metadata.drop_all(bind=engine)
+    with engine.begin() as connection:
+        create_schema(connection)
+
+    with engine.begin() as connection:
+        _insert(connection, modelTables.Author, [{"id": i, "name": f"Author {i}"} for i in range(1, spec.authors + 1)])
+        _insert(connection, modelTables.Publisher, [{"id": i, "name": f"Publisher {i}"} for i in range(1, spec.publishers + 1)])
+        _insert(connection, modelTables.Category, [{"id": i, "name": f"Category {i}"} for i in range(1, spec.categories + 1)])
+        _insert(connection, modelTables.Book, [{
+            "id": i,
+            "title": title_of(rng, i),
+            "author": rng.randint(1, spec.authors),
+            "publisher": rng.randint(1, spec.publishers),
+            "category": rng.randint(1, spec.categories),
+            "copies": rng.randint(1, 10),
+        } for i in range(1, spec.books + 1)])
+        _insert(connection, modelTables.User, [{
+            "id": i, "username": f"user{i}", "email": f"user{i}@example.com", "password": "x", "has_issued": False,
+        } for i in range(1, spec.users + 1)])
+
+        # popular books and heavy readers get most of the history; nothing is left issued,
+        # so the circulation scenario starts from a consistent inventory
+        book_weights = zipf_weights(spec.books, spec.skew)
+        user_weights = zipf_weights(spec.users, spec.skew)
+        book_ids = rng.choices(range(1, spec.books + 1), cum_weights=book_weights, k=spec.issues)
+        user_ids = rng.choices(range(1, spec.users + 1), cum_weights=user_weights, k=spec.issues)
+        _insert(connection, modelTables.BookIssueRecord, [{
+            "id": i + 1,
+            "book_id": book_ids[i],
+            "user_id": user_ids[i],
+            "issued_by": None,
+            "issue_time": HISTORY_START + timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400)),
+            "issue_status": "pending" if rng.random() < spec.pending_ratio else "returned",
+        } for i in range(spec.issues)])
+
+    engine.dispose()
+    return spec
+
+
+# ids ordered by popularity, for scenarios that want to hit the same hot rows the data was skewed towards
+def hot_ids(n, count, skew, seed):
+    rng = random.Random(seed + 1)
+    return rng.choices(range(1, n + 1), cum_weights=zipf_weights(n, skew), k=count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic library database")
+    parser.add_argument("--db-url", required=True, help="database to (re)create, its tables are dropped first")
+    for field, default in asdict(DatasetSpec()).items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(default), default=default)
+    args = vars(parser.parse_args())
+    db_url = args.pop("db_url")
+    os.environ["LIBRARY_DB_URL"] = db_url
+
+    spec = generate(db_url, DatasetSpec(**args))
+    print(json.dumps(asdict(spec)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+# login throughput under concurrency, while probing a cheap GET endpoint
+# the probe latency shows whether password hashing is freezing the event loop
+#   uvicorn main:app --port 8000
+#   python -m benchmarks.login --url http://127.0.0.1:8000 -c 32 -n 256
+import argparse
+import asyncio
+import json
+import httpx
+from benchmarks.concurrency import run
+
+
+async def storm(url, username, password, total, concurrency, probe_path, transport=None):
+    async with httpx.AsyncClient(base_url=url, timeout=60, transport=transport) as client:
+        # make sure the benchmark librarian exists, 422 means it already does
+        await client.post("/librarians/sign_up", data={"username": username, "password": password})
+
+    credentials = {"username": username, "password": password}
+    login, probe = await asyncio.gather(
+        run(url, "/token", total, concurrency, method="POST", data=credentials, transport=transport),
+        run(url, probe_path, total, max(1, concurrency // 4), transport=transport),
+    )
+    return {"login": login, "probe_during_login": probe}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure /token throughput under concurrent logins")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--username", default="benchmark-librarian")
+    parser.add_argument("--password", default="benchmark-password")
+    parser.add_argument("-n", "--requests", type=int, default=256)
+    parser.add_argument("-c", "--concurrency", type=int, default=32)
+    parser.add_argument("--probe", default="/categories/get_all")
+    args = parser.parse_args()
+
+    result = asyncio.run(storm(args.url, args.username, args.password, args.requests, args.concurrency, args.probe))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
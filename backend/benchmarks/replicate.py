@@ -0,0 +1,43 @@
+# lagging sqlite "replica" for trying the read/write routing locally, see readReplicas.py
+# copies the primary file onto each replica file every --interval seconds with sqlite's online backup, so reads
+# routed to a replica see the data as of the last copy
+#   python -m benchmarks.replicate /tmp/library.db /tmp/library-replica.db --interval 2
+#   LIBRARY_DB_URL=sqlite:////tmp/library.db LIBRARY_DB_REPLICA_URLS=sqlite:////tmp/library-replica.db uvicorn main:app
+# with two local MySQL instances use real replication instead and point LIBRARY_DB_REPLICA_URLS at the replica
+import argparse
+import sqlite3
+import time
+
+
+def copy(primary: str, replicas):
+    source = sqlite3.connect(primary)
+    try:
+        for replica in replicas:
+            target = sqlite3.connect(replica)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+    finally:
+        source.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy a sqlite primary onto replica files on an interval")
+    parser.add_argument("primary")
+    parser.add_argument("replicas", nargs="+")
+    parser.add_argument("--interval", type=float, default=2.0, help="seconds between copies, i.e. the replication lag")
+    parser.add_argument("--once", action="store_true", help="copy once and exit")
+    args = parser.parse_args()
+
+    while True:
+        started = time.perf_counter()
+        copy(args.primary, args.replicas)
+        if args.once:
+            return
+        print(f"copied to {len(args.replicas)} replica(s) in {(time.perf_counter() - started) * 1000:.0f}ms", flush=True)
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
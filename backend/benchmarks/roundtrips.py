@@ -0,0 +1,121 @@
+# SQL statements per write endpoint, checked against ROUTE_BUDGETS
+# runs every create/update/delete once (plus its not-found case) in-process on a scratch sqlite file,
+# with the catalog read model and principal cache warm like a running worker
+#   python -m benchmarks.roundtrips        exits with status 1 when an endpoint runs more statements than its budget
+# tests/test_roundtrips.py runs the same calls with run() and asserts on the results
+import os
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+Roundtrip = namedtuple("Roundtrip", "label method route status expected_status statements budget")
+
+
+# every write endpoint once on `client` with the librarian `auth` headers, statements counted by `counter`
+def run(client, auth, counter):
+    from queryBudget import ROUTE_BUDGETS
+
+    results = []
+
+    def call(label, method, route, path, expected_status, **kwargs):
+        before = counter.count
+        response = client.request(method, path, headers=auth, **kwargs)
+        results.append(Roundtrip(label, method, route, response.status_code, expected_status,
+                                 counter.count - before, ROUTE_BUDGETS.get((method, route))))
+        return response
+
+    book = {"title": "Dune", "author": "Herbert", "publisher": "Chilton", "category": "Fiction", "copies": 2}
+    user = {"username": "reader", "email": "reader@example.com", "password": "x", "has_issued": False}
+
+    call("create category", "POST", "/categories/", "/categories/", 200, json={"name": "Fiction"})
+    call("create category (exists)", "POST", "/categories/", "/categories/", 404, json={"name": "fiction"})
+    call("create author", "POST", "/authors/", "/authors/", 200, json={"name": "Herbert"})
+    call("create publisher", "POST", "/publishers/", "/publishers/", 200, json={"name": "Chilton"})
+    book_id = call("add book (names exist)", "POST", "/books/", "/books/", 200, json=book).json()["id"]
+    call("add book (new names)", "POST", "/books/", "/books/", 200,
+         json={**book, "title": "Emma", "author": "Austen", "publisher": "Murray", "category": "Classics"})
+    call("add book (merge copies)", "POST", "/books/", "/books/", 200, json=book)
+    route = "/books/update_book_by_id={book_id}"
+    call("update book", "PUT", route, f"/books/update_book_by_id={book_id}", 200, json={**book, "copies": 5})
+    call("update book (missing)", "PUT", route, "/books/update_book_by_id=999999", 404, json=book)
+
+    user_id = call("create user", "POST", "/users/", "/users/", 201, json=user).json()["id"]
+    call("update user name", "PUT", "/user/update_user_name={id}", f"/user/update_user_name={user_id}?updated_name=reader2", 200)
+    call("update user", "PUT", "/users/update_user={user_id}", f"/users/update_user={user_id}", 200, json=user)
+    call("update user (missing)", "PUT", "/users/update_user={user_id}", "/users/update_user=999999", 404, json=user)
+
+    issue_id = call("issue book", "POST", "/bookIssues/", "/bookIssues/", 200, json={"book_id": book_id, "user_id": user_id}).json()["id"]
+    call("return book", "PUT", "/bookIssues/return_bookIssue={bookIssue_id}", f"/bookIssues/return_bookIssue={issue_id}", 200)
+    pending_id = client.post("/bookIssues/", json={"book_id": book_id, "user_id": user_id}).json()["id"]
+    call("approve pending issue", "PUT", "/update_bookIssue={bookIssue_id}", f"/update_bookIssue={pending_id}", 200)
+    call("return book (approved)", "PUT", "/bookIssues/return_bookIssue={bookIssue_id}", f"/bookIssues/return_bookIssue={pending_id}", 200)
+    client.delete(f"/bookIssues/delete_returned_book={pending_id}", headers=auth)
+    batch = {"items": [{"book_id": book_id, "user_id": user_id}, {"book_id": book_id, "user_id": 999999}]}
+    batch_ids = [result.get("issue_id") for result in call("batch issue", "POST", "/bookIssues/batch_issue", "/bookIssues/batch_issue", 200, json=batch).json()["results"]]
+    call("batch return", "PUT", "/bookIssues/batch_return", "/bookIssues/batch_return", 200, json={"issue_ids": [batch_ids[0], 999999]})
+    route = "/bookIssues/delete_returned_book={bookIssue_id}"
+    call("delete returned issue", "DELETE", route, f"/bookIssues/delete_returned_book={issue_id}", 200)
+    call("delete returned issue (missing)", "DELETE", route, f"/bookIssues/delete_returned_book={issue_id}", 404)
+
+    for plural, path in (("categories", "delete_category"), ("authors", "delete_author"), ("publishers", "delete_publisher")):
+        ref_id = client.get(f"/{plural}/get_all").json()[0]["id"]
+        singular = path.removeprefix("delete_")
+        call(f"rename {singular}", "PUT", f"/{plural}/update_{singular}={{{singular}_id}}", f"/{plural}/update_{singular}={ref_id}", 200, json={"name": f"Renamed {singular}"})
+        call(f"delete {singular} (missing)", "DELETE", f"/{plural}/{path}={{{singular}_id}}", f"/{plural}/{path}=999999", 404)
+
+    client.delete(f"/bookIssues/delete_returned_book={batch_ids[0]}", headers=auth)
+    call("delete book", "DELETE", "/books/delete_book_by_id={book_id}", f"/books/delete_book_by_id={book_id}", 200)
+    call("delete user", "DELETE", "/users/delete_user_by_id={id}", f"/users/delete_user_by_id={user_id}", 200)
+    return results
+
+
+def over_budget(result: Roundtrip):
+    return result.budget is not None and result.statements > result.budget
+
+
+def main():
+    os.environ["LIBRARY_DB_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="library-roundtrips-"), "library.db")
+    os.environ["LIBRARY_CREATE_SCHEMA"] = "true"
+    os.environ.setdefault("LIBRARY_BCRYPT_ROUNDS", "4")
+    os.environ.setdefault("LIBRARY_SLOW_REQUEST_MS", "0")
+    # no background archiving while statements are being counted
+    os.environ.setdefault("LIBRARY_ARCHIVE_INTERVAL_SECONDS", "0")
+
+    from fastapi.testclient import TestClient
+    import main as app_module
+    from benchmarks.suite import QueryCounter
+    from database import async_engine
+
+    counter = QueryCounter(async_engine)
+
+    with TestClient(app_module.app) as client:
+        while client.get("/health/ready").status_code != 200:
+            time.sleep(0.05)
+        client.post("/librarians/sign_up", data={"username": "desk", "password": "desk"})
+        token = client.post("/token", data={"username": "desk", "password": "desk"}).json()["access_token"]
+        auth = {"Authorization": f"Bearer {token}"}
+        client.get("/users/me", headers=auth)
+        client.get("/books/get_details")
+        results = run(client, auth, counter)
+
+    failed = []
+    print(f"{'endpoint':<40}{'status':>6}{'stmts':>7}{'budget':>7}")
+    for result in results:
+        flag = ""
+        if result.status != result.expected_status:
+            flag = f"  unexpected status, expected {result.expected_status}"
+            failed.append(result.label)
+        elif over_budget(result):
+            flag = "  OVER BUDGET"
+            failed.append(result.label)
+        budget = result.budget if result.budget is not None else "-"
+        print(f"{result.label:<40}{result.status:>6}{result.statements:>7}{budget:>7}{flag}")
+
+    if failed:
+        print(f"over budget or failed: {', '.join(failed)}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
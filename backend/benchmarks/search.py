@@ -0,0 +1,85 @@
+# fuzzy search latency of the in-memory search index alone, at catalog sizes the API suite takes too long to load
+# queries are titles of the index with typos (a dropped, doubled, swapped or replaced letter per word) and parts of
+# titles, the ranking the endpoint does on top (weights and heapq top-k, see CatalogView.fuzzy_search) is included
+# target: p95 under 25ms and p99 under 50ms for 1M titles on one core, LIBRARY_SEARCH_MAX_CANDIDATES trades the latency
+# of queries made of common words against how many of their matches are ranked
+#   python -m benchmarks.search --titles 1000000
+import argparse
+import heapq
+import json
+import random
+import statistics
+import string
+import time
+from benchmarks.dataset import title_of
+from searchIndex import SearchIndex
+
+
+def typo(rng, word):
+    if len(word) < 3:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    kind = rng.randrange(4)
+    if kind == 0:
+        return word[:i] + word[i + 1:]
+    if kind == 1:
+        return word[:i] + word[i] + word[i:]
+    if kind == 2:
+        return word[:i - 1] + word[i] + word[i - 1] + word[i + 1:]
+    return word[:i] + rng.choice(string.ascii_lowercase) + word[i + 1:]
+
+
+def query_of(rng, title):
+    words = title.split()
+    if rng.random() < 0.5:
+        # part of the title
+        start = rng.randrange(len(words))
+        words = words[start:start + rng.randint(1, 2)]
+    return " ".join(typo(rng, word) for word in words)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fuzzy search latency of the in-memory search index")
+    parser.add_argument("--titles", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    titles = [title_of(rng, i) for i in range(args.titles)]
+    started = time.perf_counter()
+    index = SearchIndex(text_fields=("title",))
+    for book_id, title in enumerate(titles):
+        index.add(book_id, {"title": title})
+    build_seconds = time.perf_counter() - started
+
+    timings, found = [], 0
+    for _ in range(args.queries):
+        book_id = rng.randrange(args.titles)
+        query = query_of(rng, titles[book_id])
+        started = time.perf_counter()
+        scores = {}
+        for value, score in heapq.nlargest(args.limit, index.similar("title", query).items(), key=lambda item: item[1]):
+            for doc_id in index.lookup("title", value):
+                scores[doc_id] = score
+        best = heapq.nlargest(args.limit, scores.items(), key=lambda item: (item[1], -item[0]))
+        timings.append((time.perf_counter() - started) * 1000)
+        found += any(doc_id == book_id for doc_id, _ in best)
+
+    timings.sort()
+    print(json.dumps({
+        "titles": args.titles,
+        "build_seconds": round(build_seconds, 1),
+        "queries": args.queries,
+        "p50_ms": round(statistics.median(timings), 2),
+        "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 2),
+        "p99_ms": round(timings[int(len(timings) * 0.99) - 1], 2),
+        "max_ms": round(timings[-1], 2),
+        # share of queries whose title made the top `limit`, parts of titles match many books equally well
+        "recall_at_limit": round(found / args.queries, 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
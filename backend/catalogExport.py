@@ -0,0 +1,258 @@
+import argparse
+import asyncio
+import csv
+import io
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+import orjson
+from sqlalchemy import select, literal
+from sqlalchemy.ext.asyncio import AsyncSession
+import modelTables
+from archive import history_query
+from catalogSync import read_clock
+from catalogView import catalog_query, changed_since
+from database import async_engine, AsyncSessionLocal
+
+# bulk export for reporting, the counterpart of catalogIngest.py
+# rows of one joined query are read through a server-side cursor in chunks of EXPORT_CHUNK_SIZE and encoded chunk by
+# chunk, so memory stays bounded whatever the table sizes; served on /export/{dataset} and by the CLI:
+#   python catalogExport.py catalog --format csv --output books.csv
+#   python catalogExport.py issues --format parquet --output issues.parquet --since 120000
+# `since` is a watermark: only rows written after it are exported, pass the watermark of the previous export
+# (the X-Export-Watermark header, or "watermark" in the stats the CLI prints); a row written while the export runs
+# may come again next time, load exports as upserts by id
+# catalog: the version clock read before the rows (see modelTables.py); deleted books aren't in incremental exports,
+# /catalog/changes has them
+# issues: issue records aren't versioned, the watermark is their updated_at in UTC microseconds since the epoch, taken
+# EXPORT_ISSUE_OVERLAP_SECONDS before the export starts so records of transactions that commit late come again next
+# time; archived records come again with archived=true, but deleted records (delete_bookIssue, deleted users) aren't
+# in incremental issue exports, a full export has none of them
+# parquet needs pyarrow (`pip install pyarrow`), the other formats have no extra dependency
+EXPORT_CHUNK_SIZE = int(os.getenv("LIBRARY_EXPORT_CHUNK_SIZE", "5000"))
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson", "parquet": "application/vnd.apache.parquet"}
+EXPORT_ISSUE_OVERLAP_SECONDS = float(os.getenv("LIBRARY_EXPORT_ISSUE_OVERLAP_SECONDS", "60"))
+EPOCH = datetime(1970, 1, 1)
+
+export_log = logging.getLogger("library.export")
+
+
+# a book is written again when it changes or its author, publisher or category is renamed
+def catalog_rows(since: int):
+    query = catalog_query().add_columns(modelTables.Book.version)
+    return query.where(changed_since(since)) if since else query
+
+
+# read before the rows, every write up to it is in the export
+async def catalog_watermark(db: AsyncSession):
+    return (await read_clock(db)).version
+
+
+def issue_rows(since: int):
+    def branch(records):
+        query = (
+            select(
+                records.id,
+                records.book_id,
+                modelTables.Book.title.label("bookname"),
+                records.user_id,
+                modelTables.User.username,
+                records.issued_by,
+                records.issue_time,
+                records.issue_status,
+                literal(records is modelTables.BookIssueArchive).label("archived"),
+                records.updated_at,
+            )
+            .outerjoin(modelTables.Book, modelTables.Book.id == records.book_id)
+            .outerjoin(modelTables.User, modelTables.User.id == records.user_id)
+            .order_by(records.id)
+        )
+        return query.where(records.updated_at >= EPOCH + timedelta(microseconds=since)) if since else query
+
+    # live and archived records, see archive.py
+    return history_query(branch, lambda statement, history: statement.order_by(history.c.id))
+
+
+# no database read, updated_at is set from the application clock
+async def issue_watermark(db: AsyncSession):
+    started = datetime.utcnow() - timedelta(seconds=EXPORT_ISSUE_OVERLAP_SECONDS)
+    return (started - EPOCH) // timedelta(microseconds=1)
+
+
+# dataset -> (query for rows after the watermark, watermark for the next export, columns with their parquet types)
+EXPORT_DATASETS = {
+    "catalog": (catalog_rows, catalog_watermark, (
+        ("id", "int64"), ("title", "string"), ("author_id", "int64"), ("publisher_id", "int64"), ("category_id", "int64"),
+        ("author", "string"), ("publisher", "string"), ("category", "string"), ("copies", "int64"), ("version", "int64"),
+    )),
+    "issues": (issue_rows, issue_watermark, (
+        ("id", "int64"), ("book_id", "int64"), ("bookname", "string"), ("user_id", "int64"), ("username", "string"),
+        ("issued_by", "int64"), ("issue_time", "timestamp"), ("issue_status", "string"), ("archived", "bool"),
+        ("updated_at", "timestamp"),
+    )),
+}
+
+
+class ParquetUnavailable(RuntimeError):
+    pass
+
+
+# chunks of rows -> chunks of bytes, one encoder per export
+class CsvEncoder:
+    def __init__(self, columns):
+        self.columns = [name for name, _ in columns]
+
+    def encode(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode()
+
+    def header(self):
+        return self.encode([self.columns])
+
+    def footer(self):
+        return b""
+
+
+class NdjsonEncoder:
+    def __init__(self, columns):
+        self.columns = [name for name, _ in columns]
+
+    def encode(self, rows):
+        return b"".join(orjson.dumps(dict(zip(self.columns, row))) + b"\n" for row in rows)
+
+    def header(self):
+        return b""
+
+    def footer(self):
+        return b""
+
+
+# every chunk becomes one row group, its bytes are handed on as soon as the writer has written them
+class ParquetEncoder:
+    def __init__(self, columns):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ParquetUnavailable("parquet export needs pyarrow, pip install pyarrow")
+        types = {"int64": pyarrow.int64(), "string": pyarrow.string(), "bool": pyarrow.bool_(), "timestamp": pyarrow.timestamp("us")}
+        self._pyarrow = pyarrow
+        self.schema = pyarrow.schema([(name, types[kind]) for name, kind in columns])
+        self._sink = io.BytesIO()
+        self._writer = pyarrow.parquet.ParquetWriter(self._sink, self.schema, compression="snappy")
+
+    def _drain(self):
+        data = self._sink.getvalue()
+        self._sink.seek(0)
+        self._sink.truncate()
+        return data
+
+    def encode(self, rows):
+        columns = list(zip(*rows))
+        self._writer.write_table(self._pyarrow.Table.from_arrays(
+            [self._pyarrow.array(values, type=field.type) for values, field in zip(columns, self.schema)],
+            schema=self.schema,
+        ))
+        return self._drain()
+
+    def header(self):
+        return self._drain()
+
+    def footer(self):
+        self._writer.close()
+        return self._drain()
+
+
+ENCODERS = {"csv": CsvEncoder, "ndjson": NdjsonEncoder, "parquet": ParquetEncoder}
+
+
+# rows, bytes and throughput of one export
+class ExportStats:
+    def __init__(self, dataset: str, fmt: str, watermark: int):
+        self.dataset = dataset
+        self.format = fmt
+        self.rows = 0
+        self.bytes = 0
+        self.watermark = watermark   # the `since` of the next incremental export
+        self.started = time.perf_counter()
+
+    def as_dict(self):
+        seconds = time.perf_counter() - self.started
+        return {
+            "dataset": self.dataset,
+            "format": self.format,
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "watermark": self.watermark,
+            "seconds": round(seconds, 3),
+            "mb_per_sec": round(self.bytes / 1e6 / seconds, 2) if seconds else None,
+        }
+
+
+def new_encoder(dataset: str, fmt: str):
+    return ENCODERS[fmt](EXPORT_DATASETS[dataset][2])
+
+
+async def export_watermark(db: AsyncSession, dataset: str):
+    _, watermark, _ = EXPORT_DATASETS[dataset]
+    return await watermark(db)
+
+
+# encoded chunks of one export, read with a server-side cursor
+# the encoder is created by the caller first, so a missing dependency fails before anything is sent
+async def export_chunks(db: AsyncSession, dataset: str, encoder, since: int, stats: ExportStats):
+    query, _, _ = EXPORT_DATASETS[dataset]
+    data = encoder.header()
+    if data:
+        stats.bytes += len(data)
+        yield data
+    result = await db.stream(query(since).execution_options(yield_per=EXPORT_CHUNK_SIZE))
+    async for rows in result.partitions():
+        data = encoder.encode(rows)
+        stats.rows += len(rows)
+        stats.bytes += len(data)
+        yield data
+    data = encoder.footer()
+    if data:
+        stats.bytes += len(data)
+        yield data
+    export_log.info("export %s", stats.as_dict())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the catalog or the circulation history")
+    parser.add_argument("dataset", choices=EXPORT_DATASETS)
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--output", help="file to write, stdout when left out")
+    parser.add_argument("--since", type=int, default=0, help="only rows written after this, the watermark of the previous export")
+    args = parser.parse_args()
+
+    try:
+        encoder = new_encoder(args.dataset, args.format)
+    except ParquetUnavailable as error:
+        parser.error(str(error))
+    stats = None
+
+    async def export(out):
+        nonlocal stats
+        try:
+            async with AsyncSessionLocal() as db:
+                stats = ExportStats(args.dataset, args.format, await export_watermark(db, args.dataset))
+                async for data in export_chunks(db, args.dataset, encoder, args.since, stats):
+                    out.write(data)
+        finally:
+            await async_engine.dispose()
+
+    if args.output:
+        with open(args.output, "wb") as out:
+            asyncio.run(export(out))
+    else:
+        asyncio.run(export(sys.stdout.buffer))
+    print(orjson.dumps(stats.as_dict()).decode(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+from pydantic import ValidationError
+from sqlalchemy import select, insert, update, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+import modelTables
+from database import engine, async_engine, AsyncSessionLocal
+from model import BookRequest
+from schema import create_schema
+
+# bulk catalog ingest
+# rows are read lazily from a CSV or JSONL file of BookRequest records and written chunk by chunk:
+# names are resolved in batches against an in-memory map, new books go in one multi-row insert and
+# existing titles get their copies merged like POST /books/ does; every chunk is one commit
+INGEST_CHUNK_SIZE = int(os.getenv("LIBRARY_INGEST_CHUNK_SIZE", "1000"))
+MAX_INGEST_CHUNK_SIZE = 10000
+MAX_REPORTED_ERRORS = 100
+
+REF_TABLES = {
+    "author": modelTables.Author,
+    "publisher": modelTables.Publisher,
+    "category": modelTables.Category,
+}
+
+# executemany update, bind names must differ from the column names
+_merge_copies = (
+    update(modelTables.Book.__table__)
+    .where(modelTables.Book.__table__.c.id == bindparam("book_id"))
+    .values(copies=modelTables.Book.__table__.c.copies + bindparam("added_copies"))
+)
+
+
+# titles and names compare case-insensitively, like the database collations do
+def _key(value: str):
+    return value.lower()
+
+
+def format_of(filename: str):
+    if filename.endswith(".csv"):
+        return "csv"
+    if filename.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    return None
+
+
+# yields (line number, raw record) from a text stream
+def read_records(lines, fmt: str):
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == "jsonl":
+        for line_number, line in enumerate(lines, start=1):
+            if line.strip():
+                try:
+                    yield line_number, json.loads(line)
+                except json.JSONDecodeError as error:
+                    yield line_number, error
+    else:
+        raise ValueError(f"unsupported ingest format {fmt!r}")
+
+
+class CatalogIngest:
+    def __init__(self, db: AsyncSession, chunk_size: int = INGEST_CHUNK_SIZE, progress=None):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self._ids = {ref: {} for ref in REF_TABLES}   # ref -> name -> id, filled as chunks are resolved
+        self._started = None
+        self.stats = {
+            "rows": 0, "inserted": 0, "merged": 0, "invalid": 0, "chunks": 0,
+            "authors_created": 0, "publishers_created": 0, "categories_created": 0,
+            "seconds": 0.0, "rows_per_sec": 0.0, "errors": [],
+        }
+
+    def _invalid(self, line_number, error):
+        self.stats["invalid"] += 1
+        if len(self.stats["errors"]) < MAX_REPORTED_ERRORS:
+            self.stats["errors"].append({"line": line_number, "error": str(error)})
+
+    async def run(self, records):
+        self._started = time.perf_counter()
+        chunk = []
+        for line_number, record in records:
+            self.stats["rows"] += 1
+            if isinstance(record, Exception):
+                self._invalid(line_number, record)
+                continue
+            try:
+                chunk.append(BookRequest.model_validate(record))
+            except ValidationError as error:
+                self._invalid(line_number, error.errors(include_url=False)[0]["msg"])
+                continue
+            if len(chunk) >= self.chunk_size:
+                await self._write_chunk(chunk)
+                chunk = []
+        if chunk:
+            await self._write_chunk(chunk)
+        self._update_rate()
+        return self.stats
+
+    # one select per table for the names this chunk hasn't seen yet, one multi-row insert for the missing ones
+    async def _resolve_names(self, ref: str, names: set):
+        table = REF_TABLES[ref]
+        known = self._ids[ref]
+        missing = {_key(name): name for name in names if _key(name) not in known}
+        if not missing:
+            return
+
+        rows = await self.db.execute(select(table.name, table.id).where(table.name.in_(missing.values())).order_by(table.id))
+        for name, ref_id in rows:
+            known.setdefault(_key(name), ref_id)
+        missing = {key: name for key, name in missing.items() if key not in known}
+        if not missing:
+            return
+
+        await self.db.execute(insert(table), [{"name": name} for name in sorted(missing.values())])
+        rows = await self.db.execute(select(table.name, table.id).where(table.name.in_(missing.values())).order_by(table.id))
+        for name, ref_id in rows:
+            known.setdefault(_key(name), ref_id)
+        self.stats[f"{table.__tablename__}_created"] += len(missing)
+
+    async def _write_chunk(self, chunk):
+        # titles repeated inside the chunk become one row with the copies summed
+        books = {}
+        for book in chunk:
+            if _key(book.title) in books:
+                books[_key(book.title)]["copies"] += book.copies
+            else:
+                books[_key(book.title)] = book.model_dump()
+
+        existing = {_key(title): book_id for title, book_id in (await self.db.execute(
+            select(modelTables.Book.title, modelTables.Book.id)
+            .where(modelTables.Book.title.in_([book["title"] for book in books.values()]))
+        )).all()}
+
+        new_books = [book for key, book in books.items() if key not in existing]
+        for ref in REF_TABLES:
+            await self._resolve_names(ref, {book[ref] for book in new_books})
+
+        if existing:
+            await self.db.execute(_merge_copies, [
+                {"book_id": book_id, "added_copies": books[key]["copies"]} for key, book_id in existing.items()
+            ])
+        if new_books:
+            await self.db.execute(insert(modelTables.Book), [{
+                "title": book["title"],
+                "author": self._ids["author"][_key(book["author"])],
+                "publisher": self._ids["publisher"][_key(book["publisher"])],
+                "category": self._ids["category"][_key(book["category"])],
+                "copies": book["copies"],
+            } for book in new_books])
+        await self.db.commit()
+
+        self.stats["chunks"] += 1
+        self.stats["inserted"] += len(new_books)
+        self.stats["merged"] += len(existing)
+        self._update_rate()
+        if self.progress:
+            self.progress(self.stats)
+
+    def _update_rate(self):
+        elapsed = time.perf_counter() - self._started
+        self.stats["seconds"] = round(elapsed, 3)
+        self.stats["rows_per_sec"] = round(self.stats["rows"] / elapsed, 1) if elapsed else 0.0
+
+
+# python catalogIngest.py books.csv [--chunk-size 1000]
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load BookRequest rows from a CSV or JSONL file")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=("csv", "jsonl"), default=None)
+    parser.add_argument("--chunk-size", type=int, default=INGEST_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    fmt = args.format or format_of(args.path)
+    if fmt is None:
+        parser.error("can't tell the format from the file name, pass --format")
+
+    def report(stats):
+        print(f"chunk {stats['chunks']}: {stats['rows']} rows, {stats['inserted']} inserted, "
+              f"{stats['merged']} merged, {stats['invalid']} invalid, {stats['rows_per_sec']} rows/s", flush=True)
+
+    with engine.begin() as connection:
+        create_schema(connection)
+
+    async def ingest():
+        try:
+            async with AsyncSessionLocal() as db:
+                with open(args.path, newline="", encoding="utf-8") as lines:
+                    return await CatalogIngest(db, args.chunk_size, report).run(read_records(lines, fmt))
+        finally:
+            await async_engine.dispose()
+
+    print(json.dumps(asyncio.run(ingest()), indent=2))
+
+
+if __name__ == "__main__":
+    main()
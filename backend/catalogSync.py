@@ -0,0 +1,80 @@
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, update, delete, func, case
+from sqlalchemy.ext.asyncio import AsyncSession
+import modelTables
+
+# delta sync of the catalog for clients that keep a local copy of it (the frontend keeps one in IndexedDB)
+# books, authors, publishers and categories carry a version from the version clock (VersionClock in modelTables.py),
+# which follows commit order, and a delete leaves a tombstone with the version of the delete
+# GET /catalog/changes?since=<version> returns the rows and tombstones newer than `since` and the version to pass next
+# time; since=0 is a full copy without tombstones
+# tombstones are kept LIBRARY_CATALOG_TOMBSTONE_DAYS, a client that hasn't synced since the ones it missed were
+# dropped gets a full copy instead of a delta
+CATALOG_TOMBSTONE_DAYS = float(os.getenv("LIBRARY_CATALOG_TOMBSTONE_DAYS", "30"))
+
+# name in the response -> model, columns sent; books reference the others by id, clients join them
+SYNC_TABLES = {
+    "books": (modelTables.Book, ("id", "title", "author", "publisher", "category", "copies", "version")),
+    "authors": (modelTables.Author, ("id", "name", "version")),
+    "publishers": (modelTables.Publisher, ("id", "name", "version")),
+    "categories": (modelTables.Category, ("id", "name", "version")),
+}
+
+
+# tombstone for a deleted catalog row, `table_name` is its name in SYNC_TABLES; the caller commits
+async def record_delete(db: AsyncSession, table_name: str, row_id):
+    await db.execute(insert(modelTables.CatalogTombstone).values(table_name=table_name, row_id=int(row_id)))
+
+
+# the newest committed version and the newest pruned tombstone version
+async def read_clock(db: AsyncSession):
+    clock = modelTables.VersionClock
+    return (await db.execute(select(clock.version, clock.pruned_through).where(clock.id == modelTables.CLOCK_ID))).one()
+
+
+# rows written and deleted after `since`, one indexed range query per table
+async def catalog_changes(db: AsyncSession, since: int = 0):
+    # read first: every write up to this version has committed, a write committing while the tables are read may
+    # show up now and again next time, clients apply rows as upserts
+    version, pruned_through = await read_clock(db)
+    # a client behind the pruned tombstones, or ahead of this database (restored from a backup), starts over
+    full = not since or since < pruned_through or since > version
+    changes = {"version": version, "full": full}
+    for name, (model, columns) in SYNC_TABLES.items():
+        query = select(*(getattr(model, column) for column in columns)).order_by(model.id)
+        if not full:
+            # rows from before versions existed have none, a full copy has them
+            query = query.where(model.version > since)
+        changes[name] = [row._asdict() for row in (await db.execute(query)).all()]
+
+    deleted = {name: [] for name in SYNC_TABLES}
+    if not full:
+        tombstones = modelTables.CatalogTombstone
+        for row in (await db.execute(
+            select(tombstones.table_name, tombstones.row_id).where(tombstones.version > since).order_by(tombstones.id)
+        )).all():
+            deleted[row.table_name].append(row.row_id)
+    changes["deleted"] = deleted
+    return changes
+
+
+# drop tombstones older than `days` (and ones from before they were dated), returns how many; the caller commits
+# everything up to the newest old version goes, so what is left is a suffix of the history and `pruned_through`
+# tells clients whether they missed any of it
+# the clock is taken first, so no commit stamps tombstones while they are deleted, and only committed (stamped)
+# tombstones are touched, so this never waits on a transaction that will want the clock
+async def prune_tombstones(db: AsyncSession, days: float = CATALOG_TOMBSTONE_DAYS):
+    tombstones = modelTables.CatalogTombstone
+    cutoff = datetime.now() - timedelta(days=days)
+    newest_old = await db.scalar(select(func.max(tombstones.version)).where(
+        tombstones.version > 0, (tombstones.deleted_at < cutoff) | (tombstones.deleted_at.is_(None))
+    ))
+    if newest_old is None:
+        return 0
+    clock = modelTables.VersionClock
+    await db.execute(update(clock).where(clock.id == modelTables.CLOCK_ID)
+                     .values(pruned_through=case((clock.pruned_through < newest_old, newest_old), else_=clock.pruned_through)))
+    result = await db.execute(delete(tombstones).where(tombstones.version > 0, tombstones.version <= newest_old),
+                              execution_options={"synchronize_session": False})
+    return result.rowcount
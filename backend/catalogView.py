@@ -0,0 +1,302 @@
+import heapq
+import os
+import time
+from bisect import bisect_left, bisect_right, insort
+from threading import Lock
+from types import SimpleNamespace
+from sqlalchemy import select, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+import modelTables
+from catalogSync import read_clock
+from changeFeed import change_feed
+from searchIndex import SearchIndex
+
+# how stale the read model may get with writes from other workers (or catalogIngest.py): a read at least this long
+# after the last check reads the version clock, and when it moved, the rows written since, see CatalogView._revalidate
+CATALOG_VIEW_REVALIDATE_SECONDS = float(os.getenv("LIBRARY_CATALOG_VIEW_REVALIDATE_SECONDS", "1"))
+
+
+# joined query that denormalizes books with their author, publisher and category names in one round trip
+def catalog_query():
+    return (
+        select(
+            modelTables.Book.id,
+            modelTables.Book.title,
+            modelTables.Book.author.label("author_id"),
+            modelTables.Book.publisher.label("publisher_id"),
+            modelTables.Book.category.label("category_id"),
+            modelTables.Author.name.label("author"),
+            modelTables.Publisher.name.label("publisher"),
+            modelTables.Category.name.label("category"),
+            modelTables.Book.copies,
+        )
+        .outerjoin(modelTables.Author, modelTables.Author.id == modelTables.Book.author)
+        .outerjoin(modelTables.Publisher, modelTables.Publisher.id == modelTables.Book.publisher)
+        .outerjoin(modelTables.Category, modelTables.Category.id == modelTables.Book.category)
+        .order_by(modelTables.Book.id)
+    )
+
+
+# books written after `version`, or whose author, publisher or category was
+def changed_since(version: int):
+    return or_(*(model.version > version for model in (
+        modelTables.Book, modelTables.Author, modelTables.Publisher, modelTables.Category)))
+
+
+# tombstone table name -> the book field it names
+DELETED_REFS = {"authors": "author", "publishers": "publisher", "categories": "category"}
+
+
+def row_to_details(row):
+    return {
+        "id": row.id,
+        "title": row.title,
+        "author": row.author,
+        "publisher": row.publisher,
+        "category": row.category,
+        "copies": row.copies,
+    }
+
+
+def new_search_index():
+    return SearchIndex(text_fields=("title", "author", "publisher"), keyword_fields=("category",))
+
+
+# fields of a fuzzy search and the weight of a match in each, a title match ranks above an equally good author match
+FUZZY_SEARCH_FIELDS = {"title": 1.0, "author": 0.9, "publisher": 0.8}
+
+
+def refs_of(row):
+    return {"author": row.author_id, "publisher": row.publisher_id, "category": row.category_id}
+
+
+# in-process read model of the catalog together with its search index
+# it is loaded lazily with catalog_query and then kept in sync by this worker's write endpoints right away, and with
+# everyone else's writes through the version clock at most CATALOG_VIEW_REVALIDATE_SECONDS later
+# every book change it is told about is also published on the change feed
+class CatalogView:
+    def __init__(self):
+        self._lock = Lock()
+        self._generation = 0
+        self._books = None   # book id -> book details
+        self._ids = []       # ids of self._books, sorted
+        self._refs = {}      # book id -> {"author": id, "publisher": id, "category": id}
+        self._index = new_search_index()
+        self._version = 0    # version clock value every write up to which is in the view
+        self._checked_at = 0.0
+
+    async def _ensure_loaded(self, db: AsyncSession):
+        books = self._books
+        if books is not None:
+            if time.monotonic() - self._checked_at < CATALOG_VIEW_REVALIDATE_SECONDS:
+                return books
+            await self._revalidate(db)
+            books = self._books
+            if books is not None:
+                return books
+
+        generation = self._generation
+        checked_at = time.monotonic()
+        # read first, rows written while loading may be applied again by the next check
+        version, _ = await read_clock(db)
+        books, refs, index = {}, {}, new_search_index()
+        for row in (await db.execute(catalog_query())).all():
+            books[row.id] = row_to_details(row)
+            refs[row.id] = refs_of(row)
+            index.add(row.id, books[row.id])
+
+        with self._lock:
+            # a write invalidated the view while we were loading, serve the rows but don't keep them
+            if generation == self._generation:
+                self._books, self._ids, self._refs, self._index = books, list(books), refs, index
+                self._version, self._checked_at = version, checked_at
+        return books
+
+    # apply the catalog writes committed since the view's version: changed books (and the books of renamed authors,
+    # publishers and categories) are re-read, deleted ones dropped; a view that missed pruned tombstones, or is
+    # ahead of the database (restored from a backup), is reloaded instead
+    # a row this worker wrote meanwhile can be overwritten with an older read, the next check puts it right
+    async def _revalidate(self, db: AsyncSession):
+        # claimed before the queries, so concurrent reads keep serving the view instead of checking too
+        self._checked_at = time.monotonic()
+        since = self._version
+        version, pruned_through = await read_clock(db)
+        if version == since:
+            return
+        if since < pruned_through or version < since:
+            self.invalidate()
+            return
+
+        rows = (await db.execute(catalog_query().where(changed_since(since)))).all()
+        tombstones = modelTables.CatalogTombstone
+        deleted = (await db.execute(
+            select(tombstones.table_name, tombstones.row_id).where(tombstones.version > since).order_by(tombstones.id)
+        )).all()
+        for row in rows:
+            # rows this worker already has, like its own writes, aren't published again
+            if self._books is not None and self._books.get(row.id) == row_to_details(row) and self._refs.get(row.id) == refs_of(row):
+                continue
+            self._store(row.id, row)
+        for table_name, row_id in deleted:
+            if table_name == "books":
+                if self._books is not None and row_id in self._books:
+                    self.remove_book(row_id)
+            elif table_name in DELETED_REFS:
+                self.rename(DELETED_REFS[table_name], row_id, None)
+        with self._lock:
+            self._version = max(self._version, version)
+
+    # all books with author, publisher and category names
+    async def get_all(self, db: AsyncSession):
+        books = await self._ensure_loaded(db)
+        with self._lock:
+            return [books[book_id] for book_id in self._ids_of(books)]
+
+    # keyset page of book details ordered by id
+    async def page(self, db: AsyncSession, after=None, limit=None):
+        books = await self._ensure_loaded(db)
+        with self._lock:
+            book_ids = self._ids_of(books)
+            start = bisect_right(book_ids, after) if after is not None else 0
+            end = start + limit if limit is not None else len(book_ids)
+            return [books[book_id] for book_id in book_ids[start:end]]
+
+    # single book details, None if it doesn't exist
+    async def get(self, db: AsyncSession, book_id):
+        try:
+            book_id = int(book_id)
+        except (TypeError, ValueError):
+            return None
+        return (await self._ensure_loaded(db)).get(book_id)
+
+    # sorted ids of `books`, called with the lock held
+    def _ids_of(self, books):
+        if books is self._books:
+            return self._ids
+        # the view was invalidated while this read was loading or serving it
+        return sorted(books)
+
+    # search index over `books`, called with the lock held
+    def _index_of(self, books):
+        if books is self._books:
+            return self._index
+        # the view was invalidated while loading, search the loaded rows directly
+        index = new_search_index()
+        for book_id, book in books.items():
+            index.add(book_id, book)
+        return index
+
+    # books matching every (or with match_all=False, any) of the substring filters, e.g. {"title": "harry"}
+    async def search(self, db: AsyncSession, filters: dict, match_all: bool = True, category=None):
+        books = await self._ensure_loaded(db)
+        with self._lock:
+            index = self._index_of(books)
+            matches = [index.search(field, query) for field, query in filters.items()]
+            if matches:
+                book_ids = set.intersection(*matches) if match_all else set.union(*matches)
+            else:
+                book_ids = set(books)
+            if category is not None:
+                book_ids &= index.lookup("category", category)
+
+            return [books[book_id] for book_id in sorted(book_ids)]
+
+    # the `limit` books whose title, author or publisher is most similar to `query`, typos included, best first
+    # each with its "score"; a book scores its best field, see SearchIndex.similar for the candidates and scores
+    async def fuzzy_search(self, db: AsyncSession, query: str, limit: int):
+        books = await self._ensure_loaded(db)
+        with self._lock:
+            index = self._index_of(books)
+            scores = {}
+            for field, weight in FUZZY_SEARCH_FIELDS.items():
+                # a book has one value per field, so the best `limit` books of a field are among its best `limit`
+                # values and only those are expanded to books
+                similar = index.similar(field, query)
+                for value, score in heapq.nlargest(limit, similar.items(), key=lambda item: item[1]):
+                    score *= weight
+                    for book_id in index.lookup(field, value):
+                        if score > scores.get(book_id, 0):
+                            scores[book_id] = score
+            # ties go to the lower id, so equal scores come back in a stable order
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+            return [{**books[book_id], "score": round(score, 3)} for book_id, score in best]
+
+    # re-read one book after it was added, updated or its copies changed
+    # (skipped while the view isn't loaded, unless change feed subscribers are waiting for the book)
+    async def refresh_book(self, db: AsyncSession, book_id):
+        if self._books is None and not change_feed.listening:
+            return
+        row = (await db.execute(catalog_query().where(modelTables.Book.id == book_id))).first()
+        self._store(book_id, row)
+
+    # refresh_book for a set of books, in one query
+    async def refresh_books(self, db: AsyncSession, book_ids):
+        if self._books is None and not change_feed.listening:
+            return
+        rows = {row.id: row for row in (await db.execute(catalog_query().where(modelTables.Book.id.in_(book_ids)))).all()}
+        for book_id in book_ids:
+            self._store(book_id, rows.get(book_id))
+
+    # a book the caller just wrote (its Book column values) with the names it resolved, so the view is updated
+    # without a query
+    def put_book(self, book_id, book: dict, author, publisher, category):
+        self._store(book_id, SimpleNamespace(
+            id=book_id, title=book["title"], copies=book["copies"],
+            author_id=book["author"], publisher_id=book["publisher"], category_id=book["category"],
+            author=author, publisher=publisher, category=category,
+        ))
+
+    def _store(self, book_id, row):
+        if row is None:
+            self.remove_book(book_id)
+            return
+        details = row_to_details(row)
+        with self._lock:
+            self._generation += 1
+            if self._books is not None:
+                if row.id not in self._books:
+                    insort(self._ids, row.id)
+                self._books[row.id] = details
+                self._refs[row.id] = refs_of(row)
+                self._index.add(row.id, details)
+        change_feed.publish("book", details, row.id, row.category_id)
+
+    def remove_book(self, book_id):
+        book_id = int(book_id)
+        with self._lock:
+            self._generation += 1
+            refs = self._refs.pop(book_id, None)
+            if self._books is not None and self._books.pop(book_id, None) is not None:
+                del self._ids[bisect_left(self._ids, book_id)]
+                self._index.remove(book_id)
+        change_feed.publish("book_removed", {"id": book_id}, book_id, refs["category"] if refs else None)
+
+    # category id of a book, None when the view isn't loaded
+    def category_of(self, book_id):
+        refs = self._refs.get(book_id)
+        return refs["category"] if refs else None
+
+    # author/publisher/category renamed (or deleted when name is None)
+    def rename(self, ref: str, ref_id, name):
+        with self._lock:
+            self._generation += 1
+            if self._books is None:
+                return
+            ref_id = int(ref_id)
+            for book_id, refs in self._refs.items():
+                if refs[ref] == ref_id:
+                    self._books[book_id] = {**self._books[book_id], ref: name}
+                    self._index.add(book_id, self._books[book_id])
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._books = None
+            self._ids = []
+            self._refs = {}
+            self._index = new_search_index()
+            self._version = 0
+        change_feed.resync()
+
+
+catalog_view = CatalogView()
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import os
+import uuid
+from collections import deque
+from fastapi.encoders import jsonable_encoder
+
+# in-process change feed served as Server-Sent Events on /changes/stream, so clients apply small deltas
+# instead of refetching the catalog after every checkout or return
+# events:
+#   book          a book's details after its copies (or anything else) changed, see CatalogView._store
+#   book_removed  {"id": book_id}
+#   issue         {"id", "book_id", "user_id", "status"} after an issue record changed status or ("deleted") was removed
+#   resync        the catalog was reloaded (bulk ingest) or the stream can't resume, refetch
+# events live in this process, so a client sees the writes handled by the worker it is connected to
+
+# events buffered per subscriber; a subscriber that falls this far behind is disconnected and resumes from the history
+CHANGE_FEED_QUEUE_SIZE = int(os.getenv("LIBRARY_CHANGE_FEED_QUEUE_SIZE", "256"))
+# recent events kept for clients reconnecting with Last-Event-ID
+CHANGE_FEED_HISTORY = int(os.getenv("LIBRARY_CHANGE_FEED_HISTORY", "1024"))
+CHANGE_FEED_HEARTBEAT_SECONDS = float(os.getenv("LIBRARY_CHANGE_FEED_HEARTBEAT_SECONDS", "15"))
+CHANGE_FEED_MAX_SUBSCRIBERS = int(os.getenv("LIBRARY_CHANGE_FEED_MAX_SUBSCRIBERS", "1000"))
+# EventSource reconnect delay sent to clients, in milliseconds
+CHANGE_FEED_RETRY_MS = 3000
+
+# event ids carry the process id, an id from another worker or an earlier run can't be resumed
+_BOOT_ID = uuid.uuid4().hex[:8]
+
+
+class ChangeEvent:
+    __slots__ = ("sequence", "kind", "book_id", "category_id", "frame")
+
+    def __init__(self, sequence: int, kind: str, data: dict, book_id=None, category_id=None):
+        self.sequence = sequence
+        self.kind = kind
+        self.book_id = book_id
+        self.category_id = category_id
+        # serialized once however many subscribers get it
+        self.frame = f"id: {_BOOT_ID}-{sequence}\nevent: {kind}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+class Subscription:
+    def __init__(self, book_id=None, category_id=None):
+        self.book_id = book_id
+        self.category_id = category_id
+        self.queue = asyncio.Queue(CHANGE_FEED_QUEUE_SIZE)
+        self.overflowed = False
+
+    # resync events go to everyone, the others by book or category when the subscription asks for one
+    def wants(self, event: ChangeEvent):
+        if event.kind == "resync":
+            return True
+        if self.book_id is not None:
+            return event.book_id == self.book_id
+        if self.category_id is not None:
+            return event.category_id == self.category_id
+        return True
+
+    def offer(self, event: ChangeEvent):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+# publish is called by the write handlers on the event loop after they commit and never waits on a subscriber
+class ChangeFeed:
+    def __init__(self):
+        self._subscriptions = set()
+        self._history = deque(maxlen=CHANGE_FEED_HISTORY)
+        self._sequence = 0
+        self.published = 0
+        self.overflowed = 0
+
+    @property
+    def listening(self):
+        return bool(self._subscriptions)
+
+    @property
+    def full(self):
+        return len(self._subscriptions) >= CHANGE_FEED_MAX_SUBSCRIBERS
+
+    def publish(self, kind: str, data: dict, book_id=None, category_id=None):
+        self._sequence += 1
+        event = ChangeEvent(self._sequence, kind, data, book_id, category_id)
+        self._history.append(event)
+        self.published += 1
+        for subscription in self._subscriptions:
+            if subscription.wants(event):
+                subscription.offer(event)
+
+    def resync(self):
+        self.publish("resync", {})
+
+    # events after `last_event_id`, None when they are no longer (or never were) in this process's history
+    def _since(self, last_event_id: str):
+        boot_id, _, sequence = last_event_id.partition("-")
+        if boot_id != _BOOT_ID or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+        if sequence >= self._sequence:
+            return []
+        if not self._history or self._history[0].sequence > sequence + 1:
+            return None
+        return [event for event in self._history if event.sequence > sequence]
+
+    # SSE frames for one client until it disconnects, or falls behind and is sent away to reconnect
+    async def stream(self, book_id=None, category_id=None, last_event_id=None):
+        subscription = Subscription(book_id, category_id)
+        # subscribing and reading the history happen without awaiting in between, so nothing is missed or repeated
+        self._subscriptions.add(subscription)
+        backlog = self._since(last_event_id) if last_event_id else []
+        resync = ChangeEvent(self._sequence, "resync", {}) if backlog is None else None
+        try:
+            yield f"retry: {CHANGE_FEED_RETRY_MS}\n\n"
+            if resync is not None:
+                yield resync.frame
+            for event in backlog or ():
+                if subscription.wants(event):
+                    yield event.frame
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), CHANGE_FEED_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield event.frame
+                if subscription.overflowed and subscription.queue.empty():
+                    self.overflowed += 1
+                    return
+        finally:
+            self._subscriptions.discard(subscription)
+
+    def stats(self):
+        return {
+            "subscribers": len(self._subscriptions),
+            "published": self.published,
+            "overflowed": self.overflowed,
+            "history": len(self._history),
+        }
+
+
+change_feed = ChangeFeed()
@@ -0,0 +1,288 @@
+import os
+from collections import Counter
+from datetime import datetime
+from fastapi import HTTPException
+from sqlalchemy import select, insert, update, delete, case, func
+from sqlalchemy.ext.asyncio import AsyncSession
+import modelTables
+
+# circulation engine
+# every inventory change is a single conditional UPDATE whose rowcount is checked, so concurrent desks
+# can't oversell copies or return the same loan twice; callers commit (or roll back) the whole operation
+# rows are locked in one order so concurrent operations don't deadlock: the existing issue record (approve, return,
+# delete), then the book, then the user; a check out has no record yet and inserts it after locking the book and the
+# user; the book's copies are versioned, so every one of these also takes the version_clock row last, when it
+# commits (see modelTables.py)
+
+
+async def _rowcount(db: AsyncSession, statement):
+    result = await db.execute(statement.execution_options(synchronize_session=False))
+    return result.rowcount
+
+
+# take one copy of a book, False when there is none left
+async def take_copy(db: AsyncSession, book_id):
+    return await _rowcount(db, update(modelTables.Book)
+        .where(modelTables.Book.id == book_id, modelTables.Book.copies > 0)
+        .values(copies=modelTables.Book.copies - 1)) == 1
+
+
+async def put_back_copy(db: AsyncSession, book_id):
+    return await _rowcount(db, update(modelTables.Book)
+        .where(modelTables.Book.id == book_id)
+        .values(copies=modelTables.Book.copies + 1)) == 1
+
+
+# flag the user as having a book, False when it already has one
+async def mark_user_issued(db: AsyncSession, user_id):
+    return await _rowcount(db, update(modelTables.User)
+        .where(modelTables.User.id == user_id, modelTables.User.has_issued == False)
+        .values(has_issued=True)) == 1
+
+
+async def clear_user_issued(db: AsyncSession, user_id):
+    await _rowcount(db, update(modelTables.User)
+        .where(modelTables.User.id == user_id)
+        .values(has_issued=False))
+
+
+# move an issue record from one status to another, False when it wasn't in `from_status`
+async def transition(db: AsyncSession, bookIssue_id, from_status: str, values: dict):
+    return await _rowcount(db, update(modelTables.BookIssueRecord)
+        .where(modelTables.BookIssueRecord.id == bookIssue_id, modelTables.BookIssueRecord.issue_status == from_status)
+        .values(values)) == 1
+
+
+# the user already has an open (pending or issued) request for this book
+async def has_open_issue(db: AsyncSession, book_id, user_id):
+    open_issue = await db.scalar(select(modelTables.BookIssueRecord.id).where(
+        modelTables.BookIssueRecord.book_id == book_id,
+        modelTables.BookIssueRecord.user_id == user_id,
+        modelTables.BookIssueRecord.issue_status.in_(("pending", "issued")),
+    ).limit(1))
+    return open_issue is not None
+
+
+# issue a book to a user: one copy taken and the user flagged, or nothing changes
+# the lookups only run to explain a failed update
+async def check_out(db: AsyncSession, book_id, user_id):
+    if not await take_copy(db, book_id):
+        await db.rollback()
+        if await db.get(modelTables.Book, book_id) is None:
+            raise HTTPException(status_code=404, detail="Book for issue not found!")
+        raise HTTPException(status_code=400, detail="This book is not available to issue!")
+    if not await mark_user_issued(db, user_id):
+        await db.rollback()
+        if await db.get(modelTables.User, user_id) is None:
+            raise HTTPException(status_code=404, detail="User for issue not found!")
+        raise HTTPException(status_code=400, detail="User is not valid to issue book!")
+
+
+# checks for a request that waits for a librarian, nothing is reserved yet
+async def check_can_request(db: AsyncSession, book_id, user_id):
+    book = await db.get(modelTables.Book, book_id)
+    if book is None:
+        raise HTTPException(status_code=404, detail="Book for issue not found!")
+    elif book.copies == 0:
+        raise HTTPException(status_code=400, detail="This book is not available to issue!")
+
+    user = await db.get(modelTables.User, user_id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User for issue not found!")
+    elif user.has_issued:
+        raise HTTPException(status_code=400, detail="User is not valid to issue book!")
+
+
+# approve a pending request, returns False if the record isn't pending anymore
+async def approve_pending(db: AsyncSession, bookIssue: modelTables.BookIssueRecord, librarian_id):
+    if not await transition(db, bookIssue.id, "pending", {"issue_status": "issued", "issued_by": librarian_id}):
+        return False
+    if not await take_copy(db, bookIssue.book_id):
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Book not available")
+    if not await mark_user_issued(db, bookIssue.user_id):
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="user is not eligible to issue book!")
+    return True
+
+
+# return an issued book; a pending request is just closed since no copy was taken
+async def check_in(db: AsyncSession, bookIssue: modelTables.BookIssueRecord):
+    if await transition(db, bookIssue.id, "issued", {"issue_status": "returned"}):
+        await put_back_copy(db, bookIssue.book_id)
+        await clear_user_issued(db, bookIssue.user_id)
+        return True
+    if await transition(db, bookIssue.id, "pending", {"issue_status": "returned"}):
+        return False
+    raise HTTPException(status_code=400, detail="Book has already been returned")
+
+
+# delete an issue record, putting the copy back if it was still out
+async def discard(db: AsyncSession, bookIssue: modelTables.BookIssueRecord):
+    was_issued = await _rowcount(db, delete(modelTables.BookIssueRecord).where(
+        modelTables.BookIssueRecord.id == bookIssue.id,
+        modelTables.BookIssueRecord.issue_status == "issued",
+    )) == 1
+    if was_issued:
+        await put_back_copy(db, bookIssue.book_id)
+        await clear_user_issued(db, bookIssue.user_id)
+    else:
+        await _rowcount(db, delete(modelTables.BookIssueRecord).where(modelTables.BookIssueRecord.id == bookIssue.id))
+    return was_issued
+
+
+# batch circulation for desk scanning
+# a whole stack is one transaction: the books, users and open issues involved are read with one query each,
+# the items are checked in memory in order (so two items can't take the same last copy) and the accepted ones
+# are written with one set-based UPDATE per table; those UPDATEs carry the same guards as the single item path,
+# so when another desk changed a row in between their rowcount comes up short and the batch is planned again
+CIRCULATION_BATCH_SIZE = int(os.getenv("LIBRARY_CIRCULATION_BATCH_SIZE", "100"))
+BATCH_ATTEMPTS = 3
+OPEN_STATUSES = ("pending", "issued")
+
+
+class BatchConflict(Exception):
+    pass
+
+
+def _rejected(item: dict, status_code: int, detail: str):
+    return {**item, "status": "rejected", "status_code": status_code, "detail": detail}
+
+
+async def _retrying(db: AsyncSession, attempt):
+    for _ in range(BATCH_ATTEMPTS):
+        try:
+            return await attempt()
+        except BatchConflict:
+            await db.rollback()
+    raise HTTPException(status_code=409, detail="Books or users changed while the batch was applied, try again")
+
+
+# new issue records with their ids, through RETURNING where the dialect can return ids from a multi-row insert
+# every user gets one new record, so ids are matched up by user: RETURNING in parameter order would cost one
+# INSERT per row on sqlite
+async def _insert_issue_records(db: AsyncSession, rows: list):
+    records = modelTables.BookIssueRecord
+    if db.bind.dialect.insert_executemany_returning:
+        new_ids = dict((await db.execute(insert(records).returning(records.user_id, records.id), rows)).all())
+    else:
+        await db.execute(insert(records), rows)
+        # the users' rows are locked by the has_issued UPDATE, so each user's newest issued record is the one just added
+        new_ids = dict((await db.execute(select(records.user_id, func.max(records.id)).where(
+            records.user_id.in_([row["user_id"] for row in rows]),
+            records.issue_status == "issued",
+        ).group_by(records.user_id))).all())
+    return [new_ids[row["user_id"]] for row in rows]
+
+
+# issue a list of {"book_id", "user_id"} items, returns one result per item in the same order
+async def check_out_many(db: AsyncSession, items: list, librarian_id):
+    async def attempt():
+        book_ids = {item["book_id"] for item in items}
+        user_ids = {item["user_id"] for item in items}
+        copies = dict((await db.execute(
+            select(modelTables.Book.id, modelTables.Book.copies).where(modelTables.Book.id.in_(book_ids))
+        )).all())
+        has_issued = dict((await db.execute(
+            select(modelTables.User.id, modelTables.User.has_issued).where(modelTables.User.id.in_(user_ids))
+        )).all())
+        open_issues = set((await db.execute(select(modelTables.BookIssueRecord.book_id, modelTables.BookIssueRecord.user_id).where(
+            modelTables.BookIssueRecord.user_id.in_(user_ids),
+            modelTables.BookIssueRecord.issue_status.in_(OPEN_STATUSES),
+        ))).all())
+
+        # same checks, in the same order, as the single item path
+        results, taken = [], Counter()
+        for item in items:
+            book_id, user_id = item["book_id"], item["user_id"]
+            if (book_id, user_id) in open_issues:
+                results.append(_rejected(item, 400, "User has already requested to issue this book!"))
+            elif book_id not in copies:
+                results.append(_rejected(item, 404, "Book for issue not found!"))
+            elif (copies[book_id] or 0) - taken[book_id] <= 0:
+                results.append(_rejected(item, 400, "This book is not available to issue!"))
+            elif user_id not in has_issued:
+                results.append(_rejected(item, 404, "User for issue not found!"))
+            elif has_issued[user_id]:
+                results.append(_rejected(item, 400, "User is not valid to issue book!"))
+            else:
+                results.append({**item, "status": "issued"})
+                taken[book_id] += 1
+                has_issued[user_id] = True
+                open_issues.add((book_id, user_id))
+
+        accepted = [result for result in results if result["status"] == "issued"]
+        if not accepted:
+            return results
+
+        taken_copies = case(dict(taken), value=modelTables.Book.id)
+        if await _rowcount(db, update(modelTables.Book)
+                .where(modelTables.Book.id.in_(taken), modelTables.Book.copies >= taken_copies)
+                .values(copies=modelTables.Book.copies - taken_copies)) != len(taken):
+            raise BatchConflict()
+        if await _rowcount(db, update(modelTables.User)
+                .where(modelTables.User.id.in_([result["user_id"] for result in accepted]), modelTables.User.has_issued == False)
+                .values(has_issued=True)) != len(accepted):
+            raise BatchConflict()
+
+        issue_time = datetime.now()
+        issue_ids = await _insert_issue_records(db, [{
+            "book_id": result["book_id"],
+            "user_id": result["user_id"],
+            "issued_by": librarian_id,
+            "issue_time": issue_time,
+            "issue_status": "issued",
+        } for result in accepted])
+        for result, issue_id in zip(accepted, issue_ids):
+            result["issue_id"] = issue_id
+        return results
+
+    return await _retrying(db, attempt)
+
+
+# return (or, for pending requests, close) a list of issue records, one result per id in the same order
+async def check_in_many(db: AsyncSession, issue_ids: list):
+    async def attempt():
+        records = {record.id: record for record in (await db.execute(select(
+            modelTables.BookIssueRecord.id,
+            modelTables.BookIssueRecord.book_id,
+            modelTables.BookIssueRecord.user_id,
+            modelTables.BookIssueRecord.issue_status,
+        ).where(modelTables.BookIssueRecord.id.in_(issue_ids)))).all()}
+
+        results, seen, put_back, returned_ids, closed_ids, user_ids = [], set(), Counter(), [], [], set()
+        for issue_id in issue_ids:
+            record = records.get(issue_id)
+            if record is None:
+                results.append(_rejected({"issue_id": issue_id}, 404, "book issues not found!"))
+            elif issue_id in seen or record.issue_status not in OPEN_STATUSES:
+                results.append(_rejected({"issue_id": issue_id}, 400, "Book has already been returned"))
+            elif record.issue_status == "issued":
+                results.append({"issue_id": issue_id, "book_id": record.book_id, "user_id": record.user_id, "status": "returned"})
+                put_back[record.book_id] += 1
+                returned_ids.append(issue_id)
+                user_ids.add(record.user_id)
+            else:
+                # a pending request never took a copy, it is only closed
+                results.append({"issue_id": issue_id, "book_id": record.book_id, "user_id": record.user_id, "status": "closed"})
+                closed_ids.append(issue_id)
+            seen.add(issue_id)
+
+        # returned and closed records in one UPDATE, each guarded by the status it was read with
+        read_status = {**{issue_id: "issued" for issue_id in returned_ids}, **{issue_id: "pending" for issue_id in closed_ids}}
+        if read_status and await _rowcount(db, update(modelTables.BookIssueRecord)
+                .where(modelTables.BookIssueRecord.id.in_(read_status),
+                       modelTables.BookIssueRecord.issue_status == case(read_status, value=modelTables.BookIssueRecord.id))
+                .values(issue_status="returned")) != len(read_status):
+            raise BatchConflict()
+        if put_back:
+            returned_copies = case(dict(put_back), value=modelTables.Book.id)
+            await _rowcount(db, update(modelTables.Book)
+                .where(modelTables.Book.id.in_(put_back))
+                .values(copies=modelTables.Book.copies + returned_copies))
+            await _rowcount(db, update(modelTables.User)
+                .where(modelTables.User.id.in_(user_ids))
+                .values(has_issued=False))
+        return results
+
+    return await _retrying(db, attempt)
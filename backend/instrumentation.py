@@ -0,0 +1,201 @@
+import logging
+import os
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from threading import Lock
+from sqlalchemy import event
+from queryBudget import check_route_budget
+
+# per-request SQL instrumentation
+# engine events add every statement to the stats of the request that ran it (tracked in a context variable),
+# the middleware then records them per route and serves everything on /metrics in Prometheus text format
+
+# adds a Server-Timing header with the handler and DB time to every response
+SERVER_TIMING = os.getenv("LIBRARY_SERVER_TIMING", "false").lower() in ("1", "true", "yes")
+# requests slower than this are logged together with their SQL, 0 turns the log off
+SLOW_REQUEST_MS = float(os.getenv("LIBRARY_SLOW_REQUEST_MS", "500"))
+# statements kept per request for the slow request log
+SLOW_REQUEST_MAX_STATEMENTS = 50
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000)
+
+slow_request_log = logging.getLogger("library.slow_requests")
+
+
+class RequestStats:
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+        # rows as reported by the driver's rowcount, sqlite only reports it for writes
+        self.rows = 0
+        self.sql = []
+
+    def add(self, statement: str, seconds: float, rowcount: int):
+        self.statements += 1
+        self.db_seconds += seconds
+        if rowcount > 0:
+            self.rows += rowcount
+        if SLOW_REQUEST_MS and len(self.sql) < SLOW_REQUEST_MAX_STATEMENTS:
+            self.sql.append(f"{seconds * 1000:.1f}ms {statement}")
+
+
+_current_request: ContextVar[RequestStats | None] = ContextVar("library_request_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info["query_started"].pop()
+    stats = _current_request.get()
+    if stats is not None:
+        stats.add(statement, seconds, cursor.rowcount)
+
+
+# a failed statement never reaches after_cursor_execute, drop its start time
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started"):
+        connection.info["query_started"].pop()
+
+
+def instrument_engine(engine):
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._lock = Lock()
+        self._series = {}   # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, labels: tuple, value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self, label_names):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labels, values in sorted(series.items()):
+            label_text = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {values[-1]}")
+            lines.append(f"{self.name}_count{{{label_text}}} {cumulative}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+ROUTE_LABELS = ("method", "route", "status")
+
+request_duration = Histogram("library_http_request_duration_seconds", "Handler latency per route", LATENCY_BUCKETS)
+request_statements = Histogram("library_db_statements_per_request", "SQL statements executed per request", COUNT_BUCKETS)
+request_db_time = Histogram("library_db_time_per_request_seconds", "Time spent in SQL per request", LATENCY_BUCKETS)
+request_rows = Histogram("library_db_rows_per_request", "Rows reported by the driver per request", COUNT_BUCKETS)
+
+
+# pure ASGI middleware, so streamed bodies run inside the request's context and their queries are counted too
+class RequestMetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if SERVER_TIMING:
+                    elapsed = time.perf_counter() - started
+                    timing = f"app;dur={elapsed * 1000:.1f}, db;dur={stats.db_seconds * 1000:.1f};desc=\"{stats.statements} queries\""
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_request.reset(token)
+            self._record(scope, stats, time.perf_counter() - started, status_code)
+
+    def _record(self, scope, stats: RequestStats, seconds: float, status_code: int):
+        labels = (scope["method"], _route_path(scope), str(status_code))
+        request_duration.observe(labels, seconds)
+        request_statements.observe(labels, stats.statements)
+        request_db_time.observe(labels, stats.db_seconds)
+        request_rows.observe(labels, stats.rows)
+        check_route_budget(labels[0], labels[1], stats.statements, stats.sql)
+
+        if SLOW_REQUEST_MS and seconds * 1000 >= SLOW_REQUEST_MS:
+            slow_request_log.warning(
+                "%s %s took %.0fms (db %.0fms, %d statements)\n%s",
+                scope["method"], scope["path"], seconds * 1000, stats.db_seconds * 1000, stats.statements,
+                "\n".join(stats.sql),
+            )
+
+
+# the route template of the request, so metrics and budgets don't grow a label per id
+# plain Starlette routes (the docs pages) don't set scope["route"], they have no path parameters
+def _route_path(scope):
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if "endpoint" in scope:
+        return scope["path"]
+    return "unmatched"
+
+
+def _pool_lines(pool):
+    metrics = getattr(pool, "metrics", None)
+    if metrics is None:
+        return []
+    name = "library_db_pool_checkout_wait_seconds"
+    lines = [f"# HELP {name} Time spent waiting for a pooled connection", f"# TYPE {name} histogram"]
+    for bound, count in metrics.histogram().items():
+        lines.append(f'{name}_bucket{{le="{bound}"}} {count}')
+    lines.append(f"{name}_sum {metrics.wait_seconds_total}")
+    lines.append(f"{name}_count {metrics.checkouts + metrics.timeouts}")
+    lines += [
+        "# HELP library_db_pool_checkout_timeouts_total Checkouts that gave up waiting for a connection",
+        "# TYPE library_db_pool_checkout_timeouts_total counter",
+        f"library_db_pool_checkout_timeouts_total {metrics.timeouts}",
+    ]
+    return lines
+
+
+def render_metrics(pool=None):
+    lines = []
+    for histogram in (request_duration, request_statements, request_db_time, request_rows):
+        lines += histogram.render(ROUTE_LABELS)
+    lines += _pool_lines(pool)
+    if pool is not None and hasattr(pool, "checkedout"):
+        lines += [
+            "# HELP library_db_pool_checked_out Connections currently checked out",
+            "# TYPE library_db_pool_checked_out gauge",
+            f"library_db_pool_checked_out {pool.checkedout()}",
+        ]
+    return "\n".join(lines) + "\n"
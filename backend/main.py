@@ -1,29 +1,54 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import APIRouter, FastAPI, HTTPException, Depends, Request, Response, UploadFile, Query, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from database import engine, SessionLocal
-from sqlalchemy.orm import Session
-from passlib.context import CryptContext
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager
+from database import engine, async_engine, replica_engines, AsyncSessionLocal
+from poolMetrics import pool_stats
+from instrumentation import RequestMetricsMiddleware, instrument_engine, render_metrics
+from sqlalchemy import select, update, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
+import asyncio
+import io
 from typing import Annotated
 import modelTables
-from model import UserBase, Librarian, Book, BookRequest, Category, Author, Publisher, BookIssueRequest, BookIssueRecord, BookSearch, Token
-
-# app instance
-app = FastAPI(title="Library Management System")
-
-modelTables.Base.metadata.create_all(bind=engine)
+import circulation
+import writes
+from catalogIngest import CatalogIngest, read_records, format_of, INGEST_CHUNK_SIZE, MAX_INGEST_CHUNK_SIZE
+from catalogSync import catalog_changes, record_delete
+from catalogExport import EXPORT_DATASETS, EXPORT_FORMATS, ExportStats, ParquetUnavailable, export_chunks, export_watermark, new_encoder
+from catalogView import catalog_view, catalog_query, row_to_details
+from changeFeed import change_feed
+from pagination import page_dependency, time_page_dependency, keyset, time_keyset, time_cursor, page_of, stream_ndjson
+from passwordHashing import hash_password, verify_and_update_password, hashing_stats
+from principalCache import principal_cache
+from sessions import Principal, session_registry
+from responseCache import response_cache
+import startup
+from archive import archiver, history_query, ARCHIVE_INTERVAL_SECONDS
+from readReplicas import read_routing, ReadYourWritesMiddleware, READ_YOUR_WRITES_HEADER
+from model import UserBase, Librarian, Book, BookRequest, Category, Author, Publisher, BookIssueRequest, BookIssueBatchRequest, BookReturnBatchRequest, BookIssueRecord, BookSearch, Token
+
+# endpoints are registered on the router, create_app below builds the app around it
+# importing this module doesn't touch the database, tables are created by `python schema.py`
+router = APIRouter()
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
 
-def get_db():
-    db = SessionLocal()
-    try:
+# read-only session for GET endpoints, bound to a replica when there are any, see readReplicas.py
+async def get_read_db(request: Request):
+    async with AsyncSessionLocal(bind=read_routing.engine_for(request)) as db:
         yield db
-    finally:
-        db.close()
 
 # database
-db_dependency = Annotated[Session, Depends(get_db)]
+# sessions don't expire objects on commit, so re-selects after bulk updates use populate_existing
+db_dependency = Annotated[AsyncSession, Depends(get_db)]
+read_db_dependency = Annotated[AsyncSession, Depends(get_read_db)]
 
 
 # JWT Configuration
@@ -31,39 +56,41 @@ SECRET_KEY = "9a8d3f94e2c1b0a7f6e5d4c3b2a19081"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 360
 
-# variables for authentication
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 # FastAPI OAuth2PasswordBearer for token authentication
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
 
-#middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins = ['*'],
-    allow_credentials = True,
-    allow_methods = ["*"],
-    allow_headers = ["*"],
-)
+# per-route query counts, DB time and latency, served on /metrics
+instrument_engine(async_engine)
+for replica_engine in replica_engines:
+    instrument_engine(replica_engine)
 
 
 
 
 # _______________________________________________________Authentication____________________________________________________
 # common functions for authentication
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# hashing runs on the password hashing pool, see passwordHashing.py
+async def verify_password(plain_password, hashed_password):
+    valid, _ = await verify_and_update_password(plain_password, hashed_password)
+    return valid
 
 
-def get_hashed_password(password):
-    return pwd_context.hash(password)
+async def get_hashed_password(password):
+    return await hash_password(password)
 
 
-def authenticate_user(db: Session, username:str, password:str):
-    user = db.query(modelTables.Librarian).filter(modelTables.Librarian.librarian_name == username).first()
-    if not user or not verify_password(password, user.password):
+# stored hashes that don't match the current hash policy are replaced, the caller commits
+async def authenticate_user(db: AsyncSession, username:str, password:str):
+    user = await db.scalar(select(modelTables.Librarian).where(modelTables.Librarian.librarian_name == username))
+    if not user:
+        return False
+    valid, new_hash = await verify_and_update_password(password, user.password)
+    if not valid:
         return False
+    if new_hash:
+        user.password = new_hash
     return user
 
 
@@ -76,25 +103,61 @@ def create_access_token(data: dict, expires_delta: timedelta):
     return encoded_jwt
 
 
-def get_current_active_librarian(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+# a token for a new session of `librarian`, the caller commits
+async def open_session(db: AsyncSession, librarian):
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    session_id = await session_registry.open(db, librarian.librarian_id, datetime.utcnow() + access_token_expires)
+    return create_access_token(
+        data={"sub": librarian.librarian_name, "lid": librarian.librarian_id, "sid": session_id},
+        expires_delta=access_token_expires,
+    )
+
+
+# the acting librarian, from the token claims, see sessions.py
+# verified tokens are served from principal_cache without touching the DB
+async def get_current_active_librarian(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     credential_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail= "Could not validate creadentials",
          headers={"WWW-Authenticate": "Bearer"},
     )
 
+    principal = principal_cache.get(token)
+    if principal is not None:
+        if principal.session_id is not None:
+            await session_registry.sync_revocations(db)
+            if session_registry.revoked_here(principal.session_id):
+                principal_cache.discard(token)
+                raise credential_exception
+        return principal
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credential_exception
-        
-        user = db.query(modelTables.Librarian).filter(modelTables.Librarian.librarian_name == username).first()
-        if user is None:
-            raise credential_exception
-        return user
     except JWTError:
         raise credential_exception
+    username: str = payload.get("sub")
+    librarian_id = payload.get("lid")
+    session_id = payload.get("sid")
+    if username is None:
+        raise credential_exception
+    if session_id is not None and await session_registry.is_revoked(db, session_id):
+        raise credential_exception
+    if librarian_id is None:
+        # tokens signed before sessions only carry the name
+        librarian_id = await db.scalar(select(modelTables.Librarian.librarian_id).where(modelTables.Librarian.librarian_name == username))
+        if librarian_id is None:
+            raise credential_exception
+
+    principal = Principal(librarian_id, username, session_id, payload.get("exp"))
+    principal_cache.put(token, principal, payload.get("exp"))
+    return principal
+
+
+# the acting librarian when the request carries a token, None for anonymous requests
+async def get_optional_librarian(token: str | None = Depends(optional_oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    if token is None:
+        return None
+    return await get_current_active_librarian(token, db)
 
 
 
@@ -103,13 +166,13 @@ def get_current_active_librarian(token: str = Depends(oauth2_scheme), db: Sessio
 # _______________________________________________________librarians____________________________________________________
 # login and generate jwt token
 # sign up librarian
-@app.post("/librarians/sign_up", response_model= Token, tags=["auth-librarian"])
-async def sign_up(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    existing_librarian = db.query(modelTables.Librarian).filter(modelTables.Librarian.librarian_name == form_data.username).first()
+@router.post("/librarians/sign_up", response_model= Token, tags=["auth-librarian"])
+async def sign_up(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    existing_librarian = await db.scalar(select(modelTables.Librarian).where(modelTables.Librarian.librarian_name == form_data.username))
     if existing_librarian:
         raise HTTPException(status_code=422, detail="Librarian already exists!")
     
-    hashed_password = get_hashed_password(form_data.password)
+    hashed_password = await get_hashed_password(form_data.password)
 
     new_librarian = modelTables.Librarian(
         librarian_name=form_data.username, 
@@ -118,21 +181,17 @@ async def sign_up(form_data: OAuth2PasswordRequestForm = Depends(), db: Session
         )
     
     db.add(new_librarian)
-    db.commit()
+    await db.flush()
+    access_token = await open_session(db, new_librarian)
+    await db.commit()
 
-    access_token_expires = timedelta(minutes = ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": new_librarian.librarian_name}, 
-        expires_delta=access_token_expires
-        )
-    
     return {"access_token": access_token, "token_type": "Bearer"}
 
 
 # sign in librarian
-@app.post("/token", response_model=Token, tags=["auth-librarian"])
-async def sign_in(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
+@router.post("/token", response_model=Token, tags=["auth-librarian"])
+async def sign_in(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = await authenticate_user(db, form_data.username, form_data.password)
 
     if not user:
         raise HTTPException(
@@ -141,43 +200,47 @@ async def sign_in(form_data: OAuth2PasswordRequestForm = Depends(), db: Session
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    db.query(modelTables.Librarian).filter(modelTables.Librarian.librarian_name == form_data.username).update({"active": True})
-    db.commit()
-
-     # Generate JWT token for the authenticated librarian
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(data={"sub": user.librarian_name}, expires_delta=access_token_expires)
+    # Generate JWT token for the authenticated librarian, committed together with a password rehash
+    access_token = await open_session(db, user)
+    await db.commit()
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 # get current librarian
-@app.get("/users/me", response_model=Librarian, status_code=status.HTTP_200_OK, tags=["auth-librarian"])
-async def read_users_me(current_librarian: Librarian = Depends(get_current_active_librarian)):
+@router.get("/users/me", response_model=Librarian, status_code=status.HTTP_200_OK, tags=["auth-librarian"])
+async def read_users_me(db: read_db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
     if not current_librarian:
         raise HTTPException(401, detail="You are not authenticated")
-    
-    return current_librarian
+
+    librarian = await db.get(modelTables.Librarian, current_librarian.librarian_id)
+    if librarian is None:
+        raise HTTPException(404, detail="Librarian not found!")
+    return librarian
 
 
 # get all librarians
-@app.get("/librariains/get_all", status_code=status.HTTP_200_OK, tags=["auth-librarian"])
-async def get_all_librarians(db: db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
+@router.get("/librariains/get_all", status_code=status.HTTP_200_OK, tags=["auth-librarian"])
+async def get_all_librarians(db: read_db_dependency, page: page_dependency, response: Response, current_librarian: Librarian = Depends(get_current_active_librarian)):
     if not current_librarian:
         raise HTTPException(401, detail="You are not authenticated")
     
-    all_librarians = db.query(modelTables.Librarian).all()
+    librarians_query = keyset(select(modelTables.Librarian), modelTables.Librarian.librarian_id, page)
+    if page.stream:
+        return stream_ndjson(librarians_query, bind=db.bind)
+
+    all_librarians = (await db.scalars(librarians_query)).all()
     if all_librarians is None:
         raise HTTPException(status_code=404, detail="No librarians found!")
-    return all_librarians
+    return page_of(response, all_librarians, page, lambda librarian: librarian.librarian_id)
 
 
 # get librarian by id
-@app.get("/librarians/get_by_id={librarian_id}", status_code=status.HTTP_200_OK, tags=["auth-librarian"])
-async def get_librarian_by_id(librarian_id : str, db: db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
+@router.get("/librarians/get_by_id={librarian_id}", status_code=status.HTTP_200_OK, tags=["auth-librarian"])
+async def get_librarian_by_id(librarian_id : str, db: read_db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
     if not current_librarian:
         raise HTTPException(401, detail="You are not authenticated")
 
-    librarian = db.query(modelTables.Librarian).filter(modelTables.Librarian.librarian_id == librarian_id).first()
+    librarian = await db.scalar(select(modelTables.Librarian).where(modelTables.Librarian.librarian_id == librarian_id))
 
     if librarian is None:
         raise HTTPException(404, detail="Librarian not found!")
@@ -185,12 +248,13 @@ async def get_librarian_by_id(librarian_id : str, db: db_dependency, current_lib
     return librarian
 
 
-# sign out
-@app.post("/librarians/sign_out", status_code=status.HTTP_200_OK, tags=["auth-librarian"])
-async def sign_out(db:db_dependency):
-    current_librarian = db.query(modelTables.Librarian).filter(modelTables.Librarian.active == True).first()
-    db.query(modelTables.Librarian).filter(modelTables.Librarian.librarian_name == current_librarian.librarian_name).update({"active": False})
-    db.commit()
+# sign out, ends the session of the token it is called with
+@router.post("/librarians/sign_out", status_code=status.HTTP_200_OK, tags=["auth-librarian"])
+async def sign_out(db:db_dependency, token: str = Depends(oauth2_scheme), current_librarian: Librarian = Depends(get_current_active_librarian)):
+    if current_librarian.session_id is not None:
+        await session_registry.revoke(db, current_librarian.session_id, current_librarian.expires_at)
+        await db.commit()
+    principal_cache.discard(token)
     return {"message":"Librarian logged out successfully"}
 
 
@@ -198,46 +262,48 @@ async def sign_out(db:db_dependency):
 
 # _______________________________________________________users____________________________________________________
 # create user
-@app.post("/users/", status_code=status.HTTP_201_CREATED, tags=["user"])
+@router.post("/users/", status_code=status.HTTP_201_CREATED, tags=["user"])
 async def create_user(user: UserBase, db: db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
     if not current_librarian:
         raise HTTPException(401, detail="You are not authenticated")
     
     db_user = modelTables.User(**user.model_dump())
     db.add(db_user)
-    db.commit()
-
-    latest_user = db.query(modelTables.User).order_by(modelTables.User.id.desc()).first()
-    return latest_user
+    await db.commit()
+    return db_user
 
 
 # get all users
-@app.get("/users/get_users", status_code=status.HTTP_200_OK, tags=["user"])
-async def get_users(db: db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
+@router.get("/users/get_users", status_code=status.HTTP_200_OK, tags=["user"])
+async def get_users(db: read_db_dependency, page: page_dependency, response: Response, current_librarian: Librarian = Depends(get_current_active_librarian)):
     if not current_librarian:
         raise HTTPException(401, detail="You are not authenticated")
     
-    allUsers = db.query(modelTables.User).all()
+    users_query = keyset(select(modelTables.User), modelTables.User.id, page)
+    if page.stream:
+        return stream_ndjson(users_query, bind=db.bind)
+
+    allUsers = (await db.scalars(users_query)).all()
     if allUsers is None:
         raise HTTPException(status_code=404, detail="No user found!")
-    return allUsers
+    return page_of(response, allUsers, page, lambda user: user.id)
 
 
 # get user by id
-@app.get("/users/get_user_by_id={id}", status_code=status.HTTP_200_OK, tags=["user"])
-async def get_user_by_id(id:str, db: db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
+@router.get("/users/get_user_by_id={id}", status_code=status.HTTP_200_OK, tags=["user"])
+async def get_user_by_id(id:str, db: read_db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
     if not current_librarian:
         raise HTTPException(401, detail="You are not authenticated")
     
-    user = db.query(modelTables.User).filter(modelTables.User.id == id).first()
+    user = await db.scalar(select(modelTables.User).where(modelTables.User.id == id))
     if user is None:
         raise HTTPException(status_code=404, detail="No user found!")
     return user
 
 # check user is in db or not
-@app.get("/users/check_user_in_db={user}", status_code=status.HTTP_200_OK, tags=["user"])
-async def check_user(user:str, db:db_dependency):
-    check_user = db.query(modelTables.User).filter(modelTables.User.username == user).first()
+@router.get("/users/check_user_in_db={user}", status_code=status.HTTP_200_OK, tags=["user"])
+async def check_user(user:str, db: read_db_dependency):
+    check_user = await db.scalar(select(modelTables.User).where(modelTables.User.username == user))
 
     if check_user is None:
         return 0
@@ -246,53 +312,49 @@ async def check_user(user:str, db:db_dependency):
 
 
 # update user name
-@app.put("/user/update_user_name={id}", status_code=status.HTTP_200_OK, tags=["user"])
+@router.put("/user/update_user_name={id}", status_code=status.HTTP_200_OK, tags=["user"])
 async def update_user_name(id:str, updated_name:str, db:db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
     if not current_librarian:
         raise HTTPException(401, detail="You are not authenticated")
     
-    user = db.query(modelTables.User).filter(modelTables.User.id == id).first()
-    if user is None:
+    if await writes.update_one(db, modelTables.User, id, {"username":updated_name}) is None:
         raise HTTPException(status_code=404, detail="User not found!")
-    db.query(modelTables.User).filter(modelTables.User.id == id).update({"username":updated_name})
-    db.commit()
+    await db.commit()
     return {"message": "user updated successfully"}
 
 
 # update user
-@app.put("/users/update_user={user_id}", status_code=status.HTTP_200_OK, tags=["user"])
+@router.put("/users/update_user={user_id}", status_code=status.HTTP_200_OK, tags=["user"])
 async def update_user(user_id: str, updated_user: UserBase, db:db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
     if not current_librarian:
         raise HTTPException(401, detail="You are not authenticated")
     
-    user = db.query(modelTables.User).filter(modelTables.User.id == user_id).first()
-    if user is None:
-        raise HTTPException(status_code=404, detail="User not found!")
-    
     updated_details = {
         "username" : updated_user.username,
         "email" : updated_user.email,
         "password" : updated_user.password,
         "has_issued": updated_user.has_issued
     }
-    db.query(modelTables.User).filter(modelTables.User.id == user_id).update(updated_details)
-    db.commit()
-
-    user_updated = db.query(modelTables.User).filter(modelTables.User.id == user_id).first()
+    user_updated = await writes.update_one(db, modelTables.User, user_id, updated_details)
+    if user_updated is None:
+        raise HTTPException(status_code=404, detail="User not found!")
+    await db.commit()
     return user_updated
 
 
 # delete user
-@app.delete("/users/delete_user_by_id={id}", status_code=status.HTTP_200_OK, tags=["user"])
+@router.delete("/users/delete_user_by_id={id}", status_code=status.HTTP_200_OK, tags=["user"])
 async def delete_user_by_id(id:str, db:db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
     if not current_librarian:
         raise HTTPException(401, detail="You are not authenticated")
     
-    user = db.query(modelTables.User).filter(modelTables.User.id == id).first()
-    if user is None:
+    # the user's issue records are kept and unlinked, like deleting the ORM object used to do, archived ones too
+    for records in (modelTables.BookIssueRecord, modelTables.BookIssueArchive):
+        await db.execute(update(records).where(records.user_id == writes.coerce_id(modelTables.User, id)).values(user_id=None))
+    if not await writes.delete_one(db, modelTables.User, id):
+        await db.rollback()
         raise HTTPException(status_code=404, detail="No user found!")
-    db.delete(user)
-    db.commit()
+    await db.commit()
     return {"message":"user deleted successufully"}
 
 
@@ -300,181 +362,168 @@ async def delete_user_by_id(id:str, db:db_dependency, current_librarian: Librari
 
 # _______________________________________________________books____________________________________________________
 # common functionalities
+# book details (with author, publisher & category names) come from the catalog read model
 async def get_details(book, db:db_dependency):
-    bookCategory = db.query(modelTables.Category).filter(modelTables.Category.id == book.category).first().name
-    bookAuthor = db.query(modelTables.Author).filter(modelTables.Author.id == book.author).first().name
-    bookPublisher = db.query(modelTables.Publisher).filter(modelTables.Publisher.id == book.publisher).first().name
-    book_details = {
-        "id": book.id,
-        "title": book.title,
-        "author": bookAuthor,
-        "publisher": bookPublisher,
-        "category": bookCategory,
-        "copies": book.copies,
-    }
+    return await catalog_view.get(db, book.id)
+
+
+# author, publisher and category rows for the names in a BookRequest, looked up in one query
+# missing ones are added to the session and get their ids with a single flush
+async def resolve_book_refs(db: AsyncSession, book: BookRequest):
+    ref_models = {"author": modelTables.Author, "publisher": modelTables.Publisher, "category": modelTables.Category}
+    names = {"author": book.author, "publisher": book.publisher, "category": book.category}
+    # names match case-insensitively, the stored spelling is kept
+    found = (await db.execute(select(*(
+        select(getattr(model, column)).where(model.name == names[ref]).order_by(model.id).limit(1).scalar_subquery().label(f"{ref}_{column}")
+        for ref, model in ref_models.items() for column in ("id", "name")
+    )))).one()._asdict()
+
+    refs = {}
+    for ref, model in ref_models.items():
+        if found[f"{ref}_id"] is None:
+            refs[ref] = model(name=names[ref])
+            db.add(refs[ref])
+        else:
+            refs[ref] = model(id=found[f"{ref}_id"], name=found[f"{ref}_name"])
+    await db.flush()
+    return refs
 
-    return book_details
+
+# add a BookRequest's copies to the book with the same title, None when there is no such book
+async def merge_book_copies(db: AsyncSession, book: BookRequest):
+    statement = update(modelTables.Book).where(modelTables.Book.title == book.title).values(copies=modelTables.Book.copies + book.copies)
+    if db.bind.dialect.update_returning:
+        return await db.scalar(statement.returning(modelTables.Book), execution_options={"populate_existing": True})
+    result = await db.execute(statement, execution_options={"synchronize_session": False})
+    if result.rowcount == 0:
+        return None
+    return await db.scalar(select(modelTables.Book).where(modelTables.Book.title == book.title).execution_options(populate_existing=True))
 
 
 # post book
-@app.post("/books/", status_code=status.HTTP_200_OK, tags=["book"])
+@router.post("/books/", status_code=status.HTTP_200_OK, tags=["book"])
 async def add_book(book: BookRequest, db:db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):    
     if not current_librarian:
         raise HTTPException(401, detail="You are not authenticated")
 
-    checkBook = db.query(modelTables.Book).filter(modelTables.Book.title == book.title).first()
-    if checkBook is not None:
-        book_copies = db.query(modelTables.Book).filter(modelTables.Book.title == book.title).first().copies
-        db.query(modelTables.Book).filter(modelTables.Book.title == book.title).update({"copies": book_copies + book.copies})
-    else:
-        book_author = db.query(modelTables.Author).filter(modelTables.Author.name == book.author).first()
-        book_publisher = db.query(modelTables.Publisher).filter(modelTables.Publisher.name == book.publisher).first()
-        book_category = db.query(modelTables.Category).filter(modelTables.Category.name == book.category).first()
-
-        #if author & publisher not available, add them in respective tables
-        if book_author is None:
-            db_author = modelTables.Author(
-                name = book.author
-            )
-            db.add(db_author)
-            db.commit()
-            new_author = db.query(modelTables.Author).order_by(modelTables.Author.id.desc()).first()
-            book_author = new_author
-
-        if book_publisher is None:
-            db_publisher = modelTables.Publisher(
-                name = book.publisher
-            )
-            db.add(db_publisher)
-            db.commit()
-            new_publisher = db.query(modelTables.Publisher).order_by(modelTables.Publisher.id.desc()).first()
-            book_publisher = new_publisher
-
-        if book_category is None:
-            db_category = modelTables.Category(
-                name = book.category
-            )
-            db.add(db_category)
-            db.commit()
-            new_category = db.query(modelTables.Category).order_by(modelTables.Category.id.desc()).first()
-            book_category = new_category
-
-        # add new book to db
-        db_book = modelTables.Book(
-            title = book.title,
-            author = book_author.id,
-            publisher = book_publisher.id,
-            category = book_category.id,
-            copies = book.copies
-        )
-        db.add(db_book)
-    db.commit()
+    # an existing title only gets its copies added, in one atomic UPDATE
+    merged_book = await merge_book_copies(db, book)
+    if merged_book is not None:
+        await db.commit()
+        await catalog_view.refresh_book(db, merged_book.id)
+        response_cache.bump("books")
+        return merged_book
+
+    refs = await resolve_book_refs(db, book)
+    book_details = {
+        "title": book.title,
+        "author": refs["author"].id,
+        "publisher": refs["publisher"].id,
+        "category": refs["category"].id,
+        "copies": book.copies
+    }
+    db_book = modelTables.Book(**book_details)
+    db.add(db_book)
+    await db.commit()
+    catalog_view.put_book(db_book.id, book_details, refs["author"].name, refs["publisher"].name, refs["category"].name)
+    response_cache.bump("books", "authors", "publishers", "categories")
+    return db_book
+
+
+# bulk load a CSV or JSONL file of BookRequest rows, see catalogIngest.py
+@router.post("/books/bulk", status_code=status.HTTP_200_OK, tags=["book"])
+async def bulk_add_books(file: UploadFile, db:db_dependency,
+                         chunk_size: Annotated[int, Query(ge=1, le=MAX_INGEST_CHUNK_SIZE)] = INGEST_CHUNK_SIZE,
+                         format: Annotated[str | None, Query(pattern="^(csv|jsonl)$")] = None,
+                         current_librarian: Librarian = Depends(get_current_active_librarian)):
+    if not current_librarian:
+        raise HTTPException(401, detail="You are not authenticated")
+
+    fmt = format or format_of(file.filename or "")
+    if fmt is None:
+        raise HTTPException(status_code=400, detail="Unknown file format, use a .csv or .jsonl file or pass ?format=")
 
-    latest_book = db.query(modelTables.Book).order_by(modelTables.Book.id.desc()).first()
-    return latest_book
+    lines = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+    try:
+        stats = await CatalogIngest(db, chunk_size).run(read_records(lines, fmt))
+    finally:
+        # a failed chunk leaves the earlier ones committed, so the read model is reloaded either way
+        catalog_view.invalidate()
+        response_cache.bump("books", "authors", "publishers", "categories")
+    return stats
 
 
 # get all books
-@app.get("/books/get_all", status_code=status.HTTP_200_OK, tags=["book"])
-async def get_all_books(db:db_dependency):
-    all_books = db.query(modelTables.Book).all()
+@router.get("/books/get_all", status_code=status.HTTP_200_OK, tags=["book"])
+async def get_all_books(db: read_db_dependency, page: page_dependency, response: Response):
+    books_query = keyset(select(modelTables.Book), modelTables.Book.id, page)
+    if page.stream:
+        return stream_ndjson(books_query, bind=db.bind)
+
+    all_books = (await db.scalars(books_query)).all()
     if all_books is None:
         raise HTTPException(status_code=404, detail="No book found!")
-    return all_books
-
-@app.get("/books/get_details", status_code=status.HTTP_200_OK, tags=["book"])
-async def get_books_details(db:db_dependency):
-    all_books = await get_all_books(db)
-    all_books_details = []
+    return page_of(response, all_books, page, lambda book: book.id)
 
-    if all_books is None:
-        raise HTTPException(status_code=404, detail="Books not found!")
+@router.get("/books/get_details", status_code=status.HTTP_200_OK, tags=["book"])
+async def get_books_details(db: read_db_dependency, page: page_dependency, request: Request, response: Response):
+    if page.stream:
+        return stream_ndjson(keyset(catalog_query(), modelTables.Book.id, page), row_to_details, scalars=False, bind=db.bind)
 
-    for book in all_books:
-        
-        book_details = await get_details(book, db)
-        all_books_details.append(book_details)
+    async def load():
+        all_books_details = await catalog_view.page(db, page.after, page.limit)
+        return page_of(response, all_books_details, page, lambda book: book["id"])
 
-    return all_books_details
+    return await response_cache.serve("books", db, request, response, load)
 
 
 # get book by id
-@app.get("/books/get_book_by_id={book_id}", status_code=status.HTTP_200_OK, tags=["book"])
-async def get_book_by_id(book_id:str, db:db_dependency):
-    book = db.query(modelTables.Book).filter(modelTables.Book.id == book_id).first()
-    if book is None:
+@router.get("/books/get_book_by_id={book_id}", status_code=status.HTTP_200_OK, tags=["book"])
+async def get_book_by_id(book_id:str, db: read_db_dependency):
+    book_by_id = await catalog_view.get(db, book_id)
+    if book_by_id is None:
         raise HTTPException(status_code=404, detail="book not found!")
     
-    book_by_id = await get_details(book, db)
     return book_by_id
 
 
 # update book by id
-@app.put("/books/update_book_by_id={book_id}", status_code=status.HTTP_200_OK, tags=["book"])
+@router.put("/books/update_book_by_id={book_id}", status_code=status.HTTP_200_OK, tags=["book"])
 async def update_book(book_id:str, updated_book:BookRequest, db:db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
     if not current_librarian:
         raise HTTPException(401, detail="You are not authenticated")
     
-    book = db.query(modelTables.Book).filter(modelTables.Book.id == book_id).first()
-    if book is None:
-        raise HTTPException(status_code=404, detail="book not found!")
-
-    book_author = db.query(modelTables.Author).filter(modelTables.Author.name == updated_book.author).first()
-    book_publisher = db.query(modelTables.Publisher).filter(modelTables.Publisher.name == updated_book.publisher).first()
-    book_category = db.query(modelTables.Category).filter(modelTables.Category.name == updated_book.category).first()
-
-    #if author & publisher not available, add them in respective tables
-    if book_author is None:
-        db_author = modelTables.Author(
-            name = updated_book.author
-        )
-        db.add(db_author)
-        db.commit()
-        new_author = db.query(modelTables.Author).order_by(modelTables.Author.id.desc()).first()
-        book_author = new_author
-
-    if book_publisher is None:
-        db_publisher = modelTables.Publisher(
-            name = updated_book.publisher
-        )
-        db.add(db_publisher)
-        db.commit()
-        new_publisher = db.query(modelTables.Publisher).order_by(modelTables.Publisher.id.desc()).first()
-        book_publisher = new_publisher
-
-    if book_category is None:
-        db_category = modelTables.Category(
-            name = updated_book.category
-        )
-        db.add(db_category)
-        db.commit()
-        new_category = db.query(modelTables.Category).order_by(modelTables.Category.id.desc()).first()
-        book_category = new_category
-    
+    refs = await resolve_book_refs(db, updated_book)
     updated_book_details ={
         "title": updated_book.title,
-        "author": book_author.id,
-        "publisher": book_publisher.id,
+        "author": refs["author"].id,
+        "publisher": refs["publisher"].id,
+        "category": refs["category"].id,
         "copies": updated_book.copies
     }
-
-    db.query(modelTables.Book).filter(modelTables.Book.id == book_id).update(updated_book_details)
-    db.commit()
-    updated_book = db.query(modelTables.Book).filter(modelTables.Book.id == book_id).first()
-    return updated_book
+    book = await writes.update_one(db, modelTables.Book, book_id, updated_book_details)
+    if book is None:
+        # also drops the authors, publishers and categories created for it
+        await db.rollback()
+        raise HTTPException(status_code=404, detail="book not found!")
+    await db.commit()
+    catalog_view.put_book(book["id"], updated_book_details, refs["author"].name, refs["publisher"].name, refs["category"].name)
+    response_cache.bump("books", "authors", "publishers", "categories")
+    return book
 
 
 # delete book by id
-@app.delete("/books/delete_book_by_id={book_id}", status_code=status.HTTP_200_OK, tags=["book"])
+@router.delete("/books/delete_book_by_id={book_id}", status_code=status.HTTP_200_OK, tags=["book"])
 async def delete_book_by_id(book_id:str, db:db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
     if not current_librarian:
         raise HTTPException(401, detail="You are not authenticated")
     
-    book = db.query(modelTables.Book).filter(modelTables.Book.id == book_id).first()
-    if book is None:
+    if not await writes.delete_one(db, modelTables.Book, book_id):
         raise HTTPException(status_code=404, detail="book not found!")
-    db.query(modelTables.Book).filter(modelTables.Book.id == book_id).delete()
-    db.commit()
+    await record_delete(db, "books", book_id)
+    await db.commit()
+    catalog_view.remove_book(book_id)
+    response_cache.bump("books")
     return {"message": "book deleted successfully"}
 
 
@@ -482,72 +531,75 @@ async def delete_book_by_id(book_id:str, db:db_dependency, current_librarian: Li
 
 # _______________________________________________________categories____________________________________________________
 # post category
-@app.post("/categories/", status_code=status.HTTP_200_OK, tags=["category"])
+@router.post("/categories/", status_code=status.HTTP_200_OK, tags=["category"])
 async def create_category(category: Category, db: db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
     if not current_librarian:
         raise HTTPException(401, detail="You are not authenticated")
     
-    check_category = db.query(modelTables.Category).filter(modelTables.Category.name == category.name).first()
-    if check_category is not None:
+    db_category = await writes.insert_unless_exists(db, modelTables.Category, category.model_dump(), modelTables.Category.name == category.name)
+    if db_category is None:
         raise HTTPException(status_code=404, detail="category already exists")
-    
-    db_category = modelTables.Category(**category.model_dump())
-    db.add(db_category)
-    db.commit()
-    last_inserted_category = db.query(modelTables.Category).order_by(modelTables.Category.id.desc()).first()
-    return last_inserted_category
+    await db.commit()
+    response_cache.bump("categories")
+    return db_category
 
 
-# get all categories
-@app.get("/categories/get_all", status_code=status.HTTP_200_OK, tags=["category"])
-async def get_all_categories(db: db_dependency):
-    
-    all_categories = db.query(modelTables.Category).all()
+# get all categories, cached with an ETag until a category changes, see responseCache.py
+@router.get("/categories/get_all", status_code=status.HTTP_200_OK, tags=["category"])
+async def get_all_categories(db: read_db_dependency, page: page_dependency, request: Request, response: Response):
+    categories_query = keyset(select(modelTables.Category), modelTables.Category.id, page)
+    if page.stream:
+        return stream_ndjson(categories_query, bind=db.bind)
+
+    async def load():
+        all_categories = (await db.scalars(categories_query)).all()
+
+        if all_categories is None:
+            raise HTTPException(status_code=404, detail="no category found")
+        return page_of(response, all_categories, page, lambda category: category.id)
 
-    if all_categories is None:
-        raise HTTPException(status_code=404, detail="no category found")
-    return all_categories
+    return await response_cache.serve("categories", db, request, response, load)
 
 
 # get category by id
-@app.get("/categories/get_by_id={category_id}", status_code=status.HTTP_200_OK, tags=["category"])
-async def get_category_by_id(category_id: str, db: db_dependency):
-    category = db.query(modelTables.Category).filter(modelTables.Category.id == category_id).first()
+@router.get("/categories/get_by_id={category_id}", status_code=status.HTTP_200_OK, tags=["category"])
+async def get_category_by_id(category_id: str, db: read_db_dependency):
+    category = await db.scalar(select(modelTables.Category).where(modelTables.Category.id == category_id))
     if category_id is None:
         raise HTTPException(status_code=404, detail="category not found!")
     return category
 
 
 # update category
-@app.put("/categories/update_category={category_id}", status_code=status.HTTP_200_OK, tags=["category"])
+@router.put("/categories/update_category={category_id}", status_code=status.HTTP_200_OK, tags=["category"])
 async def update_category(category_id: str, updated_category: Category, db: db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
     if not current_librarian:
         raise HTTPException(401, detail="You are not authenticated")
     
-    category = db.query(modelTables.Category).filter(modelTables.Category.id == category_id).first()
-    if category is None:
-        raise HTTPException(status_code=404, detail="category not found!")
-    
     updated_category_detail = {
         "name": updated_category.name
     }
-    db.query(modelTables.Category).filter(modelTables.Category.id == category_id).update(updated_category_detail)
-    db.commit()
-    category_updated = db.query(modelTables.Category).filter(modelTables.Category.id == category_id).first()
+    category_updated = await writes.update_one(db, modelTables.Category, category_id, updated_category_detail)
+    if category_updated is None:
+        raise HTTPException(status_code=404, detail="category not found!")
+    await db.commit()
+    catalog_view.rename("category", category_updated["id"], category_updated["name"])
+    response_cache.bump("categories", "books")
     return category_updated
 
 
 # delete category
-@app.delete("/categories/delete_category={category_id}", status_code=status.HTTP_200_OK, tags=["category"])
+@router.delete("/categories/delete_category={category_id}", status_code=status.HTTP_200_OK, tags=["category"])
 async def delete_category(category_id: str, db:db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
     if not current_librarian:
         raise HTTPException(401, detail="You are not authenticated")
     
-    category = db.query(modelTables.Category).filter(modelTables.Category.id == category_id).first()
-    if category is None:
+    if not await writes.delete_one(db, modelTables.Category, category_id):
         raise HTTPException(status_code=404, detail="category not found!")
-    db.query(modelTables.Category).filter(modelTables.Category.id == category_id).delete()
-    db.commit()
+    await record_delete(db, "categories", category_id)
+    await db.commit()
+    catalog_view.rename("category", category_id, None)
+    response_cache.bump("categories", "books")
     return {"message": "category deleted successfully"}
 
 
@@ -555,71 +607,75 @@ async def delete_category(category_id: str, db:db_dependency, current_librarian:
 
 # _______________________________________________________authors____________________________________________________
 # post author
-@app.post("/authors/", status_code=status.HTTP_200_OK, tags=["author"])
+@router.post("/authors/", status_code=status.HTTP_200_OK, tags=["author"])
 async def add_author(author: Author, db: db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
     if not current_librarian:
         raise HTTPException(401, detail="You are not authenticated")
     
-    check_author = db.query(modelTables.Author).filter(modelTables.Author.name == author.name).first()
-    if check_author is not None:
+    db_author = await writes.insert_unless_exists(db, modelTables.Author, author.model_dump(), modelTables.Author.name == author.name)
+    if db_author is None:
         raise HTTPException(status_code=404, detail="Author already exists")
-
-    db_author = modelTables.Author(**author.model_dump())
-    db.add(db_author)
-    db.commit()
-    last_inserted_author = db.query(modelTables.Author).order_by(modelTables.Author.id.desc()).first()
-    return last_inserted_author
+    await db.commit()
+    response_cache.bump("authors")
+    return db_author
 
 
 # get all authors
-@app.get("/authors/get_all", status_code=status.HTTP_200_OK, tags=["author"])
-async def get_all_authors(db: db_dependency):
-    all_authors = db.query(modelTables.Author).all()
+@router.get("/authors/get_all", status_code=status.HTTP_200_OK, tags=["author"])
+async def get_all_authors(db: read_db_dependency, page: page_dependency, request: Request, response: Response):
+    authors_query = keyset(select(modelTables.Author), modelTables.Author.id, page)
+    if page.stream:
+        return stream_ndjson(authors_query, bind=db.bind)
+
+    async def load():
+        all_authors = (await db.scalars(authors_query)).all()
 
-    if all_authors is None:
-        raise HTTPException(status_code=404, detail="no author found")
-    return all_authors
+        if all_authors is None:
+            raise HTTPException(status_code=404, detail="no author found")
+        return page_of(response, all_authors, page, lambda author: author.id)
+
+    return await response_cache.serve("authors", db, request, response, load)
 
 
 # get author by id
-@app.get("/authors/get_by_id={author_id}", status_code=status.HTTP_200_OK, tags=["author"])
-async def get_author_by_id(author_id: str, db: db_dependency):
-    author = db.query(modelTables.Author).filter(modelTables.Author.id == author_id).first()
+@router.get("/authors/get_by_id={author_id}", status_code=status.HTTP_200_OK, tags=["author"])
+async def get_author_by_id(author_id: str, db: read_db_dependency):
+    author = await db.scalar(select(modelTables.Author).where(modelTables.Author.id == author_id))
     if author_id is None:
         raise HTTPException(status_code=404, detail="author not found!")
     return author
 
 
 # update author
-@app.put("/authors/update_author={author_id}", status_code=status.HTTP_200_OK, tags=["author"])
+@router.put("/authors/update_author={author_id}", status_code=status.HTTP_200_OK, tags=["author"])
 async def update_author(author_id: str, updated_author: Author, db: db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
     if not current_librarian:
         raise HTTPException(401, detail="You are not authenticated")
     
-    author = db.query(modelTables.Author).filter(modelTables.Author.id == author_id).first()
-    if author is None:
-        raise HTTPException(status_code=404, detail="author not found!")
-    
     updated_author_detail = {
         "name": updated_author.name
     }
-    db.query(modelTables.Author).filter(modelTables.Author.id == author_id).update(updated_author_detail)
-    db.commit()
-    author_updated = db.query(modelTables.Author).filter(modelTables.Author.id == author_id).first()
+    author_updated = await writes.update_one(db, modelTables.Author, author_id, updated_author_detail)
+    if author_updated is None:
+        raise HTTPException(status_code=404, detail="author not found!")
+    await db.commit()
+    catalog_view.rename("author", author_updated["id"], author_updated["name"])
+    response_cache.bump("authors", "books")
     return author_updated
 
 
 # delete author
-@app.delete("/authors/delete_author={author_id}", status_code=status.HTTP_200_OK, tags=["author"])
+@router.delete("/authors/delete_author={author_id}", status_code=status.HTTP_200_OK, tags=["author"])
 async def delete_author(author_id: str, db:db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
     if not current_librarian:
         raise HTTPException(401, detail="You are not authenticated")
     
-    author = db.query(modelTables.Author).filter(modelTables.Author.id == author_id).first()
-    if author is None:
+    if not await writes.delete_one(db, modelTables.Author, author_id):
         raise HTTPException(status_code=404, detail="user not found!")
-    db.query(modelTables.Author).filter(modelTables.Author.id == author_id).delete()
-    db.commit()
+    await record_delete(db, "authors", author_id)
+    await db.commit()
+    catalog_view.rename("author", author_id, None)
+    response_cache.bump("authors", "books")
     return {"message": "Author deleted successfully"}
 
 
@@ -627,87 +683,96 @@ async def delete_author(author_id: str, db:db_dependency, current_librarian: Lib
 
 # _______________________________________________________publishers____________________________________________________
 # post Publisher
-@app.post("/publishers/", status_code=status.HTTP_200_OK, tags=["publisher"])
+@router.post("/publishers/", status_code=status.HTTP_200_OK, tags=["publisher"])
 async def add_publisher(publisher: Publisher, db: db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
     if not current_librarian:
         raise HTTPException(401, detail="You are not authenticated")
     
-    check_publisher = db.query(modelTables.Publisher).filter(modelTables.Publisher.name == publisher.name).first()
-    if check_publisher is not None:
+    db_publisher = await writes.insert_unless_exists(db, modelTables.Publisher, publisher.model_dump(), modelTables.Publisher.name == publisher.name)
+    if db_publisher is None:
         raise HTTPException(status_code=404, detail="Publisher already exists")
-    
-    db_publisher = modelTables.Publisher(**publisher.model_dump())
-    db.add(db_publisher)
-    db.commit()
-    last_inserted_publisher = db.query(modelTables.Publisher).order_by(modelTables.Publisher.id.desc()).first()
-    return last_inserted_publisher
+    await db.commit()
+    response_cache.bump("publishers")
+    return db_publisher
 
 
 # get all Publishers
-@app.get("/publishers/get_all", status_code=status.HTTP_200_OK, tags=["publisher"])
-async def get_all_publishers(db: db_dependency):
-    all_publishers = db.query(modelTables.Publisher).all()
+@router.get("/publishers/get_all", status_code=status.HTTP_200_OK, tags=["publisher"])
+async def get_all_publishers(db: read_db_dependency, page: page_dependency, request: Request, response: Response):
+    publishers_query = keyset(select(modelTables.Publisher), modelTables.Publisher.id, page)
+    if page.stream:
+        return stream_ndjson(publishers_query, bind=db.bind)
+
+    async def load():
+        all_publishers = (await db.scalars(publishers_query)).all()
 
-    if all_publishers is None:
-        raise HTTPException(status_code=404, detail="no publisher found!")
-    return all_publishers
+        if all_publishers is None:
+            raise HTTPException(status_code=404, detail="no publisher found!")
+        return page_of(response, all_publishers, page, lambda publisher: publisher.id)
+
+    return await response_cache.serve("publishers", db, request, response, load)
 
 
 # get Publisher by id
-@app.get("/publishers/get_by_id={publisher_id}", status_code=status.HTTP_200_OK, tags=["publisher"])
-async def get_publisher_by_id(publisher_id: str, db: db_dependency):
-    publisher = db.query(modelTables.Publisher).filter(modelTables.Publisher.id == publisher_id).first()
+@router.get("/publishers/get_by_id={publisher_id}", status_code=status.HTTP_200_OK, tags=["publisher"])
+async def get_publisher_by_id(publisher_id: str, db: read_db_dependency):
+    publisher = await db.scalar(select(modelTables.Publisher).where(modelTables.Publisher.id == publisher_id))
     if publisher_id is None:
         raise HTTPException(status_code=404, detail="publisher not found!")
     return publisher
 
 
 # update Publisher
-@app.put("/publishers/update_publisher={publisher_id}", status_code=status.HTTP_200_OK, tags=["publisher"])
+@router.put("/publishers/update_publisher={publisher_id}", status_code=status.HTTP_200_OK, tags=["publisher"])
 async def update_publisher(publisher_id: str, updated_publisher: Publisher, db: db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
     if not current_librarian:
         raise HTTPException(401, detail="You are not authenticated")
     
-    publisher = db.query(modelTables.Publisher).filter(modelTables.Publisher.id == publisher_id).first()
-    if publisher is None:
-        raise HTTPException(status_code=404, detail="publisher not found!")
-    
     updated_publisher_detail = {
         "name": updated_publisher.name
     }
-    db.query(modelTables.Publisher).filter(modelTables.Publisher.id == publisher_id).update(updated_publisher_detail)
-    db.commit()
-    publisher_updated = db.query(modelTables.Publisher).filter(modelTables.Publisher.id == publisher_id).first()
+    publisher_updated = await writes.update_one(db, modelTables.Publisher, publisher_id, updated_publisher_detail)
+    if publisher_updated is None:
+        raise HTTPException(status_code=404, detail="publisher not found!")
+    await db.commit()
+    catalog_view.rename("publisher", publisher_updated["id"], publisher_updated["name"])
+    response_cache.bump("publishers", "books")
     return publisher_updated
 
 
 # delete Publisher
-@app.delete("/publishers/delete_publisher={publisher_id}", status_code=status.HTTP_200_OK, tags=["publisher"])
+@router.delete("/publishers/delete_publisher={publisher_id}", status_code=status.HTTP_200_OK, tags=["publisher"])
 async def delete_publisher(publisher_id: str, db:db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
     if not current_librarian:
         raise HTTPException(401, detail="You are not authenticated")
     
-    publisher = db.query(modelTables.Publisher).filter(modelTables.Publisher.id == publisher_id).first()
-    if publisher is None:
+    if not await writes.delete_one(db, modelTables.Publisher, publisher_id):
         raise HTTPException(status_code=404, detail="publisher not found!")
-    db.query(modelTables.Publisher).filter(modelTables.Publisher.id == publisher_id).delete()
-    db.commit()
+    await record_delete(db, "publishers", publisher_id)
+    await db.commit()
+    catalog_view.rename("publisher", publisher_id, None)
+    response_cache.bump("publishers", "books")
     return {"message": "publisher deleted successfully"}
 
 
 
 
+# _______________________________________________________catalog sync____________________________________________________
+# books, authors, publishers and categories written or deleted after `since`, for clients keeping a local copy
+# pass the returned version as `since` next time, see catalogSync.py
+# read on the primary: a client that synced there would look ahead of a lagging replica and get a full copy
+@router.get("/catalog/changes", status_code=status.HTTP_200_OK, tags=["book"])
+async def get_catalog_changes(db: db_dependency, since: Annotated[int, Query(ge=0)] = 0):
+    return await catalog_changes(db, since)
+
+
+
+
 # _______________________________________________________issue details____________________________________________________
 # common functions
-async def get_all_bookeIssues(db: db_dependency):
-    all_bookIssues = db.query(modelTables.BookIssueRecord).all()
-    if all_bookIssues is None:
-        raise HTTPException(status_code=404, detail="no details found for book issued!")
-    return all_bookIssues
-
 async def get_bookeIssue_details(i, db:db_dependency):
-    bookname = db.query(modelTables.Book).filter(modelTables.Book.id == i.book_id).first().title
-    username = db.query(modelTables.User).filter(modelTables.User.id == i.user_id).first().username
+    bookname = (await db.scalar(select(modelTables.Book).where(modelTables.Book.id == i.book_id))).title
+    username = (await db.scalar(select(modelTables.User).where(modelTables.User.id == i.user_id))).username
     issue_details = {
             "id": i.id,
             "bookname": bookname,
@@ -718,36 +783,40 @@ async def get_bookeIssue_details(i, db:db_dependency):
         }
     return issue_details
 
+# an issue record's new status on the change feed, after the commit and after the book's copies were refreshed
+def publish_issue(issue_id, book_id, user_id, issue_status):
+    change_feed.publish("issue", {"id": issue_id, "book_id": book_id, "user_id": user_id, "status": issue_status},
+                        book_id, catalog_view.category_of(book_id))
+
+# issue records (or archived ones, see archive.py) joined with the book title and username in one query
+def bookIssue_details_query(records=modelTables.BookIssueRecord):
+    return (
+        select(
+            records.id,
+            modelTables.Book.title.label("bookname"),
+            modelTables.User.username,
+            records.issued_by,
+            records.issue_time,
+            records.issue_status,
+        )
+        .outerjoin(modelTables.Book, modelTables.Book.id == records.book_id)
+        .outerjoin(modelTables.User, modelTables.User.id == records.user_id)
+    )
+
 
 # post issue details
-@app.post("/bookIssues/", status_code=status.HTTP_200_OK, tags=["bookIssue"])
-async def create_bookIssue_record(book_issue_request: BookIssueRequest, db: db_dependency):
-    current_librarian = db.query(modelTables.Librarian).filter(modelTables.Librarian.active == True).first()
-
-    checkBookID = db.query(modelTables.Book).filter(modelTables.Book.id == book_issue_request.book_id).first()
-    checkUserID = db.query(modelTables.User).filter(modelTables.User.id == book_issue_request.user_id).first()
-
-    if checkBookID is None:
-        raise HTTPException(status_code=404, detail="Book for issue not found!")
-    elif checkBookID.copies == 0:
-        raise HTTPException(status_code=400, detail="This book is not available to issue!")
-
-    if checkUserID is None:
-        raise HTTPException(status_code=404, detail="User for issue not found!")
-    elif checkUserID.has_issued:
-        raise HTTPException(status_code=400, detail="User is not valid to issue book!")
-    
-    all_bookIssues = await get_all_bookeIssues(db)
-    for book in all_bookIssues:
-        if book.book_id == checkBookID.id and book.user_id == checkUserID.id and checkUserID.has_issued == True:
-            raise HTTPException(status_code=400, detail="User has already requested to issue this book!")
-
-    issue_time = datetime.now()
+@router.post("/bookIssues/", status_code=status.HTTP_200_OK, tags=["bookIssue"])
+async def create_bookIssue_record(book_issue_request: BookIssueRequest, db: db_dependency, current_librarian: Librarian | None = Depends(get_optional_librarian)):
+    if await circulation.has_open_issue(db, book_issue_request.book_id, book_issue_request.user_id):
+        raise HTTPException(status_code=400, detail="User has already requested to issue this book!")
 
+    # a request made with a librarian's token is issued right away, an anonymous one waits as pending
     if current_librarian:
+        await circulation.check_out(db, book_issue_request.book_id, book_issue_request.user_id)
         issued_by = current_librarian.librarian_id
         issue_status = "issued"
     else:
+        await circulation.check_can_request(db, book_issue_request.book_id, book_issue_request.user_id)
         issued_by = None
         issue_status = "pending"
 
@@ -755,44 +824,43 @@ async def create_bookIssue_record(book_issue_request: BookIssueRequest, db: db_d
         book_id= book_issue_request.book_id,
         user_id= book_issue_request.user_id,
         issued_by= issued_by,
-        issue_time= issue_time,
+        issue_time= datetime.now(),
         issue_status= issue_status
     )
     db.add(db_book_issue)
-
+    await db.commit()
     if current_librarian:
-        book_copies = db.query(modelTables.Book).filter(modelTables.Book.id == book_issue_request.book_id).first().copies
-        db.query(modelTables.Book).filter(modelTables.Book.id == book_issue_request.book_id).update(
-            {"copies": book_copies - 1}
-        )
-        db.query(modelTables.User).filter(modelTables.User.id == book_issue_request.user_id).update(
-            {"has_issued": True}
-        )
-    db.commit()
+        await catalog_view.refresh_book(db, book_issue_request.book_id)
+        response_cache.bump("books")
+    publish_issue(db_book_issue.id, db_book_issue.book_id, db_book_issue.user_id, issue_status)
 
-    latest_issue_details = db.query(modelTables.BookIssueRecord).order_by(modelTables.BookIssueRecord.id.desc()).first()
-    return latest_issue_details
+    # the inserted record itself, re-reading the newest row would return another desk's record under load
+    return db_book_issue
 
 
-# get all book issues
-@app.get("/bookIssues/get_all", status_code=status.HTTP_200_OK, tags=["bookIssue"])
-async def get_all_bookIssued_details(db:db_dependency):    
-    all_bookIssued = await get_all_bookeIssues(db)
+# get all book issues, archived ones included
+@router.get("/bookIssues/get_all", status_code=status.HTTP_200_OK, tags=["bookIssue"])
+async def get_all_bookIssued_details(db: read_db_dependency, page: page_dependency, response: Response):
+    bookIssues_query = history_query(
+        lambda records: keyset(bookIssue_details_query(records), records.id, page),
+        lambda statement, history: keyset(statement, history.c.id, page),
+    )
+    if page.stream:
+        return stream_ndjson(bookIssues_query, lambda row: row._asdict(), scalars=False, bind=db.bind)
 
-    all_bookIssues_details = []
-    for i in all_bookIssued:
-        issue_details = await get_bookeIssue_details(i, db)
-        all_bookIssues_details.append(issue_details)
-    return all_bookIssues_details
+    all_bookIssues_details = [row._asdict() for row in (await db.execute(bookIssues_query)).all()]
+    return page_of(response, all_bookIssues_details, page, lambda issue: issue["id"])
 
 
 # get book issue by id
-@app.get("/bookIssues/get_by_id={bookIssue_id}", status_code=status.HTTP_200_OK, tags=["bookIssue"])
-async def get_bookIssue_by_id(bookIssue_id:str, db:db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
+@router.get("/bookIssues/get_by_id={bookIssue_id}", status_code=status.HTTP_200_OK, tags=["bookIssue"])
+async def get_bookIssue_by_id(bookIssue_id:str, db: read_db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
     if not current_librarian:
         raise HTTPException(401, detail="You are not authenticated")
     
-    bookIssue = db.query(modelTables.BookIssueRecord).filter(modelTables.BookIssueRecord.id == bookIssue_id).first()
+    bookIssue = await db.scalar(select(modelTables.BookIssueRecord).where(modelTables.BookIssueRecord.id == bookIssue_id))
+    if bookIssue is None:
+        bookIssue = await db.get(modelTables.BookIssueArchive, writes.coerce_id(modelTables.BookIssueArchive, bookIssue_id))
     if bookIssue is None:
         raise HTTPException(status_code=404, detail="no book issue details is found!")
     
@@ -800,96 +868,146 @@ async def get_bookIssue_by_id(bookIssue_id:str, db:db_dependency, current_librar
     return bookIssue_details
 
 
-# get book issue details user wise
-@app.get("/get_bookIssues_by_user={userId}", status_code=status.HTTP_200_OK, tags=["bookIssue"])
-async def get_bookIssues_by_user(userId: int, db:db_dependency):
-    check_user = db.query(modelTables.User).filter(modelTables.User.id == userId).first()
-    if check_user is None:
+# get book issue details user wise, newest first, archived ones included
+# ?limit=&before= pages through the history on (issue_time, id) using the user_id index of both tables
+@router.get("/get_bookIssues_by_user={userId}", status_code=status.HTTP_200_OK, tags=["bookIssue"])
+async def get_bookIssues_by_user(userId: int, db: read_db_dependency, page: time_page_dependency, response: Response):
+    if await db.get(modelTables.User, userId) is None:
         raise HTTPException(status_code=404, detail="User not exists in db!")
-    all_bookeIssues = await get_all_bookIssued_details(db)
-    bookIssuesByUser = []
 
-    for book in all_bookeIssues:
-        if book["username"] == check_user.username:
-            bookIssuesByUser.append(book)
+    user_bookIssues_query = history_query(
+        lambda records: time_keyset(bookIssue_details_query(records).where(records.user_id == userId), records.issue_time, records.id, page),
+        lambda statement, history: time_keyset(statement, history.c.issue_time, history.c.id, page),
+    )
+    if page.stream:
+        return stream_ndjson(user_bookIssues_query, lambda row: row._asdict(), scalars=False, bind=db.bind)
 
-    return bookIssuesByUser
+    bookIssuesByUser = [row._asdict() for row in (await db.execute(user_bookIssues_query)).all()]
+    return page_of(response, bookIssuesByUser, page, lambda issue: time_cursor(issue["issue_time"], issue["id"]))
 
 
 # update book issue process
-@app.put("/update_bookIssue={bookIssue_id}", status_code=status.HTTP_200_OK, tags=["bookIssue"])
-async def update_bookIssue(bookIssue_id: int, db:db_dependency):
-    current_librarian_id = db.query(modelTables.Librarian).filter(modelTables.Librarian.active == True).first().librarian_id
-    if not current_librarian_id:
-        raise HTTPException(401, detail="You are not authenticated")
+@router.put("/update_bookIssue={bookIssue_id}", status_code=status.HTTP_200_OK, tags=["bookIssue"])
+async def update_bookIssue(bookIssue_id: int, db:db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
+    current_librarian_id = current_librarian.librarian_id
     
-    check_bookIssue_record = db.query(modelTables.BookIssueRecord).filter(modelTables.BookIssueRecord.id == bookIssue_id).first()
+    check_bookIssue_record = await db.scalar(select(modelTables.BookIssueRecord).where(modelTables.BookIssueRecord.id == bookIssue_id))
     if check_bookIssue_record is None:
         raise HTTPException(status_code=404, detail="No book issue record!")
     
-    check_user = db.query(modelTables.User).filter(modelTables.User.id == check_bookIssue_record.user_id).first()
-    if check_user.has_issued == True:
-        raise HTTPException(status_code=400, detail="user is not eligible to issue book!")
-    
-    if check_bookIssue_record.issue_status == "pending" and check_user.has_issued == False:
-        db.query(modelTables.BookIssueRecord).filter(modelTables.BookIssueRecord.id == bookIssue_id).update({"issue_status": "issued", "issued_by": current_librarian_id})
-        db.query(modelTables.User).filter(modelTables.User.id == check_bookIssue_record.user_id).update({"has_issued": True})
-        book_copies = db.query(modelTables.Book).filter(modelTables.Book.id == check_bookIssue_record.book_id).first().copies
-        
-        if book_copies < 1:
-            raise HTTPException(status_code=400, detail="Book not available")
+    if check_bookIssue_record.issue_status == "pending":
+        if await circulation.approve_pending(db, check_bookIssue_record, current_librarian_id):
+            await db.commit()
+            # the record is returned as written instead of being read back
+            set_committed_value(check_bookIssue_record, "issue_status", "issued")
+            set_committed_value(check_bookIssue_record, "issued_by", current_librarian_id)
+            await catalog_view.refresh_book(db, check_bookIssue_record.book_id)
+            response_cache.bump("books")
+            publish_issue(check_bookIssue_record.id, check_bookIssue_record.book_id, check_bookIssue_record.user_id, "issued")
         else:
-            db.query(modelTables.Book).filter(modelTables.Book.id == check_bookIssue_record.book_id).update({"copies": book_copies - 1})
-        db.commit()
+            # another desk got to it first, return the record as it is now
+            await db.refresh(check_bookIssue_record)
 
-    latest_record = db.query(modelTables.BookIssueRecord).filter(modelTables.BookIssueRecord.id == check_bookIssue_record.id).first()
-    return latest_record
+    return check_bookIssue_record
 
 
 # book return process   # return bookIssues by id
-@app.put("/bookIssues/return_bookIssue={bookIssue_id}", status_code=status.HTTP_200_OK, tags=["bookIssue"])
+@router.put("/bookIssues/return_bookIssue={bookIssue_id}", status_code=status.HTTP_200_OK, tags=["bookIssue"])
 async def return_bookIssue(bookIssue_id: str, db: db_dependency):
-    bookIssue = db.query(modelTables.BookIssueRecord).filter(modelTables.BookIssueRecord.id == bookIssue_id).first()
+    bookIssue = await db.scalar(select(modelTables.BookIssueRecord).where(modelTables.BookIssueRecord.id == bookIssue_id))
     if bookIssue is None:
         raise HTTPException(status_code=404, detail="book issues not found!")
     
-    db.query(modelTables.BookIssueRecord).filter(modelTables.BookIssueRecord.id == bookIssue_id).update({"issue_status": "returned"})
-    book_copies = db.query(modelTables.Book).filter(modelTables.Book.id == bookIssue.book_id).first().copies
-    db.query(modelTables.Book).filter(modelTables.Book.id == bookIssue.book_id).update({"copies": book_copies + 1})
-    db.query(modelTables.User).filter(modelTables.User.id == bookIssue.user_id).update({"has_issued": False})
-    db.commit()
+    copy_returned = await circulation.check_in(db, bookIssue)
+    await db.commit()
+    if copy_returned:
+        await catalog_view.refresh_book(db, bookIssue.book_id)
+        response_cache.bump("books")
+    publish_issue(bookIssue.id, bookIssue.book_id, bookIssue.user_id, "returned")
     return {"message": "Book has been returned successfully"}
 
 
+# desk scanning, a stack of books issued in one transaction with a result per item, see circulation.py
+@router.post("/bookIssues/batch_issue", status_code=status.HTTP_200_OK, tags=["bookIssue"])
+async def batch_issue_books(batch: BookIssueBatchRequest, db: db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
+    if not current_librarian:
+        raise HTTPException(401, detail="You are not authenticated")
+    if len(batch.items) > circulation.CIRCULATION_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {circulation.CIRCULATION_BATCH_SIZE} books per batch")
+
+    results = await circulation.check_out_many(db, [item.model_dump() for item in batch.items], current_librarian.librarian_id)
+    await db.commit()
+    issued = [result for result in results if result["status"] == "issued"]
+    if issued:
+        await catalog_view.refresh_books(db, {result["book_id"] for result in issued})
+        response_cache.bump("books")
+    for result in issued:
+        publish_issue(result["issue_id"], result["book_id"], result["user_id"], "issued")
+    return {"issued": len(issued), "rejected": len(results) - len(issued), "results": results}
+
+
+# desk scanning, a stack of returned books checked in in one transaction with a result per issue id
+@router.put("/bookIssues/batch_return", status_code=status.HTTP_200_OK, tags=["bookIssue"])
+async def batch_return_books(batch: BookReturnBatchRequest, db: db_dependency):
+    if len(batch.issue_ids) > circulation.CIRCULATION_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {circulation.CIRCULATION_BATCH_SIZE} books per batch")
+
+    results = await circulation.check_in_many(db, batch.issue_ids)
+    await db.commit()
+    returned = [result for result in results if result["status"] == "returned"]
+    if returned:
+        await catalog_view.refresh_books(db, {result["book_id"] for result in returned})
+        response_cache.bump("books")
+    for result in results:
+        if result["status"] != "rejected":
+            # pending requests are closed by setting them to returned as well
+            publish_issue(result["issue_id"], result["book_id"], result["user_id"], "returned")
+    return {
+        "returned": len(returned),
+        "closed": sum(result["status"] == "closed" for result in results),
+        "rejected": sum(result["status"] == "rejected" for result in results),
+        "results": results,
+    }
+
+
 # book return process    # delete bookIssues by id
-@app.delete("/bookIssues/delete_returned_book={bookIssue_id}", status_code=status.HTTP_200_OK, tags=["bookIssue"])
+@router.delete("/bookIssues/delete_returned_book={bookIssue_id}", status_code=status.HTTP_200_OK, tags=["bookIssue"])
 async def delete_returned_book(bookIssue_id: str, db: db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
     if not current_librarian:
         raise HTTPException(401, detail="You are not authenticated")
 
-    bookIssue = db.query(modelTables.BookIssueRecord).filter(modelTables.BookIssueRecord.id == bookIssue_id).first()
-    if bookIssue is None:
-        raise HTTPException(status_code=404, detail="book issues not found!")
-    if bookIssue.issue_status == "returned":
-        db.query(modelTables.BookIssueRecord).filter(modelTables.BookIssueRecord.id == bookIssue_id).delete()
-        db.commit()
-    else:
+    # the lookups only run to explain a failed delete, an archived record is returned anyway
+    if not await writes.delete_one(db, modelTables.BookIssueRecord, bookIssue_id, modelTables.BookIssueRecord.issue_status == "returned"):
+        if await writes.delete_one(db, modelTables.BookIssueArchive, bookIssue_id):
+            await db.commit()
+            change_feed.publish("issue", {"id": int(bookIssue_id), "status": "deleted"})
+            return {"message": "Returned book deleted successfully"}
+        if await db.get(modelTables.BookIssueRecord, writes.coerce_id(modelTables.BookIssueRecord, bookIssue_id)) is None:
+            raise HTTPException(status_code=404, detail="book issues not found!")
         raise HTTPException(status_code=400, detail="Book has not been returned to the library")
+    await db.commit()
+    # the book isn't known without a lookup, so only unfiltered subscribers get this one
+    change_feed.publish("issue", {"id": int(bookIssue_id), "status": "deleted"})
     return {"message": "Returned book deleted successfully"}
 
 
 # book return process   # delete bookIssues by id
-@app.delete("/bookIssues/delete_bookIssue={bookIssue_id}", status_code=status.HTTP_200_OK, tags=["bookIssue"])
+@router.delete("/bookIssues/delete_bookIssue={bookIssue_id}", status_code=status.HTTP_200_OK, tags=["bookIssue"])
 async def delete_bookIssue_by_id(bookIssue_id: str, db: db_dependency):
-    bookIssue = db.query(modelTables.BookIssueRecord).filter(modelTables.BookIssueRecord.id == bookIssue_id).first()
+    bookIssue = await db.scalar(select(modelTables.BookIssueRecord).where(modelTables.BookIssueRecord.id == bookIssue_id))
     if bookIssue is None:
-        raise HTTPException(status_code=404, detail="book issues not found!")
-    
-    db.query(modelTables.BookIssueRecord).filter(modelTables.BookIssueRecord.id == bookIssue_id).delete()
-    book_copies = db.query(modelTables.Book).filter(modelTables.Book.id == bookIssue.book_id).first().copies
-    db.query(modelTables.Book).filter(modelTables.Book.id == bookIssue.book_id).update({"copies": book_copies + 1})
-    db.query(modelTables.User).filter(modelTables.User.id == bookIssue.user_id).update({"has_issued": False})
-    db.commit()
+        if not await writes.delete_one(db, modelTables.BookIssueArchive, bookIssue_id):
+            raise HTTPException(status_code=404, detail="book issues not found!")
+        await db.commit()
+        change_feed.publish("issue", {"id": int(bookIssue_id), "status": "deleted"})
+        return {"message": "book issue details deleted successfully"}
+
+    copy_returned = await circulation.discard(db, bookIssue)
+    await db.commit()
+    if copy_returned:
+        await catalog_view.refresh_book(db, bookIssue.book_id)
+        response_cache.bump("books")
+    publish_issue(bookIssue.id, bookIssue.book_id, bookIssue.user_id, "deleted")
     return {"message": "book issue details deleted successfully"}
 
 
@@ -898,117 +1016,71 @@ async def delete_bookIssue_by_id(bookIssue_id: str, db: db_dependency):
 # _______________________________________________________searching book____________________________________________________
 # searching book by:-
 # search book by title
-@app.get("/bookSearch/get_book_by_title={title}", status_code=status.HTTP_200_OK, tags=["bookSearch"])
-async def get_book_by_title(title:str, db:db_dependency):
-    all_books = await get_books_details(db)
-    searched_books = []
-    for book in all_books:
-        if title.lower() in book["title"].lower():
-            searched_books.append(book)
-    return searched_books
+@router.get("/bookSearch/get_book_by_title={title}", status_code=status.HTTP_200_OK, tags=["bookSearch"])
+async def get_book_by_title(title:str, db: read_db_dependency):
+    return await catalog_view.search(db, {"title": title})
 
 
 # search book by author
-@app.get("/bookSearch/get_book_by_author={author}", status_code=status.HTTP_200_OK, tags=["bookSearch"])
-async def get_book_by_author(author:str, db:db_dependency):
-    all_books = await get_books_details(db)
-    search_books = []
-    for book in all_books:
-        if author.lower() in book["author"].lower():
-            search_books.append(book)
-
-    return search_books
+@router.get("/bookSearch/get_book_by_author={author}", status_code=status.HTTP_200_OK, tags=["bookSearch"])
+async def get_book_by_author(author:str, db: read_db_dependency):
+    return await catalog_view.search(db, {"author": author})
 
 
 # search book by publisher
-@app.get("/bookSearch/get_book_by_publisher={publisher}", status_code=status.HTTP_200_OK, tags=["bookSearch"])
-async def get_book_by_publisher(publisher:str, db:db_dependency):
-    all_books = await get_books_details(db)
-    search_books = []
-    for book in all_books:
-        if publisher.lower() in book["publisher"].lower():
-            search_books.append(book)
-
-    return search_books
+@router.get("/bookSearch/get_book_by_publisher={publisher}", status_code=status.HTTP_200_OK, tags=["bookSearch"])
+async def get_book_by_publisher(publisher:str, db: read_db_dependency):
+    return await catalog_view.search(db, {"publisher": publisher})
 
 
 # # search by title and author
-@app.get("/bookSearch/get_book_by_title_and_author/{title}/{author}", status_code=status.HTTP_200_OK, tags=["bookSearch"])
-async def get_books_by_title_and_author(title:str, author: str, db:db_dependency):
-    all_books = await get_books_details(db)
-    searched_books = []
-    for book in all_books:
-        if title.lower() in book["title"].lower() and author.lower() in book["author"].lower():
-            searched_books.append(book)
-            
-    return searched_books
+@router.get("/bookSearch/get_book_by_title_and_author/{title}/{author}", status_code=status.HTTP_200_OK, tags=["bookSearch"])
+async def get_books_by_title_and_author(title:str, author: str, db: read_db_dependency):
+    return await catalog_view.search(db, {"title": title, "author": author})
 
 
 # search by title and publisher
-@app.get("/bookSearch/get_book_by_title_and_publisher/{title}/{publisher}", status_code=status.HTTP_200_OK, tags=["bookSearch"])
-async def get_books_by_title_and_publisher(title:str, publisher: str, db:db_dependency):
-    all_books = await get_books_details(db)
-    searched_books = []
-
-    for book in all_books:
-        if title.lower() in book["title"].lower() and publisher.lower() in book["publisher"].lower():
-            searched_books.append(book)
-            
-    return searched_books
+@router.get("/bookSearch/get_book_by_title_and_publisher/{title}/{publisher}", status_code=status.HTTP_200_OK, tags=["bookSearch"])
+async def get_books_by_title_and_publisher(title:str, publisher: str, db: read_db_dependency):
+    return await catalog_view.search(db, {"title": title, "publisher": publisher})
 
 
 # search by title, author and publisher
-@app.get("/bookSearch/get_book_by_title_author_publisher/{title}/{author}/{publisher}", status_code= status.HTTP_200_OK, tags=["bookSearch"])
-async def get_book_by_title_author_publisher(db:db_dependency, title:str, author: str, publisher: str):
-    all_books = await get_books_details(db)
-    searched_books = []
-
-    for book in all_books:
-        if title.lower() in book["title"].lower() and author.lower() in book["author"].lower() and publisher.lower() in book["publisher"].lower():
-            searched_books.append(book)
-
-    return searched_books
+@router.get("/bookSearch/get_book_by_title_author_publisher/{title}/{author}/{publisher}", status_code= status.HTTP_200_OK, tags=["bookSearch"])
+async def get_book_by_title_author_publisher(db: read_db_dependency, title:str, author: str, publisher: str):
+    return await catalog_view.search(db, {"title": title, "author": author, "publisher": publisher})
 
 
 # search by title or author or publisher
-@app.get("/bookSearch/get_searched_Books/search={search}", status_code=status.HTTP_200_OK, tags=["bookSearch"])
-async def get_searched_books(search:str, db:db_dependency):
-    all_books = await get_books_details(db)
-    searched_books = []
-    for book in all_books:
-        if search.lower() in book["title"].lower() or search.lower() in book["author"].lower() or search.lower() in book["publisher"].lower():
-            searched_books.append(book)
+@router.get("/bookSearch/get_searched_Books/search={search}", status_code=status.HTTP_200_OK, tags=["bookSearch"])
+async def get_searched_books(search:str, db: read_db_dependency):
+    return await catalog_view.search(db, {"title": search, "author": search, "publisher": search}, match_all=False)
 
-    return searched_books
+
+# typo tolerant search by title, author or publisher, the `limit` best matches first, e.g. "harry poter"
+@router.get("/bookSearch/fuzzy_search={search}", status_code=status.HTTP_200_OK, tags=["bookSearch"])
+async def get_fuzzy_searched_books(search: str, db: read_db_dependency, limit: Annotated[int, Query(ge=1, le=100)] = 20):
+    return await catalog_view.fuzzy_search(db, search, limit)
 
 
 # get books by categories
-@app.get("/bookSearch/get_books_by_category={cat_id}", status_code=status.HTTP_200_OK, tags=["bookSearch"])
-async def get_books_by_category(cat_id: int, db:db_dependency):
-    checkCategory = db.query(modelTables.Category).filter(modelTables.Category.id == cat_id).first()
+@router.get("/bookSearch/get_books_by_category={cat_id}", status_code=status.HTTP_200_OK, tags=["bookSearch"])
+async def get_books_by_category(cat_id: int, db: read_db_dependency):
+    checkCategory = await db.scalar(select(modelTables.Category).where(modelTables.Category.id == cat_id))
     if checkCategory is None:
         raise HTTPException(status_code=404, detail="Cateogy not found!")
     
-    all_books = await get_books_details(db)
-    searched_books = []
-
-    for book in all_books:
-        if book["category"] == checkCategory.name:
-            searched_books.append(book)
-
-    return searched_books
+    return await catalog_view.search(db, {}, category=checkCategory.name)
 
 
 # get searched book from books by category
-@app.get("/bookSearch/get_books_by_category={cat_id}/search={search}", status_code=status.HTTP_200_OK, tags=["bookSearch"])
-async def get_searchedBook_by_category(cat_id: int, search: str, db:db_dependency):
-    books_by_category = await get_books_by_category(cat_id, db)
-    searched_books = []
-    for book in books_by_category:
-        if search.lower() in book["title"].lower() or search.lower() in book["author"].lower() or search.lower() in book["publisher"].lower():
-            searched_books.append(book)
+@router.get("/bookSearch/get_books_by_category={cat_id}/search={search}", status_code=status.HTTP_200_OK, tags=["bookSearch"])
+async def get_searchedBook_by_category(cat_id: int, search: str, db: read_db_dependency):
+    checkCategory = await db.scalar(select(modelTables.Category).where(modelTables.Category.id == cat_id))
+    if checkCategory is None:
+        raise HTTPException(status_code=404, detail="Cateogy not found!")
 
-    return searched_books
+    return await catalog_view.search(db, {"title": search, "author": search, "publisher": search}, match_all=False, category=checkCategory.name)
 
 
 
@@ -1016,16 +1088,164 @@ async def get_searchedBook_by_category(cat_id: int, search: str, db:db_dependenc
 # _______________________________________________________searching user____________________________________________________
 # searching user
 # search by has_issued
-@app.get("/userSearch/get_issued_user", status_code=status.HTTP_200_OK, tags=["userSearch"])
-async def get_issued_user(db:db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
+@router.get("/userSearch/get_issued_user", status_code=status.HTTP_200_OK, tags=["userSearch"])
+async def get_issued_user(db: read_db_dependency, current_librarian: Librarian = Depends(get_current_active_librarian)):
     if not current_librarian:
         raise HTTPException(401, detail="You are not authenticated")
     
-    all_users = await get_users(db)
-    issued_users = []
-    for i in all_users:
-        if i.has_issued == True:
-            issued_users.append(i)
+    issued_users = (await db.scalars(select(modelTables.User).where(modelTables.User.has_issued == True).order_by(modelTables.User.id))).all()
     return issued_users
 
 
+
+
+
+
+# _______________________________________________________export____________________________________________________
+# bulk export of the catalog or the circulation history for reporting, see catalogExport.py
+# ?format=csv|ndjson|parquet, ?since=<X-Export-Watermark of the previous export> for incremental exports
+@router.get("/export/{dataset}", tags=["export"])
+async def export_dataset(dataset: str, db: read_db_dependency,
+                         format: Annotated[str, Query(pattern="^(csv|ndjson|parquet)$")] = "csv",
+                         since: Annotated[int, Query(ge=0)] = 0,
+                         current_librarian: Librarian = Depends(get_current_active_librarian)):
+    if not current_librarian:
+        raise HTTPException(401, detail="You are not authenticated")
+    if dataset not in EXPORT_DATASETS:
+        raise HTTPException(status_code=404, detail=f"Unknown dataset, use one of {', '.join(EXPORT_DATASETS)}")
+    try:
+        encoder = new_encoder(dataset, format)
+    except ParquetUnavailable as error:
+        raise HTTPException(status_code=501, detail=str(error))
+
+    # read before the body, so it can go in a header
+    stats = ExportStats(dataset, format, await export_watermark(db, dataset))
+
+    # the request session is closed before the body is sent, the export opens its own on the same engine
+    async def body():
+        async with AsyncSessionLocal(bind=db.bind) as export_db:
+            async for data in export_chunks(export_db, dataset, encoder, since, stats):
+                yield data
+
+    return StreamingResponse(body(), media_type=EXPORT_FORMATS[format], headers={
+        "Content-Disposition": f'attachment; filename="{dataset}.{format}"',
+        "X-Export-Watermark": str(stats.watermark),
+    })
+
+
+# _______________________________________________________change feed____________________________________________________
+# book availability and issue status changes as Server-Sent Events, see changeFeed.py
+# ?book_id= or ?category_id= narrows the stream to one book or category, without either it carries every change;
+# EventSource sends Last-Event-ID when it reconnects and the stream resumes from there
+@router.get("/changes/stream", tags=["changes"])
+async def stream_changes(request: Request, book_id: int | None = None, category_id: int | None = None):
+    if change_feed.full:
+        raise HTTPException(status_code=503, detail="Too many change feed subscribers, try again later")
+    return StreamingResponse(
+        change_feed.stream(book_id, category_id, request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# _______________________________________________________monitoring____________________________________________________
+# connection pool usage of this worker process, see poolMetrics.py
+@router.get("/stats/pool", status_code=status.HTTP_200_OK, tags=["monitoring"])
+async def get_pool_stats():
+    return {
+        "api": pool_stats(async_engine.pool),
+        "schema": pool_stats(engine.pool),
+        "replicas": [pool_stats(replica_engine.pool) for replica_engine in replica_engines],
+        "read_routing": read_routing.stats(),
+    }
+
+
+# password hashing thread pool of this worker: its size, the queue limit and the hashes in flight
+@router.get("/stats/hashing", status_code=status.HTTP_200_OK, tags=["monitoring"])
+async def get_hashing_stats():
+    return hashing_stats()
+
+
+# Prometheus metrics of this worker process, see instrumentation.py
+@router.get("/metrics", response_class=PlainTextResponse, tags=["monitoring"])
+async def get_metrics():
+    return PlainTextResponse(render_metrics(async_engine.pool), media_type="text/plain; version=0.0.4")
+
+
+# hit rates of the cached read endpoints in this worker
+@router.get("/stats/response_cache", status_code=status.HTTP_200_OK, tags=["monitoring"])
+async def get_response_cache_stats():
+    return response_cache.stats()
+
+
+# issue records archived by this worker, see archive.py
+@router.get("/stats/archive", status_code=status.HTTP_200_OK, tags=["monitoring"])
+async def get_archive_stats():
+    return archiver.stats()
+
+
+# change feed subscribers and events of this worker
+@router.get("/stats/change_feed", status_code=status.HTTP_200_OK, tags=["monitoring"])
+async def get_change_feed_stats():
+    return change_feed.stats()
+
+
+# _______________________________________________________health____________________________________________________
+# the process is up, it may still be warming up
+@router.get("/health/live", status_code=status.HTTP_200_OK, tags=["health"])
+async def get_liveness():
+    return {"status": "alive"}
+
+
+# 503 until the startup warm-up finished and while the database is unreachable
+@router.get("/health/ready", status_code=status.HTTP_200_OK, tags=["health"])
+async def get_readiness():
+    if not startup.readiness.ready:
+        return JSONResponse({"status": "starting", **startup.readiness.stats()}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    try:
+        async with async_engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+    except Exception as error:
+        return JSONResponse({"status": "database unavailable", "error": repr(error)}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return {"status": "ready", **startup.readiness.stats()}
+
+
+# _______________________________________________________app____________________________________________________
+# the warm-up runs in the background so the worker answers liveness probes while it loads
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    background = [asyncio.create_task(startup.start())]
+    if ARCHIVE_INTERVAL_SECONDS > 0:
+        background.append(asyncio.create_task(archiver.run_forever(startup.readiness.wait())))
+    try:
+        yield
+    finally:
+        for task in background:
+            task.cancel()
+        await async_engine.dispose()
+        for replica_engine in replica_engines:
+            await replica_engine.dispose()
+        engine.dispose()
+
+
+#   uvicorn main:app   or   uvicorn --factory main:create_app
+def create_app():
+    app = FastAPI(title="Library Management System", lifespan=lifespan)
+
+    #middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins = ['*'],
+        allow_credentials = True,
+        allow_methods = ["*"],
+        allow_headers = ["*"],
+        expose_headers = ["X-Export-Watermark", READ_YOUR_WRITES_HEADER],
+    )
+    app.add_middleware(ReadYourWritesMiddleware)
+    app.add_middleware(RequestMetricsMiddleware)
+
+    app.include_router(router)
+    return app
+
+
+app = create_app()
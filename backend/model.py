@@ -48,6 +48,12 @@ class BookIssueRequest(BaseModel):
     book_id: int
     user_id: int
 
+class BookIssueBatchRequest(BaseModel):
+    items: list[BookIssueRequest] = Field(min_length=1)
+
+class BookReturnBatchRequest(BaseModel):
+    issue_ids: list[int] = Field(min_length=1)
+
 class Author(BaseModel):
     name: str
 
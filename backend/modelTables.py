@@ -1,14 +1,97 @@
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, ForeignKey
-from sqlalchemy.orm import relationship
+import secrets
+from datetime import datetime
+from sqlalchemy import Boolean, Column, Integer, BigInteger, String, DateTime, ForeignKey, Index, event, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+from sqlalchemy.orm import relationship, Session
 from database import Base
 
 
+# dialect differences between MySQL and the embedded sqlite profile (only sqlite is covered by the tests):
+# - MySQL's default collation compares names case-insensitively, sqlite's doesn't unless told to
+# - MySQL never hands out a deleted AUTO_INCREMENT id again, sqlite reuses the highest rowid without AUTOINCREMENT
+def Name(length: int):
+    return String(length).with_variant(String(length, collation="NOCASE"), "sqlite")
+
+
+SQLITE_TABLE_ARGS = {"sqlite_autoincrement": True}
+
+# single row counter that versions the catalog rows (books, authors, publishers, categories and their tombstones)
+# versions are handed out at commit: a transaction writes its rows with a pending version of its own (a negative
+# random number), and right before its COMMIT it bumps the counter and stamps its pending rows with the new value;
+# the counter's row is locked from the bump to the commit only, so transactions run side by side and just their
+# commits take turns, and versions follow commit order across every worker: once a version is visible, every write
+# with a lower version has committed, see catalogSync.py
+# the counter is the last lock every transaction takes, nothing waits on a row while holding it (except the
+# tombstone pruner, which takes it first and only touches committed tombstones, see catalogSync.py)
+# `pruned_through` is the newest tombstone version garbage collected so far, clients behind it need a full copy
+class VersionClock(Base):
+    __tablename__ = "version_clock"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    version = Column(BigInteger, nullable=False, default=0)
+    pruned_through = Column(BigInteger, nullable=False, default=0)
+
+
+CLOCK_ID = 1
+current_version = select(VersionClock.version).where(VersionClock.id == CLOCK_ID).scalar_subquery()
+bump_version = update(VersionClock).where(VersionClock.id == CLOCK_ID).values(version=VersionClock.version + 1)
+
+# connection.info key: (pending version, tables written) of the transaction in progress on that connection
+PENDING_VERSIONS = "pending_versions"
+
+
+# set by the column default/onupdate, so every INSERT and UPDATE through SQLAlchemy writes the pending version of
+# its transaction and notes the table for the stamp at commit
+def pending_version(context):
+    pending = context.connection.info.setdefault(PENDING_VERSIONS, (-(secrets.randbits(62) + 1), set()))
+    pending[1].add(context.compiled.statement.table)
+    return pending[0]
+
+
+def Version():
+    return Column(BigInteger, default=pending_version, onupdate=pending_version, index=True, info={"clock": True})
+
+
+# on every engine: one bump and one UPDATE per versioned table written, through the version index, in the commit
+@event.listens_for(Engine, "commit")
+def _stamp_versions(connection):
+    pending = connection.info.pop(PENDING_VERSIONS, None)
+    if pending is None:
+        return
+    version, tables = pending
+    connection.execute(bump_version)
+    for table in tables:
+        connection.execute(update(table).where(table.c.version == version).values(version=current_version))
+
+
+# rolled back rows are gone, and so is their pending version
+@event.listens_for(Engine, "rollback")
+def _drop_pending_versions(connection):
+    connection.info.pop(PENDING_VERSIONS, None)
+
+
+@event.listens_for(Pool, "reset")
+def _reset_pending_versions(dbapi_connection, connection_record, reset_state):
+    connection_record.info.pop(PENDING_VERSIONS, None)
+
+
+# ORM objects written in a committed transaction still hold its pending version; it is expired so responses built
+# from them leave it out, the stamped version is read from the database (see catalogSync.py)
+@event.listens_for(Session, "after_commit")
+def _expire_pending_versions(session):
+    for instance in list(session.identity_map.values()):
+        if (instance.__dict__.get("version") or 0) < 0:
+            session.expire(instance, ["version"])
+
+
 class User(Base):
     __tablename__ = 'users'
+    __table_args__ = SQLITE_TABLE_ARGS
 
     id = Column(Integer, primary_key=True, index=True)
-    username = Column(String(50), unique=True)
-    email = Column(String(50), unique=True)
+    username = Column(Name(50), unique=True)
+    email = Column(Name(50), unique=True)
     password = Column(String(50))
     has_issued = Column(Boolean, default=False)
 
@@ -26,9 +109,10 @@ class User(Base):
 
 class Librarian(Base):
     __tablename__ = "librarians"
+    __table_args__ = SQLITE_TABLE_ARGS
 
     librarian_id = Column(Integer, primary_key=True, index=True)
-    librarian_name =  Column(String(50), unique=True)
+    librarian_name =  Column(Name(50), unique=True)
     password = Column(String(100), unique=True)
     active = Column(Boolean, default=False)
 
@@ -36,15 +120,27 @@ class Librarian(Base):
     book_issue_records = relationship("BookIssueRecord", back_populates="librarian")
 
 
+# sign-in sessions, only written with LIBRARY_SESSION_STORE=db, see sessions.py
+class LibrarianSession(Base):
+    __tablename__ = "librarian_sessions"
+
+    session_id = Column(String(32), primary_key=True)
+    librarian_id = Column(Integer, ForeignKey('librarians.librarian_id'))
+    expires_at = Column(DateTime)
+    revoked_at = Column(DateTime, nullable=True, index=True)
+
+
 class Book(Base):
     __tablename__ = "books"
+    __table_args__ = SQLITE_TABLE_ARGS
 
     id = Column(Integer, primary_key=True, index=True)
-    title = Column(String(50), unique=True)
+    title = Column(Name(50), unique=True)
     author = Column(Integer)
     publisher = Column(Integer)
     category = Column(Integer)
     copies = Column(Integer)
+    version = Version()
 
     # Define the book_issue_records attribute for the bidirectional relationship
     book_issue_records = relationship("BookIssueRecord", back_populates="book")
@@ -52,27 +148,56 @@ class Book(Base):
 
 class Category(Base):
     __tablename__ = "categories"
+    __table_args__ = SQLITE_TABLE_ARGS
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(50))
+    name = Column(Name(50))
+    version = Version()
 
 
 class Author(Base):
     __tablename__ = "authors"
+    __table_args__ = SQLITE_TABLE_ARGS
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(50))
+    name = Column(Name(50))
+    version = Version()
 
 
 class Publisher(Base):
     __tablename__ = "publishers"
+    __table_args__ = SQLITE_TABLE_ARGS
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(50))
+    name = Column(Name(50))
+    version = Version()
+
+
+# deleted catalog rows, so clients syncing with /catalog/changes drop them too, see catalogSync.py
+class CatalogTombstone(Base):
+    __tablename__ = "catalog_tombstones"
+    __table_args__ = SQLITE_TABLE_ARGS
+
+    id = Column(Integer, primary_key=True)
+    table_name = Column(String(20))
+    row_id = Column(Integer)
+    version = Version()
+    # age of the tombstone, catalogSync.prune_tombstones drops the old ones
+    deleted_at = Column(DateTime, default=datetime.now)
 
 
 class BookIssueRecord(Base):
     __tablename__ = "Book_issue_records"
+    __table_args__ = (
+        # a user's history newest first, and open-issue checks per user
+        Index("ix_issue_records_user_time", "user_id", "issue_time", "id"),
+        Index("ix_issue_records_user_status", "user_id", "issue_status"),
+        # returned records by age, for the archiver
+        Index("ix_issue_records_status_time", "issue_status", "issue_time"),
+        # incremental exports
+        Index("ix_issue_records_updated_at", "updated_at"),
+        SQLITE_TABLE_ARGS,
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     book_id = Column(Integer, ForeignKey('books.id'))
@@ -80,8 +205,30 @@ class BookIssueRecord(Base):
     issued_by = Column(Integer, ForeignKey('librarians.librarian_id'))
     issue_time = Column(DateTime)
     issue_status = Column(String(10))
+    # UTC time of the last write, the watermark of incremental exports (see catalogExport.py); a time rather than a
+    # version, so issuing, returning and archiving never take the version clock
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # Establishing relationships with the Book, User, and Librarian tables
     book = relationship("Book", back_populates="book_issue_records")
     user = relationship("User", back_populates="book_issue_records")
-    librarian = relationship("Librarian", back_populates="book_issue_records")
\ No newline at end of file
+    librarian = relationship("Librarian", back_populates="book_issue_records")
+
+
+# returned issue records moved out of Book_issue_records by archive.py, rows keep their ids
+# no foreign keys, archived history outlives the books and librarians it mentions
+class BookIssueArchive(Base):
+    __tablename__ = "Book_issue_archive"
+    __table_args__ = (
+        Index("ix_issue_archive_user_time", "user_id", "issue_time", "id"),
+        Index("ix_issue_archive_updated_at", "updated_at"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    book_id = Column(Integer)
+    user_id = Column(Integer)
+    issued_by = Column(Integer)
+    issue_time = Column(DateTime)
+    issue_status = Column(String(10))
+    # set when the record is archived, so incremental exports send it again as archived
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,105 @@
+import json
+from datetime import datetime
+from typing import Annotated
+from fastapi import Depends, HTTPException, Query, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, inspect, or_
+from database import AsyncSessionLocal
+
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 500
+NEXT_CURSOR_HEADER = "X-Next-After"
+
+
+# ?limit=&after= keyset pagination on id, ?stream=true for NDJSON
+# without limit/after the endpoints keep returning the full list
+class PageParams:
+    def __init__(
+        self,
+        limit: int = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+        after: int = Query(default=None),
+        stream: bool = Query(default=False),
+    ):
+        self.limit = limit
+        self.after = after
+        self.stream = stream
+
+
+page_dependency = Annotated[PageParams, Depends()]
+
+
+# apply the keyset condition, ordering and limit on `id_column` to a select
+def keyset(statement, id_column, page: PageParams):
+    if page.after is not None:
+        statement = statement.where(id_column > page.after)
+    statement = statement.order_by(id_column)
+    if page.limit is not None:
+        statement = statement.limit(page.limit)
+    return statement
+
+
+# set the cursor for the next page when this page is full
+def page_of(response: Response, items, page: PageParams, last_id):
+    if page.limit is not None and len(items) == page.limit:
+        response.headers[NEXT_CURSOR_HEADER] = str(last_id(items[-1]))
+    return items
+
+
+# ?limit=&before= pagination on (time, id), newest first
+# the cursor is "<iso time>_<id>" so rows sharing a timestamp are neither skipped nor repeated
+class TimePageParams:
+    def __init__(
+        self,
+        limit: int = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+        before: str = Query(default=None),
+        stream: bool = Query(default=False),
+    ):
+        self.limit = limit
+        self.before = parse_time_cursor(before) if before is not None else None
+        self.stream = stream
+
+
+time_page_dependency = Annotated[TimePageParams, Depends()]
+
+
+def time_cursor(time: datetime, row_id: int):
+    return f"{time.isoformat()}_{row_id}"
+
+
+def parse_time_cursor(cursor: str):
+    try:
+        time, row_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(time), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid page cursor")
+
+
+def time_keyset(statement, time_column, id_column, page: TimePageParams):
+    if page.before is not None:
+        time, row_id = page.before
+        statement = statement.where(or_(time_column < time, and_(time_column == time, id_column < row_id)))
+    statement = statement.order_by(time_column.desc(), id_column.desc())
+    if page.limit is not None:
+        statement = statement.limit(page.limit)
+    return statement
+
+
+def row_to_dict(obj):
+    return {attr.key: getattr(obj, attr.key) for attr in inspect(obj).mapper.column_attrs}
+
+
+# stream the results of a select as NDJSON with bounded memory
+# the request session is closed before the body is sent, so the stream opens its own
+# scalars=False serializes whole rows (joined column selects) instead of ORM objects
+# bind is the engine to read from, GET endpoints pass the one their request session uses (it may be a replica)
+def stream_ndjson(statement, serialize=row_to_dict, scalars=True, bind=None):
+    async def generate():
+        async with AsyncSessionLocal(bind=bind) if bind is not None else AsyncSessionLocal() as db:
+            result = await db.stream(statement.execution_options(yield_per=STREAM_CHUNK_SIZE))
+            if scalars:
+                result = result.scalars()
+            async for rows in result.partitions():
+                yield "".join(json.dumps(jsonable_encoder(serialize(row))) + "\n" for row in rows)
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
@@ -0,0 +1,55 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+# hash policy, first scheme is used for new hashes and the others are only verified
+HASH_SCHEMES = os.getenv("LIBRARY_HASH_SCHEMES", "bcrypt").split(",")
+BCRYPT_ROUNDS = int(os.getenv("LIBRARY_BCRYPT_ROUNDS", "12"))
+
+# bcrypt releases the GIL, so a small thread pool keeps hashing off the event loop
+HASH_WORKERS = int(os.getenv("LIBRARY_HASH_WORKERS", str(os.cpu_count() or 2)))
+# requests allowed to wait for a worker before new ones are rejected with 503
+HASH_QUEUE_LIMIT = int(os.getenv("LIBRARY_HASH_QUEUE_LIMIT", "64"))
+
+# hashes below the configured rounds or using a non-default scheme are upgraded on the next login
+pwd_context = CryptContext(
+    schemes=HASH_SCHEMES,
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+)
+
+_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="password-hash")
+_in_flight = 0
+
+
+async def _run_in_pool(fn, *args):
+    global _in_flight
+    if _in_flight >= HASH_WORKERS + HASH_QUEUE_LIMIT:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many sign in requests, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+
+    _in_flight += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+    finally:
+        _in_flight -= 1
+
+
+async def hash_password(password: str):
+    return await _run_in_pool(pwd_context.hash, password)
+
+
+# returns (valid, new_hash), new_hash is set when the stored hash doesn't match the current policy
+async def verify_and_update_password(password: str, hashed_password: str):
+    return await _run_in_pool(pwd_context.verify_and_update, password, hashed_password)
+
+
+# hashing pool of this worker, served on /stats/hashing
+def hashing_stats():
+    return {"workers": HASH_WORKERS, "queue_limit": HASH_QUEUE_LIMIT, "in_flight": _in_flight}
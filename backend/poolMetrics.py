@@ -0,0 +1,86 @@
+import time
+from bisect import bisect_left
+from threading import Lock
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+# upper bounds of the checkout wait histogram, in seconds
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# checkout counters of one pool, per process so every uvicorn worker reports its own pools
+class PoolMetrics:
+    def __init__(self):
+        self._lock = Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self._buckets = [0] * (len(WAIT_BUCKETS) + 1)   # last one is +Inf
+
+    def observe(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            self._buckets[bisect_left(WAIT_BUCKETS, seconds)] += 1
+
+    # cumulative bucket counts keyed by upper bound, like a Prometheus histogram
+    def histogram(self):
+        with self._lock:
+            counts, total = {}, 0
+            for bound, count in zip(WAIT_BUCKETS + ("+Inf",), self._buckets):
+                total += count
+                counts[str(bound)] = total
+            return counts
+
+
+# times every checkout, including waits that end in a timeout
+# each pool has its own metrics (the primary and every replica engine), kept when the engine recreates its pool
+class _InstrumentedPool:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.observe(time.perf_counter() - started, timed_out=True)
+            raise
+        self.metrics.observe(time.perf_counter() - started)
+        return connection
+
+
+class InstrumentedQueuePool(_InstrumentedPool, QueuePool):
+    pass
+
+
+class InstrumentedAsyncPool(_InstrumentedPool, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_stats(pool):
+    stats = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(size=pool.size(), checked_out=pool.checkedout(), checked_in=pool.checkedin(),
+                     overflow=max(pool.overflow(), 0), max_overflow=pool._max_overflow, timeout=pool.timeout())
+    metrics = getattr(pool, "metrics", None)
+    if metrics is not None:
+        stats.update(
+            checkouts=metrics.checkouts,
+            checkout_timeouts=metrics.timeouts,
+            wait_seconds_total=round(metrics.wait_seconds_total, 6),
+            wait_seconds_max=round(metrics.wait_seconds_max, 6),
+            wait_seconds_histogram=metrics.histogram(),
+        )
+    return stats
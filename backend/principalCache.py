@@ -0,0 +1,53 @@
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("LIBRARY_PRINCIPAL_CACHE_SIZE", "1024"))
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv("LIBRARY_PRINCIPAL_CACHE_TTL_SECONDS", "300"))
+
+
+# bounded LRU of verified tokens -> principal (see sessions.py), so authenticated requests skip the JWT decode
+# and the session check
+# entries never outlive the token's exp claim; a hit is still checked against sessions revoked on other workers,
+# see SessionRegistry.sync_revocations
+class PrincipalCache:
+    def __init__(self, max_size: int, ttl_seconds: int):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._lock = Lock()
+        self._entries = OrderedDict()   # token -> (expires_at, Principal)
+
+    def get(self, token: str):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            expires_at, principal = entry
+            if expires_at <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return principal
+
+    def put(self, token: str, principal, token_exp=None):
+        expires_at = time.time() + self.ttl_seconds
+        if token_exp is not None:
+            expires_at = min(expires_at, token_exp)
+
+        with self._lock:
+            self._entries[token] = (expires_at, principal)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    # a signed out token, see sign_out
+    def discard(self, token: str):
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_SECONDS)
@@ -0,0 +1,206 @@
+import inspect
+import logging
+import os
+import sys
+from functools import wraps
+from sqlalchemy import event
+
+# query budgets
+# every route declares the most SQL statements one request may run, counted on the API engine by instrumentation.py;
+# the numbers are worst cases: a principal cache miss (+1), the catalog read model loading cold or catching up with
+# other workers' writes (+2, see catalogView.py) and the response cache reading a resource's version (+1, see
+# responseCache.py) included, and writes to the catalog are versioned at commit: one bump of the version clock and one
+# stamp per versioned table written (+1 and +1 per table, see modelTables.py); issue records aren't versioned
+# the counts are measured on sqlite, which the test suite runs on; they haven't been measured on a MySQL server,
+# where a few writes take a different path (no UPDATE .. RETURNING, see merge_book_copies in main.py)
+#   LIBRARY_QUERY_BUDGETS=enforce   a request over budget (or on a route without one) raises, which fails the test
+#   LIBRARY_QUERY_BUDGETS=warn      it is only logged
+# tests can also wrap any block in `with query_budget(n):` or decorate a test with `@query_budget(n)`
+QUERY_BUDGET_MODE = os.getenv("LIBRARY_QUERY_BUDGETS", "off").lower()
+
+budget_log = logging.getLogger("library.query_budgets")
+
+# (method, route path) -> max statements per request, None means the route isn't budgeted on purpose
+ROUTE_BUDGETS = {
+    # auth-librarian
+    # sessions: +1 to record a sign in and +1 per principal cache miss (or, on a hit, a due revocation check) with
+    # LIBRARY_SESSION_STORE=db, see sessions.py
+    ("POST", "/librarians/sign_up"): 3,
+    ("POST", "/token"): 3,                      # lookup, an UPDATE for a hash upgrade and the session
+    ("GET", "/users/me"): 2,
+    ("GET", "/librariains/get_all"): 2,
+    ("GET", "/librarians/get_by_id={librarian_id}"): 2,
+    ("POST", "/librarians/sign_out"): 2,
+
+    # user
+    # writes are single statements checked by rowcount, see writes.py and `python -m benchmarks.roundtrips`
+    ("POST", "/users/"): 2,
+    ("GET", "/users/get_users"): 2,
+    ("GET", "/users/get_user_by_id={id}"): 2,
+    ("GET", "/users/check_user_in_db={user}"): 1,
+    ("PUT", "/user/update_user_name={id}"): 2,
+    ("PUT", "/users/update_user={user_id}"): 2,
+    ("DELETE", "/users/delete_user_by_id={id}"): 4,     # unlink the issue records and archived ones, delete
+
+    # book: merge copies by title, else one lookup
+    # for the author/publisher/category ids, an insert per missing one and the book insert
+    ("POST", "/books/"): 12,
+    ("POST", "/books/bulk"): None,              # grows with the number of chunks in the file
+    ("GET", "/books/get_all"): 1,
+    ("GET", "/books/get_details"): 4,
+    ("GET", "/books/get_book_by_id={book_id}"): 3,
+    ("PUT", "/books/update_book_by_id={book_id}"): 10,
+    ("DELETE", "/books/delete_book_by_id={book_id}"): 5,
+
+    # category / author / publisher, a create is one INSERT .. WHERE NOT EXISTS, a delete also writes a tombstone
+    ("POST", "/categories/"): 4,
+    ("GET", "/categories/get_all"): 2,
+    ("GET", "/categories/get_by_id={category_id}"): 1,
+    ("PUT", "/categories/update_category={category_id}"): 4,
+    ("DELETE", "/categories/delete_category={category_id}"): 5,
+    ("POST", "/authors/"): 4,
+    ("GET", "/authors/get_all"): 2,
+    ("GET", "/authors/get_by_id={author_id}"): 1,
+    ("PUT", "/authors/update_author={author_id}"): 4,
+    ("DELETE", "/authors/delete_author={author_id}"): 5,
+    ("POST", "/publishers/"): 4,
+    ("GET", "/publishers/get_all"): 2,
+    ("GET", "/publishers/get_by_id={publisher_id}"): 1,
+    ("PUT", "/publishers/update_publisher={publisher_id}"): 4,
+    ("DELETE", "/publishers/delete_publisher={publisher_id}"): 5,
+
+    # catalog sync, the version clock, one range query per table and one for the tombstones, see catalogSync.py
+    ("GET", "/catalog/changes"): 6,
+
+    # bookIssue
+    ("POST", "/bookIssues/"): 8,
+    # archived records (see archive.py) are looked for only after the live table misses
+    ("GET", "/bookIssues/get_all"): 1,
+    ("GET", "/bookIssues/get_by_id={bookIssue_id}"): 5,
+    ("GET", "/get_bookIssues_by_user={userId}"): 2,
+    ("PUT", "/update_bookIssue={bookIssue_id}"): 8,
+    ("PUT", "/bookIssues/return_bookIssue={bookIssue_id}"): 8,
+    ("DELETE", "/bookIssues/delete_returned_book={bookIssue_id}"): 5,    # a lookup only when both deletes fail
+    ("DELETE", "/bookIssues/delete_bookIssue={bookIssue_id}"): 7,
+    # batches, whatever their size: three reads, one UPDATE per table, one INSERT of the records
+    # and one catalog refresh; a batch re-planned after a concurrent change runs the reads and writes again
+    ("POST", "/bookIssues/batch_issue"): 10,
+    ("PUT", "/bookIssues/batch_return"): 7,
+
+    # bookSearch, served from the catalog read model
+    ("GET", "/bookSearch/get_book_by_title={title}"): 3,
+    ("GET", "/bookSearch/get_book_by_author={author}"): 3,
+    ("GET", "/bookSearch/get_book_by_publisher={publisher}"): 3,
+    ("GET", "/bookSearch/get_book_by_title_and_author/{title}/{author}"): 3,
+    ("GET", "/bookSearch/get_book_by_title_and_publisher/{title}/{publisher}"): 3,
+    ("GET", "/bookSearch/get_book_by_title_author_publisher/{title}/{author}/{publisher}"): 3,
+    ("GET", "/bookSearch/get_searched_Books/search={search}"): 3,
+    ("GET", "/bookSearch/fuzzy_search={search}"): 3,
+    ("GET", "/bookSearch/get_books_by_category={cat_id}"): 4,
+    ("GET", "/bookSearch/get_books_by_category={cat_id}/search={search}"): 4,
+
+    # userSearch
+    ("GET", "/userSearch/get_issued_user"): 2,
+
+    # export, the version clock for the watermark and one streamed query
+    ("GET", "/export/{dataset}"): 3,
+
+    # change feed
+    ("GET", "/changes/stream"): 0,
+
+    # health
+    ("GET", "/health/live"): 0,
+    ("GET", "/health/ready"): 1,
+
+    # monitoring and docs
+    ("GET", "/metrics"): 0,
+    ("GET", "/stats/pool"): 0,
+    ("GET", "/stats/hashing"): 0,
+    ("GET", "/stats/response_cache"): 0,
+    ("GET", "/stats/change_feed"): 0,
+    ("GET", "/stats/archive"): 0,
+    ("GET", "/openapi.json"): 0,
+    ("GET", "/docs"): 0,
+    ("GET", "/docs/oauth2-redirect"): 0,
+    ("GET", "/redoc"): 0,
+}
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+# called by the request metrics middleware for every request when budgets are on
+def check_route_budget(method: str, route: str, statements: int, sql=()):
+    if QUERY_BUDGET_MODE not in ("warn", "enforce") or route == "unmatched":
+        return
+    if (method, route) not in ROUTE_BUDGETS:
+        message = f"{method} {route} has no query budget, add it to ROUTE_BUDGETS"
+    else:
+        budget = ROUTE_BUDGETS[(method, route)]
+        if budget is None or statements <= budget:
+            return
+        message = f"{method} {route} ran {statements} statements, its budget is {budget}\n" + "\n".join(sql)
+
+    if QUERY_BUDGET_MODE == "enforce":
+        raise QueryBudgetExceeded(message)
+    budget_log.warning(message)
+
+
+# counts statements on `engine` inside a block or a (sync or async) test function
+#   with query_budget(2):
+#       client.get("/categories/get_all")
+class query_budget:
+    def __init__(self, max_statements: int, engine=None):
+        self.max_statements = max_statements
+        self.engine = engine
+        self.statements = []
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def _target(self):
+        if self.engine is None:
+            from database import async_engine
+            self.engine = async_engine
+        return getattr(self.engine, "sync_engine", self.engine)
+
+    def __enter__(self):
+        self.statements = []
+        event.listen(self._target(), "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event.remove(self._target(), "before_cursor_execute", self._on_execute)
+        if exc_type is None and len(self.statements) > self.max_statements:
+            raise QueryBudgetExceeded(
+                f"{len(self.statements)} statements, budget is {self.max_statements}\n" + "\n".join(self.statements)
+            )
+
+    def __call__(self, fn):
+        if inspect.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with query_budget(self.max_statements, self.engine):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with query_budget(self.max_statements, self.engine):
+                return fn(*args, **kwargs)
+        return wrapper
+
+
+def missing_budgets(app):
+    routes = {(method, route.path) for route in app.routes for method in getattr(route, "methods", None) or ()}
+    return sorted(route for route in routes if route not in ROUTE_BUDGETS and route[0] != "HEAD")
+
+
+# python queryBudget.py, exits with status 1 when a route has no budget
+if __name__ == "__main__":
+    from main import app
+    missing = missing_budgets(app)
+    for method, path in missing:
+        print(f"no query budget: {method} {path}")
+    sys.exit(1 if missing else 0)
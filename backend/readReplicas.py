@@ -0,0 +1,92 @@
+import itertools
+import os
+import time
+from threading import Lock
+from fastapi import Request
+from database import async_engine, replica_engines
+
+# read/write routing for the GET endpoints, see get_read_db in main.py
+# with LIBRARY_DB_REPLICA_URLS set, reads go round robin to the replicas and everything else to the primary;
+# a read goes to the primary anyway when it has to see recent writes:
+#   - the client made a successful write in the last LIBRARY_READ_YOUR_WRITES_SECONDS: the write response carries
+#     `X-Primary-Until: <unix time>` and the client sends it back on its reads until then (the frontend does, see
+#     readYourWrites.js), so this holds whichever worker serves the read; a header rather than a cookie, because the
+#     frontend is served from another origin and cookies aren't sent with its requests
+#   - the request asks for it with `X-Consistency: strong`
+#   - this worker made a write in that window, so its catalog read model and response cache aren't refilled
+#     from a replica that hasn't caught up with it
+# the window should cover the replication lag the replicas are allowed to have
+
+READ_YOUR_WRITES_SECONDS = float(os.getenv("LIBRARY_READ_YOUR_WRITES_SECONDS", "5"))
+READ_YOUR_WRITES_HEADER = "X-Primary-Until"
+CONSISTENCY_HEADER = "x-consistency"
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+_next_replica = itertools.cycle(replica_engines).__next__ if replica_engines else None
+
+
+class ReadRouting:
+    def __init__(self):
+        self._lock = Lock()
+        self.last_write = 0.0
+        self.replica_reads = 0
+        self.primary_reads = {"no_replica": 0, "header": 0, "marker": 0, "local_write": 0}
+
+    def note_write(self):
+        self.last_write = time.time()
+
+    def _primary(self, reason: str):
+        with self._lock:
+            self.primary_reads[reason] += 1
+        return async_engine
+
+    # the engine a GET request reads from
+    def engine_for(self, request: Request):
+        if _next_replica is None:
+            return self._primary("no_replica")
+        if request.headers.get(CONSISTENCY_HEADER, "").lower() == "strong":
+            return self._primary("header")
+        now = time.time()
+        try:
+            # a marker further ahead than any write response sets is made up, it mustn't pin a client for good
+            if now < float(request.headers.get(READ_YOUR_WRITES_HEADER, 0)) <= now + READ_YOUR_WRITES_SECONDS:
+                return self._primary("marker")
+        except ValueError:
+            pass
+        if now - self.last_write < READ_YOUR_WRITES_SECONDS:
+            return self._primary("local_write")
+        with self._lock:
+            self.replica_reads += 1
+            return _next_replica()
+
+    def stats(self):
+        return {
+            "replicas": len(replica_engines),
+            "read_your_writes_seconds": READ_YOUR_WRITES_SECONDS,
+            "replica_reads": self.replica_reads,
+            "primary_reads": dict(self.primary_reads),
+        }
+
+
+read_routing = ReadRouting()
+
+
+# marks successful writes: notes them for this worker and sets the header that pins the client's reads
+# to the primary; does nothing without replicas
+class ReadYourWritesMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not replica_engines or scope["method"] not in WRITE_METHODS:
+            return await self.app(scope, receive, send)
+
+        async def send_marking_writes(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                read_routing.note_write()
+                until = read_routing.last_write + READ_YOUR_WRITES_SECONDS
+                marker = (READ_YOUR_WRITES_HEADER.lower().encode(), f"{until:.3f}".encode())
+                message["headers"] = list(message.get("headers", [])) + [marker]
+            await send(message)
+
+        await self.app(scope, receive, send_marking_writes)
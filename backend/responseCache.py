@@ -0,0 +1,142 @@
+import os
+import time
+import zlib
+from collections import OrderedDict
+from threading import Lock
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+import modelTables
+
+RESPONSE_CACHE_SIZE = int(os.getenv("LIBRARY_RESPONSE_CACHE_SIZE", "256"))
+# how stale a cached resource may get with writes from other workers (or catalogIngest.py): a request at least this
+# long after the last check reads the resource's version from the database again
+RESPONSE_CACHE_REVALIDATE_SECONDS = float(os.getenv("LIBRARY_RESPONSE_CACHE_REVALIDATE_SECONDS", "1"))
+
+# resource -> the tables its responses are read from (book details join the other three), by tombstone name
+RESOURCE_TABLES = {
+    "books": {"books": modelTables.Book, "authors": modelTables.Author, "publishers": modelTables.Publisher,
+              "categories": modelTables.Category},
+    "authors": {"authors": modelTables.Author},
+    "publishers": {"publishers": modelTables.Publisher},
+    "categories": {"categories": modelTables.Category},
+}
+
+
+def _query_key(request: Request):
+    return "&".join(f"{key}={value}" for key, value in sorted(request.query_params.multi_items()))
+
+
+def _matches(if_none_match: str, etag: str):
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+# the newest version clock value (see modelTables.py) written to the resource's tables or their tombstones, in one
+# statement; a write to any of them takes a new, higher value, and pruned tombstones are covered by `pruned_through`,
+# so the version only grows and moves with every change, whichever worker made it
+def version_query(resource: str):
+    tables = RESOURCE_TABLES[resource]
+    tombstones, clock = modelTables.CatalogTombstone, modelTables.VersionClock
+    return select(
+        *(select(func.max(model.version)).scalar_subquery() for model in tables.values()),
+        select(func.max(tombstones.version)).where(tombstones.table_name.in_(tables)).scalar_subquery(),
+        select(clock.pruned_through).where(clock.id == modelTables.CLOCK_ID).scalar_subquery(),
+    )
+
+
+# serialized responses of read endpoints, tagged with the version of their resource read from the database,
+# so ETags mean the same on every worker and another worker's writes retire them too
+# the version is read again at most every RESPONSE_CACHE_REVALIDATE_SECONDS, and right away after this worker's
+# write handlers bump the resource;
+# a cached body is tagged with the version read before the data was loaded, so a write racing the load
+# can only leave behind an entry that is already out of date
+class ResponseCache:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._lock = Lock()
+        self._versions = {}             # resource -> (version, checked at)
+        self._generation = 0            # bumps so far
+        self._entries = OrderedDict()   # (resource, query) -> (version, body, headers)
+        self.hits = 0
+        self.not_modified = 0
+        self.misses = 0
+
+    # called by the write handlers after they commit, the next request reads the resource's new version
+    def bump(self, *resources: str):
+        with self._lock:
+            self._generation += 1
+            for resource in resources:
+                self._versions.pop(resource, None)
+
+    async def version(self, resource: str, db: AsyncSession):
+        known = self._versions.get(resource)
+        if known is not None and time.monotonic() - known[1] < RESPONSE_CACHE_REVALIDATE_SECONDS:
+            return known[0]
+        generation, checked_at = self._generation, time.monotonic()
+        version = max(value or 0 for value in (await db.execute(version_query(resource))).one())
+        with self._lock:
+            # the read may predate a write bumped meanwhile, the next request reads again
+            if generation == self._generation:
+                self._versions[resource] = (version, checked_at)
+        return version
+
+    def etag(self, resource: str, version: int, query: str):
+        return f'"{resource}-{version}-{zlib.crc32(query.encode()):08x}"'
+
+    # answer from the cache when possible, otherwise run `load` and cache what it returns
+    # headers `load` sets on `response` (like the next page cursor) are cached along with the body
+    async def serve(self, resource: str, db: AsyncSession, request: Request, response: Response, load):
+        query = _query_key(request)
+        key = (resource, query)
+        version = await self.version(resource, db)
+        etag = self.etag(resource, version, query)
+        cache_headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _matches(if_none_match, etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=cache_headers)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return Response(entry[1], media_type="application/json", headers={**entry[2], **cache_headers})
+
+        content = await load()
+        body = JSONResponse(jsonable_encoder(content)).body
+        headers = dict(response.headers)
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = (version, body, headers)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return Response(body, media_type="application/json", headers={**headers, **cache_headers})
+
+    # fill the entry `serve` would create for `query` without a request, used by the startup warm-up
+    async def prime(self, resource: str, db: AsyncSession, load, query: str = ""):
+        version = await self.version(resource, db)
+        body = JSONResponse(jsonable_encoder(await load())).body
+        with self._lock:
+            self._entries[(resource, query)] = (version, body, {})
+            self._entries.move_to_end((resource, query))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    # drop every cached body and version, the next request of each resource loads it
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._versions.clear()
+            self._entries.clear()
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "not_modified": self.not_modified, "misses": self.misses}
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE)
@@ -0,0 +1,94 @@
+import argparse
+import sys
+from sqlalchemy import inspect, text, select, insert, func, union_all
+from sqlalchemy.schema import CreateColumn
+import modelTables
+from database import engine
+
+# schema management, kept out of the app so workers start without DDL or a database round trip
+# run it once per deploy (or whenever modelTables changes) before starting the workers:
+#   python schema.py            creates missing tables and indexes, and the version clock row (see modelTables.py)
+#   python schema.py --check    only lists what is missing, exits with status 1 if anything is
+# columns added to an existing table are added as nullable columns, existing rows get NULL
+
+
+# columns of existing tables that the table doesn't have yet
+def missing_columns(connection):
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    missing = []
+    for table in modelTables.Base.metadata.sorted_tables:
+        if table.name in existing_tables:
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            missing += [(table, column) for column in table.columns if column.name not in existing_columns]
+    return missing
+
+
+# create_all skips tables that already exist, so columns and indexes added to existing tables are created separately
+def create_schema(connection):
+    modelTables.Base.metadata.create_all(bind=connection)
+    preparer = connection.dialect.identifier_preparer
+    for table, column in missing_columns(connection):
+        connection.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {CreateColumn(column).compile(dialect=connection.dialect)}"))
+    for table in modelTables.Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=connection, checkfirst=True)
+    create_version_clock(connection)
+
+
+def _versioned_tables():
+    return [table for table in modelTables.Base.metadata.sorted_tables
+            if "version" in table.c and table.c.version.info.get("clock", False)]
+
+
+# the version clock's single row, started at the newest version already written so versions keep growing
+def create_version_clock(connection):
+    clock = modelTables.VersionClock
+    if connection.scalar(select(clock.id).where(clock.id == modelTables.CLOCK_ID)) is not None:
+        return
+    versions = union_all(*(select(func.max(table.c.version).label("version")) for table in _versioned_tables())).subquery()
+    newest = connection.scalar(select(func.coalesce(func.max(versions.c.version), 0)))
+    connection.execute(insert(clock).values(id=modelTables.CLOCK_ID, version=newest, pruned_through=0))
+
+
+def missing_schema(connection):
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    missing = []
+    for table in modelTables.Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            missing.append(f"table {table.name}")
+            continue
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        missing += [f"column {table.name}.{column.name}" for column in table.columns if column.name not in existing_columns]
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        missing += [f"index {table.name}.{index.name}" for index in table.indexes if index.name not in existing_indexes]
+    clock = modelTables.VersionClock
+    if clock.__tablename__ in existing_tables and connection.scalar(select(clock.id).where(clock.id == modelTables.CLOCK_ID)) is None:
+        missing.append(f"row {clock.__tablename__}.id={modelTables.CLOCK_ID}")
+    return missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create the library tables and indexes")
+    parser.add_argument("--check", action="store_true", help="only report missing tables and indexes")
+    args = parser.parse_args()
+
+    try:
+        if not args.check:
+            with engine.begin() as connection:
+                create_schema(connection)
+        with engine.connect() as connection:
+            missing = missing_schema(connection)
+    finally:
+        engine.dispose()
+
+    for item in missing:
+        print(f"missing {item}")
+    if not args.check:
+        print("schema up to date" if not missing else "schema incomplete")
+    sys.exit(1 if missing else 0)
+
+
+if __name__ == "__main__":
+    main()
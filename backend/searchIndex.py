@@ -0,0 +1,131 @@
+import math
+import os
+from collections import Counter, defaultdict
+from itertools import islice
+
+NGRAM_SIZE = 3
+# share of the query's n-grams a value needs to be a fuzzy match, see SearchIndex.similar
+SEARCH_MIN_SIMILARITY = float(os.getenv("LIBRARY_SEARCH_MIN_SIMILARITY", "0.4"))
+# most values a fuzzy search verifies, bounds the work of a query made of common n-grams only, see SearchIndex.similar
+SEARCH_MAX_CANDIDATES = int(os.getenv("LIBRARY_SEARCH_MAX_CANDIDATES", "10000"))
+
+
+def ngrams(text: str, size: int = NGRAM_SIZE):
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+# n-gram inverted index answering case-insensitive substring queries, i.e. `query.lower() in value.lower()`
+# postings are kept per distinct value, so an author shared by many books is indexed only once
+#   text fields:    n-gram -> lowered values containing it, lowered value -> doc ids
+#   keyword fields: exact value -> doc ids
+class SearchIndex:
+    def __init__(self, text_fields, keyword_fields=()):
+        self.text_fields = tuple(text_fields)
+        self.keyword_fields = tuple(keyword_fields)
+        self._docs = {}
+        self._grams = {field: defaultdict(set) for field in self.text_fields}
+        self._values = {field: defaultdict(set) for field in self.text_fields + self.keyword_fields}
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _indexed_values(self, doc: dict):
+        values = {field: (doc.get(field) or "").lower() for field in self.text_fields}
+        values.update({field: doc.get(field) for field in self.keyword_fields})
+        return values
+
+    # add or replace a document
+    def add(self, doc_id, doc: dict):
+        values = self._indexed_values(doc)
+        if self._docs.get(doc_id) == values:
+            return
+        self.remove(doc_id)
+        self._docs[doc_id] = values
+
+        for field, value in values.items():
+            doc_ids = self._values[field][value]
+            if not doc_ids and field in self._grams:
+                for gram in ngrams(value):
+                    self._grams[field][gram].add(value)
+            doc_ids.add(doc_id)
+
+    def remove(self, doc_id):
+        values = self._docs.pop(doc_id, None)
+        if values is None:
+            return
+
+        for field, value in values.items():
+            doc_ids = self._values[field][value]
+            doc_ids.discard(doc_id)
+            if doc_ids:
+                continue
+            del self._values[field][value]
+            if field in self._grams:
+                for gram in ngrams(value):
+                    posting = self._grams[field][gram]
+                    posting.discard(value)
+                    if not posting:
+                        del self._grams[field][gram]
+
+    # doc ids whose `field` contains `query`, case-insensitively
+    def search(self, field: str, query: str):
+        query = query.lower()
+        values = self._values[field]
+
+        if len(query) < NGRAM_SIZE:
+            # too short to use the n-gram postings, check the distinct values instead
+            candidates = values.keys()
+        else:
+            postings = []
+            for gram in ngrams(query):
+                posting = self._grams[field].get(gram)
+                if not posting:
+                    return set()
+                postings.append(posting)
+            postings.sort(key=len)
+            candidates = postings[0].intersection(*postings[1:])
+
+        doc_ids = set()
+        for value in candidates:
+            if query in value:
+                doc_ids.update(values[value])
+        return doc_ids
+
+    # lowered values of a text `field` that share at least `min_similarity` of the query's n-grams, with their score:
+    # mostly that share (how much of the query the value contains, so "harry poter" finds "harry potter and ...") and
+    # a little the Dice coefficient, so of two values containing the query the one closer in length ranks first
+    # candidates only come from the postings of the query's rarest n-grams: a value sharing m of the query's q n-grams
+    # contains at least one of any q - m + 1 of them, the remaining postings are only intersected with the candidates
+    def similar(self, field: str, query: str, min_similarity: float = SEARCH_MIN_SIMILARITY):
+        query = " ".join(query.lower().split())
+        if not query:
+            return {}
+        query_grams = ngrams(query)
+        if not query_grams:
+            # too short for n-grams, substring matches scored the same way, by how close in length they are
+            return {value: 0.8 + 0.2 * len(query) / len(value) for value in self._values[field] if query in value}
+
+        postings = sorted((self._grams[field].get(gram, ()) for gram in query_grams), key=len)
+        needed = max(1, math.ceil(min_similarity * len(query_grams)))
+        candidates = set()
+        for posting in postings[:len(postings) - needed + 1]:
+            if len(candidates) + len(posting) > SEARCH_MAX_CANDIDATES:
+                # even the rarest n-grams are common (a single common word), check SEARCH_MAX_CANDIDATES values
+                # instead of a large part of the index: the matches found are real, not necessarily the best ones
+                candidates.update(islice(posting, SEARCH_MAX_CANDIDATES - len(candidates)))
+                break
+            candidates.update(posting)
+        shared = Counter()
+        for posting in postings:
+            shared.update(candidates.intersection(posting))
+
+        scores = {}
+        for value, count in shared.items():
+            if count >= needed:
+                value_grams = max(len(value) - NGRAM_SIZE + 1, 1)
+                scores[value] = 0.8 * count / len(query_grams) + 0.2 * 2 * count / (len(query_grams) + value_grams)
+        return scores
+
+    # doc ids whose `field` equals `value`, lowered for text fields
+    def lookup(self, field: str, value):
+        return set(self._values[field].get(value, ()))
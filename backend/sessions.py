@@ -0,0 +1,111 @@
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from sqlalchemy import select, insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
+import modelTables
+
+# librarian sign-in sessions
+# the acting librarian comes from the bearer token: sign in puts the librarian id (lid) and a session id (sid) in its
+# claims, so authenticated requests know who is at the desk without reading the librarians table
+# the registry only has to answer "was this session signed out": in this process by default, or with
+# LIBRARY_SESSION_STORE=db also in the librarian_sessions table, so a sign out reaches every worker: a worker that
+# has the token in its principal cache reads the sessions revoked since its last check, at most every
+# LIBRARY_SESSION_REVOCATION_CHECK_SECONDS, see SessionRegistry.sync_revocations
+SESSION_STORE = os.getenv("LIBRARY_SESSION_STORE", "memory").lower()
+SESSION_REVOCATION_CHECK_SECONDS = float(os.getenv("LIBRARY_SESSION_REVOCATION_CHECK_SECONDS", "2"))
+# revoked_at comes from each worker's clock and a revoke may commit after a later one, so every check reads back
+# this far before the newest revocation it has seen
+REVOCATION_OVERLAP = timedelta(seconds=60)
+
+
+# who is acting, built from the token claims
+class Principal:
+    __slots__ = ("librarian_id", "librarian_name", "session_id", "expires_at")
+
+    def __init__(self, librarian_id: int, librarian_name: str, session_id=None, expires_at=None):
+        self.librarian_id = librarian_id
+        self.librarian_name = librarian_name
+        self.session_id = session_id
+        self.expires_at = expires_at    # the token's exp claim, epoch seconds
+
+
+class SessionRegistry:
+    def __init__(self, store: str):
+        self.store = store
+        self._lock = Lock()
+        self._revoked = {}   # session id -> token expiry, forgotten once the token has expired anyway
+        self._revoked_through = None    # newest revoked_at read from the table
+        self._synced_at = 0.0
+
+    # a new session id for a sign in, recorded in the table with the db store; the caller commits
+    async def open(self, db: AsyncSession, librarian_id, expires_at: datetime):
+        session_id = uuid.uuid4().hex
+        if self.store == "db":
+            await db.execute(insert(modelTables.LibrarianSession).values(
+                session_id=session_id, librarian_id=librarian_id, expires_at=expires_at,
+            ))
+        return session_id
+
+    # sign out; the caller commits
+    async def revoke(self, db: AsyncSession, session_id: str, expires_at=None):
+        self._remember({session_id: expires_at})
+        if self.store == "db":
+            await db.execute(
+                update(modelTables.LibrarianSession)
+                .where(modelTables.LibrarianSession.session_id == session_id, modelTables.LibrarianSession.revoked_at.is_(None))
+                .values(revoked_at=datetime.now())
+            )
+
+    # session id -> token expiry (epoch seconds, None when unknown) of revoked sessions
+    def _remember(self, revoked: dict):
+        now = time.time()
+        with self._lock:
+            for expired in [sid for sid, until in self._revoked.items() if until <= now]:
+                del self._revoked[expired]
+            for session_id, expires_at in revoked.items():
+                self._revoked[session_id] = expires_at if expires_at is not None else now + 86400
+
+    # with the db store, learn about sessions other workers revoked, so principals cached here stop working too;
+    # one query through the revoked_at index, at most every SESSION_REVOCATION_CHECK_SECONDS
+    async def sync_revocations(self, db: AsyncSession):
+        if self.store != "db" or time.monotonic() - self._synced_at < SESSION_REVOCATION_CHECK_SECONDS:
+            return
+        # claimed before the query, so concurrent requests don't check too
+        self._synced_at = time.monotonic()
+        sessions = modelTables.LibrarianSession
+        query = select(sessions.session_id, sessions.expires_at, sessions.revoked_at).where(sessions.revoked_at.is_not(None))
+        if self._revoked_through is None:
+            # the first check only needs the sessions whose tokens still work
+            query = query.where(sessions.expires_at > datetime.utcnow())
+        else:
+            query = query.where(sessions.revoked_at >= self._revoked_through - REVOCATION_OVERLAP)
+        rows = (await db.execute(query)).all()
+        # expires_at is stored in UTC, see open_session in main.py
+        self._remember({row.session_id: row.expires_at.replace(tzinfo=timezone.utc).timestamp() if row.expires_at else None
+                        for row in rows})
+        newest = max((row.revoked_at for row in rows), default=None)
+        if newest is not None and (self._revoked_through is None or newest > self._revoked_through):
+            self._revoked_through = newest
+        elif self._revoked_through is None:
+            self._revoked_through = datetime.now() - REVOCATION_OVERLAP
+
+    # signed out through this process, or seen revoked by sync_revocations; no database involved
+    def revoked_here(self, session_id: str):
+        return session_id in self._revoked
+
+    # with the db store a session also has to exist and not be revoked in the table, one primary key lookup
+    async def is_revoked(self, db: AsyncSession, session_id: str):
+        if self.revoked_here(session_id):
+            return True
+        if self.store != "db":
+            return False
+        session = (await db.execute(
+            select(modelTables.LibrarianSession.revoked_at).where(modelTables.LibrarianSession.session_id == session_id)
+        )).first()
+        return session is None or session.revoked_at is not None
+
+
+session_registry = SessionRegistry(SESSION_STORE)
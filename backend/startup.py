@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import os
+import time
+from sqlalchemy import select, text
+import modelTables
+from catalogView import catalog_view
+from database import async_engine, AsyncSessionLocal, DB_POOL_SIZE
+from responseCache import response_cache
+from schema import create_schema, missing_schema
+
+# work done by the app's lifespan, see create_app in main.py
+# importing the app touches no database; the lifespan starts a background warm-up and the worker reports
+# ready on /health/ready once it is done, so the load balancer only sends traffic to warm workers
+
+# create missing tables on startup, for development and single-node sqlite; otherwise run `python schema.py` before
+# starting the workers, a worker finding tables or columns missing logs what is missing and stays not ready until then
+CREATE_SCHEMA_ON_STARTUP = os.getenv("LIBRARY_CREATE_SCHEMA", "false").lower() in ("1", "true", "yes")
+# load the catalog read model and the lookup lists before reporting ready
+WARMUP = os.getenv("LIBRARY_WARMUP", "true").lower() in ("1", "true", "yes")
+# seconds between startup attempts while the database is unreachable
+STARTUP_RETRY_SECONDS = float(os.getenv("LIBRARY_STARTUP_RETRY_SECONDS", "2"))
+
+# response cache resource -> table of the lookup lists served by /<resource>/get_all
+LOOKUP_TABLES = {
+    "categories": modelTables.Category,
+    "authors": modelTables.Author,
+    "publishers": modelTables.Publisher,
+}
+
+startup_log = logging.getLogger("library.startup")
+
+
+class SchemaMissing(RuntimeError):
+    pass
+
+
+# tables and columns the app can't run without; missing indexes only make it slower and are just logged
+async def check_schema():
+    async with async_engine.connect() as connection:
+        missing = await connection.run_sync(missing_schema)
+    indexes = [item for item in missing if item.startswith("index ")]
+    if indexes:
+        startup_log.warning("missing indexes, run `python schema.py`: %s", ", ".join(indexes))
+    required = [item for item in missing if not item.startswith("index ")]
+    if required:
+        raise SchemaMissing(f"the database schema is missing {', '.join(required)}; run `python schema.py` "
+                            "(or start with LIBRARY_CREATE_SCHEMA=true for development)")
+
+
+class Readiness:
+    def __init__(self):
+        self.ready = False
+        self.attempts = 0
+        self.last_error = None
+        self.warmup_seconds = None
+        self._event = asyncio.Event()
+
+    def mark_ready(self, seconds: float):
+        self.ready = True
+        self.warmup_seconds = round(seconds, 3)
+        self._event.set()
+
+    async def wait(self):
+        await self._event.wait()
+
+    def stats(self):
+        return {"ready": self.ready, "attempts": self.attempts, "warmup_seconds": self.warmup_seconds, "last_error": self.last_error}
+
+
+readiness = Readiness()
+
+
+# open the pool's connections up front so the first requests don't pay for connecting
+async def _open_pool():
+    async def ping():
+        async with async_engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(ping() for _ in range(max(DB_POOL_SIZE, 1))))
+
+
+async def warm_up():
+    await _open_pool()
+    async with AsyncSessionLocal() as db:
+        await catalog_view.get_all(db)
+        for resource, table in LOOKUP_TABLES.items():
+            async def load(table=table):
+                return (await db.scalars(select(table).order_by(table.id))).all()
+            await response_cache.prime(resource, db, load)
+
+
+# retries until the database answers, a worker started during a database blip becomes ready once it is back
+async def start():
+    started = time.perf_counter()
+    while True:
+        readiness.attempts += 1
+        try:
+            if CREATE_SCHEMA_ON_STARTUP:
+                async with async_engine.begin() as connection:
+                    await connection.run_sync(create_schema)
+            else:
+                await check_schema()
+            if WARMUP:
+                await warm_up()
+            else:
+                await _open_pool()
+        except SchemaMissing as error:
+            readiness.last_error = str(error)
+            startup_log.error("startup attempt %d: %s, retrying in %ss", readiness.attempts, error, STARTUP_RETRY_SECONDS)
+            await asyncio.sleep(STARTUP_RETRY_SECONDS)
+            continue
+        except Exception as error:
+            readiness.last_error = repr(error)
+            startup_log.warning("startup attempt %d failed, retrying in %ss: %r", readiness.attempts, STARTUP_RETRY_SECONDS, error)
+            await asyncio.sleep(STARTUP_RETRY_SECONDS)
+            continue
+        readiness.last_error = None
+        readiness.mark_ready(time.perf_counter() - started)
+        startup_log.info("ready after %.0fms", readiness.warmup_seconds * 1000)
+        return
@@ -0,0 +1,74 @@
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+# the app reads its settings when it is imported, so they are set before anything imports main:
+# a scratch sqlite file, budgets enforced (a request over its budget raises inside the test client),
+# cheap password hashes, no background archiving while statements are counted, sessions in the database and no
+# principal cache, so every authenticated request pays for its session check like a cache miss would, and a catalog
+# read model and response cache that check the database for other workers' writes on every read
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DB_PATH = Path(tempfile.mkdtemp(prefix="library-tests-")) / "library.db"
+os.environ["LIBRARY_DB_URL"] = f"sqlite:///{DB_PATH}"
+os.environ.pop("LIBRARY_ASYNC_DB_URL", None)
+os.environ.pop("LIBRARY_DB_REPLICA_URLS", None)
+os.environ["LIBRARY_CREATE_SCHEMA"] = "true"
+os.environ["LIBRARY_QUERY_BUDGETS"] = "enforce"
+os.environ["LIBRARY_ARCHIVE_INTERVAL_SECONDS"] = "0"
+os.environ["LIBRARY_PRINCIPAL_CACHE_SIZE"] = "0"
+os.environ["LIBRARY_SESSION_STORE"] = "db"
+os.environ["LIBRARY_CATALOG_VIEW_REVALIDATE_SECONDS"] = "0"
+os.environ["LIBRARY_RESPONSE_CACHE_REVALIDATE_SECONDS"] = "0"
+os.environ.setdefault("LIBRARY_BCRYPT_ROUNDS", "4")
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+# one app and one database for the whole run, like a single worker
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as client:
+        deadline = time.monotonic() + 30
+        while client.get("/health/ready").status_code != 200:
+            assert time.monotonic() < deadline, "the app never became ready"
+            time.sleep(0.05)
+        yield client
+
+
+@pytest.fixture(scope="session")
+def auth(client):
+    client.post("/librarians/sign_up", data={"username": "desk", "password": "desk"})
+    token = client.post("/token", data={"username": "desk", "password": "desk"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+# (method, route) -> statements of every request the budget check saw, see queryBudget.check_route_budget
+@pytest.fixture(scope="session")
+def budgeted_requests(client):
+    import instrumentation
+
+    seen = {}
+    check = instrumentation.check_route_budget
+
+    def recording_check(method, route, statements, sql=()):
+        seen.setdefault((method, route), []).append(statements)
+        check(method, route, statements, sql)
+
+    instrumentation.check_route_budget = recording_check
+    yield seen
+    instrumentation.check_route_budget = check
+
+
+# SQL statements run on the API engine, for tests that compare one request against its budget
+@pytest.fixture(scope="session")
+def query_counter(client):
+    from benchmarks.suite import QueryCounter
+    from database import async_engine
+
+    return QueryCounter(async_engine)
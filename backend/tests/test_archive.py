@@ -0,0 +1,78 @@
+from datetime import datetime
+
+from sqlalchemy import func, select, update
+
+import modelTables
+from archive import archiver
+from database import engine
+
+# older than anything the other tests issue, so only this test's records are old enough to archive
+OLD = datetime(1970, 6, 1)
+CUTOFF_DAYS = (datetime.now() - datetime(1971, 1, 1)).days
+
+
+def issue_and_return(client, auth, book_id, user_id, keep=False):
+    issue_id = client.post("/bookIssues/", json={"book_id": book_id, "user_id": user_id}, headers=auth).json()["id"]
+    if not keep:
+        assert client.put(f"/bookIssues/return_bookIssue={issue_id}", headers=auth).status_code == 200
+    return issue_id
+
+
+def ids_in(model, ids):
+    with engine.connect() as connection:
+        return set(connection.scalars(select(model.id).where(model.id.in_(ids))))
+
+
+# old returned records move to the archive in batches, the open loan and the recent return stay; an archived record
+# keeps its fields and is still served by get_by_id, get_all and the user's history, and can be deleted
+def test_archiving_moves_old_returned_records(client, auth):
+    book_id = client.post("/books/", json={"title": "Archive book", "author": "Archive author",
+                                           "publisher": "Archive press", "category": "Archive", "copies": 1},
+                          headers=auth).json()["id"]
+    user_id = client.post("/users/", json={"username": "archivist", "email": "archivist@example.com", "password": "x"},
+                          headers=auth).json()["id"]
+    old_ids = [issue_and_return(client, auth, book_id, user_id) for _ in range(3)]
+    recent_id = issue_and_return(client, auth, book_id, user_id)
+    open_id = issue_and_return(client, auth, book_id, user_id, keep=True)
+    with engine.begin() as connection:
+        connection.execute(update(modelTables.BookIssueRecord)
+                           .where(modelTables.BookIssueRecord.id.in_(old_ids + [open_id])).values(issue_time=OLD))
+    before = {issue_id: client.get(f"/bookIssues/get_by_id={issue_id}", headers=auth).json() for issue_id in old_ids}
+
+    # batches of two: a full one, then the last record
+    assert client.portal.call(lambda: archiver.run(CUTOFF_DAYS, batch_size=2)) == 3
+    assert ids_in(modelTables.BookIssueRecord, old_ids + [recent_id, open_id]) == {recent_id, open_id}
+    assert ids_in(modelTables.BookIssueArchive, old_ids + [recent_id, open_id]) == set(old_ids)
+    assert client.portal.call(lambda: archiver.run(CUTOFF_DAYS, batch_size=2)) == 0
+
+    for issue_id in old_ids:
+        assert client.get(f"/bookIssues/get_by_id={issue_id}", headers=auth).json() == before[issue_id]
+    all_ids = {row["id"] for row in client.get("/bookIssues/get_all").json()}
+    assert set(old_ids + [recent_id, open_id]) <= all_ids
+    history = client.get(f"/get_bookIssues_by_user={user_id}").json()
+    assert sorted(row["id"] for row in history) == sorted(old_ids + [recent_id, open_id])
+
+    assert client.delete(f"/bookIssues/delete_returned_book={old_ids[0]}", headers=auth).status_code == 200
+    assert client.delete(f"/bookIssues/delete_bookIssue={old_ids[1]}").status_code == 200
+    assert client.get(f"/bookIssues/get_by_id={old_ids[0]}", headers=auth).status_code == 404
+    assert ids_in(modelTables.BookIssueArchive, old_ids) == {old_ids[2]}
+
+
+# deleting a user unlinks their archived records like their live ones
+def test_deleted_users_are_unlinked_from_the_archive(client, auth):
+    book_id = client.post("/books/", json={"title": "Archive book 2", "author": "Archive author",
+                                           "publisher": "Archive press", "category": "Archive", "copies": 1},
+                          headers=auth).json()["id"]
+    user_id = client.post("/users/", json={"username": "archived reader", "email": "archived.reader@example.com",
+                                           "password": "x"}, headers=auth).json()["id"]
+    issue_id = issue_and_return(client, auth, book_id, user_id)
+    with engine.begin() as connection:
+        connection.execute(update(modelTables.BookIssueRecord).where(modelTables.BookIssueRecord.id == issue_id)
+                           .values(issue_time=OLD))
+    assert client.portal.call(lambda: archiver.run(CUTOFF_DAYS)) == 1
+
+    assert client.delete(f"/users/delete_user_by_id={user_id}", headers=auth).status_code == 200
+    with engine.connect() as connection:
+        assert connection.scalar(select(func.count()).where(modelTables.BookIssueArchive.user_id == user_id)) == 0
+    [row] = [row for row in client.get("/bookIssues/get_all").json() if row["id"] == issue_id]
+    assert (row["bookname"], row["username"]) == ("Archive book 2", None)
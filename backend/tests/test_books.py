@@ -0,0 +1,80 @@
+REFS = (("categories", "category"), ("authors", "author"), ("publishers", "publisher"))
+
+
+def ok(response, status_code=200):
+    assert response.status_code == status_code, (response.request.method, str(response.request.url), response.text)
+    return response.json()
+
+
+def book_request(title, copies=1, **names):
+    return {"title": title, "author": "Shelf author", "publisher": "Shelf press", "category": "Shelf", "copies": copies,
+            **names}
+
+
+# a second POST of a title adds its copies, an update can move a book to new names, unknown ids are 404s
+def test_books_are_merged_updated_and_deleted(client, auth):
+    book_id = ok(client.post("/books/", json=book_request("Shelf book", 2), headers=auth))["id"]
+    assert ok(client.post("/books/", json=book_request("Shelf book", 3), headers=auth))["id"] == book_id
+    assert ok(client.get(f"/books/get_book_by_id={book_id}")) == {
+        "id": book_id, "title": "Shelf book", "author": "Shelf author", "publisher": "Shelf press",
+        "category": "Shelf", "copies": 5}
+
+    moved = book_request("Shelf book", 4, author="Shelf author 2", category="Shelf 2")
+    ok(client.put(f"/books/update_book_by_id={book_id}", json=moved, headers=auth))
+    details = ok(client.get(f"/books/get_book_by_id={book_id}"))
+    assert (details["author"], details["category"], details["copies"]) == ("Shelf author 2", "Shelf 2", 4)
+    # a failed update doesn't leave the names it created behind
+    ok(client.put("/books/update_book_by_id=999999", json=book_request("Shelf gone", author="Shelf orphan"),
+                  headers=auth), 404)
+    assert "Shelf orphan" not in [author["name"] for author in ok(client.get("/authors/get_all"))]
+
+    ok(client.delete(f"/books/delete_book_by_id={book_id}", headers=auth))
+    ok(client.get(f"/books/get_book_by_id={book_id}"), 404)
+    ok(client.delete(f"/books/delete_book_by_id={book_id}", headers=auth), 404)
+    assert book_id not in [book["id"] for book in ok(client.get("/books/get_details"))]
+    ok(client.post("/books/", json=book_request("Shelf anonymous")), 401)
+
+
+# authors, publishers and categories: names are unique, a rename shows in the details and searches of their books
+# right away and a deleted one leaves its books without that name
+def test_reference_data_renames_and_deletes_reach_the_books(client, auth):
+    book_id = ok(client.post("/books/", json=book_request("Ref book", author="Ref author", publisher="Ref publisher",
+                                                          category="Ref category"), headers=auth))["id"]
+    for plural, singular in REFS:
+        created = ok(client.post(f"/{plural}/", json={"name": f"Ref new {singular}"}, headers=auth))
+        assert ok(client.get(f"/{plural}/get_by_id={created['id']}"))["name"] == f"Ref new {singular}"
+        ok(client.post(f"/{plural}/", json={"name": f"ref NEW {singular}"}, headers=auth), 404)
+
+        ref_id = next(ref["id"] for ref in ok(client.get(f"/{plural}/get_all")) if ref["name"] == f"Ref {singular}")
+        ok(client.put(f"/{plural}/update_{singular}={ref_id}", json={"name": f"Ref {singular} renamed"}, headers=auth))
+        assert ok(client.get(f"/books/get_book_by_id={book_id}"))[singular] == f"Ref {singular} renamed"
+        ok(client.put(f"/{plural}/update_{singular}=999999", json={"name": "Ref nothing"}, headers=auth), 404)
+
+    category_id = next(ref["id"] for ref in ok(client.get("/categories/get_all")) if ref["name"] == "Ref category renamed")
+    assert [book["id"] for book in ok(client.get(f"/bookSearch/get_books_by_category={category_id}"))] == [book_id]
+    assert ok(client.get(f"/bookSearch/get_books_by_category={category_id}/search=author renamed")) == [
+        ok(client.get(f"/books/get_book_by_id={book_id}"))]
+    assert ok(client.get(f"/bookSearch/get_books_by_category={category_id}/search=elsewhere")) == []
+    ok(client.get("/bookSearch/get_books_by_category=999999"), 404)
+    assert [book["id"] for book in ok(client.get(
+        "/bookSearch/get_book_by_title_author_publisher/ref book/author renamed/publisher renamed"))] == [book_id]
+
+    for plural, singular in REFS:
+        ref_id = next(ref["id"] for ref in ok(client.get(f"/{plural}/get_all")) if ref["name"] == f"Ref {singular} renamed")
+        ok(client.delete(f"/{plural}/delete_{singular}={ref_id}", headers=auth))
+        ok(client.delete(f"/{plural}/delete_{singular}={ref_id}", headers=auth), 404)
+        assert ok(client.get(f"/books/get_book_by_id={book_id}"))[singular] is None
+
+
+# writes answer with the id and the values they wrote; the row version is only stamped at commit, so it isn't in them
+def test_writes_answer_with_what_they_wrote(client, auth):
+    created = ok(client.post("/authors/", json={"name": "Written author"}, headers=auth))
+    assert created == {"id": created["id"], "name": "Written author"}
+    renamed = ok(client.put(f"/authors/update_author={created['id']}", json={"name": "Written author 2"}, headers=auth))
+    assert renamed == {"id": created["id"], "name": "Written author 2"}
+
+    book_id = ok(client.post("/books/", json=book_request("Written book", author="Written author 2"), headers=auth))["id"]
+    updated = ok(client.put(f"/books/update_book_by_id={book_id}", json=book_request("Written book", 3), headers=auth))
+    assert set(updated) == {"id", "title", "author", "publisher", "category", "copies"}
+    assert (updated["id"], updated["copies"]) == (book_id, 3)
+    assert ok(client.get(f"/books/get_book_by_id={book_id}"))["copies"] == 3
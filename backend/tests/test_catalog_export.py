@@ -0,0 +1,75 @@
+from datetime import datetime
+
+import orjson
+from sqlalchemy import update
+
+import catalogExport
+import modelTables
+from archive import archive_batch
+from database import AsyncSessionLocal, engine
+
+
+def export(client, auth, dataset, since=0):
+    response = client.get(f"/export/{dataset}?format=ndjson&since={since}", headers=auth)
+    assert response.status_code == 200, response.text
+    rows = [orjson.loads(line) for line in response.content.splitlines()]
+    return rows, int(response.headers["X-Export-Watermark"])
+
+
+# the catalog watermark is the version clock, the issues one the time of the export, so an incremental export has
+# every row written after the previous one, changed rows included, and nothing else
+def test_incremental_exports_follow_the_watermark(client, auth, monkeypatch):
+    # without the overlap, the records of the previous export would come again
+    monkeypatch.setattr(catalogExport, "EXPORT_ISSUE_OVERLAP_SECONDS", 0)
+    book = {"title": "Export book", "author": "Export author", "publisher": "Export press", "category": "Export",
+            "copies": 2}
+    book_id = client.post("/books/", json=book, headers=auth).json()["id"]
+    user_id = client.post("/users/", json={"username": "exporter", "email": "exporter@example.com", "password": "x"},
+                          headers=auth).json()["id"]
+    issue_id = client.post("/bookIssues/", json={"book_id": book_id, "user_id": user_id}, headers=auth).json()["id"]
+
+    books, catalog_watermark = export(client, auth, "catalog")
+    assert book_id in [row["id"] for row in books]
+    issues, issues_watermark = export(client, auth, "issues")
+    assert issue_id in [row["id"] for row in issues]
+    assert export(client, auth, "catalog", catalog_watermark)[0] == []
+    assert export(client, auth, "issues", issues_watermark)[0] == []
+
+    # an existing record changes status, an author is renamed: both rows come again
+    assert client.put(f"/bookIssues/return_bookIssue={issue_id}", headers=auth).status_code == 200
+    author_id = next(row["author_id"] for row in books if row["id"] == book_id)
+    assert client.put(f"/authors/update_author={author_id}", json={"name": "Export author renamed"},
+                      headers=auth).status_code == 200
+
+    issues, next_watermark = export(client, auth, "issues", issues_watermark)
+    assert [(row["id"], row["issue_status"]) for row in issues] == [(issue_id, "returned")]
+    assert next_watermark > issues_watermark
+    books, _ = export(client, auth, "catalog", catalog_watermark)
+    assert [(row["id"], row["author"], row["copies"]) for row in books] == [(book_id, "Export author renamed", 2)]
+
+
+# archiving moves a record out of the live table, the next incremental export has it again as archived
+def test_archived_records_come_again(client, auth, monkeypatch):
+    monkeypatch.setattr(catalogExport, "EXPORT_ISSUE_OVERLAP_SECONDS", 0)
+    book_id = client.post("/books/", json={"title": "Archived export book", "author": "Export author",
+                                           "publisher": "Export press", "category": "Export", "copies": 1},
+                          headers=auth).json()["id"]
+    user_id = client.post("/users/", json={"username": "archived exporter", "email": "archived.exporter@example.com",
+                                           "password": "x"}, headers=auth).json()["id"]
+    issue_id = client.post("/bookIssues/", json={"book_id": book_id, "user_id": user_id}, headers=auth).json()["id"]
+    assert client.put(f"/bookIssues/return_bookIssue={issue_id}", headers=auth).status_code == 200
+    # older than anything the other tests issue, so only this record is archived
+    with engine.begin() as connection:
+        connection.execute(update(modelTables.BookIssueRecord).where(modelTables.BookIssueRecord.id == issue_id)
+                           .values(issue_time=datetime(2000, 1, 1)))
+    _, watermark = export(client, auth, "issues")
+
+    async def archive():
+        async with AsyncSessionLocal() as db:
+            archived = await archive_batch(db, datetime(2001, 1, 1), 10)
+            await db.commit()
+            return archived
+
+    assert client.portal.call(archive) == 1
+    issues, _ = export(client, auth, "issues", watermark)
+    assert [(row["id"], row["issue_status"], row["archived"]) for row in issues] == [(issue_id, "returned", True)]
@@ -0,0 +1,59 @@
+import orjson
+
+
+def ingest(client, auth, filename, content, **params):
+    response = client.post("/books/bulk", params=params, files={"file": (filename, content)}, headers=auth)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def details(client, title):
+    return [book for book in client.get("/books/get_details").json() if book["title"] == title]
+
+
+# a CSV in chunks of two rows: names are created once and reused across chunks, a title repeated in the file or
+# already in the catalog merges its copies, and every bad row is reported with its line while the rest go in
+def test_csv_ingest_in_chunks(client, auth):
+    assert client.post("/books/", json={"title": "Ingest old", "author": "Ingest author", "publisher": "Ingest press",
+                                        "category": "Ingest", "copies": 2}, headers=auth).status_code == 200
+    rows = [
+        "title,author,publisher,category,copies",
+        "Ingest one,Ingest author,Ingest press,Ingest,1",
+        "Ingest two,Ingest author,Ingest press,Ingest new,3",
+        "Ingest old,Ingest author,Ingest press,Ingest,4",
+        "Ingest bad,Ingest author,Ingest press,Ingest,many",
+        "Ingest three,Ingest author 2,Ingest press,Ingest new,1",
+        "Ingest missing,Ingest author",
+        "INGEST ONE,Ingest author,Ingest press,Ingest,5",
+    ]
+    stats = ingest(client, auth, "books.csv", "\n".join(rows) + "\n", chunk_size=2)
+
+    assert {key: stats[key] for key in ("rows", "inserted", "merged", "invalid", "chunks")} == {
+        "rows": 7, "inserted": 3, "merged": 2, "invalid": 2, "chunks": 3}
+    assert (stats["authors_created"], stats["publishers_created"], stats["categories_created"]) == (1, 0, 1)
+    assert [error["line"] for error in stats["errors"]] == [5, 7]
+
+    assert [book["copies"] for book in details(client, "Ingest old")] == [6]
+    assert [book["copies"] for book in details(client, "Ingest one")] == [6]
+    [two] = details(client, "Ingest two")
+    assert (two["author"], two["publisher"], two["category"], two["copies"]) == (
+        "Ingest author", "Ingest press", "Ingest new", 3)
+    assert details(client, "Ingest bad") == details(client, "Ingest missing") == []
+    authors = [author["name"] for author in client.get("/authors/get_all").json()]
+    assert authors.count("Ingest author") == 1 and authors.count("Ingest author 2") == 1
+
+
+def test_jsonl_ingest_reports_bad_lines(client, auth):
+    book = {"title": "Ingest json", "author": "Ingest json author", "publisher": "Ingest press", "category": "Ingest"}
+    lines = [orjson.dumps(book), b"{not json", b"", orjson.dumps({**book, "title": "Ingest json 2", "copies": 2}),
+             orjson.dumps({"title": "Ingest json 3"})]
+    stats = ingest(client, auth, "books.jsonl", b"\n".join(lines) + b"\n")
+    assert (stats["rows"], stats["inserted"], stats["invalid"], stats["chunks"]) == (4, 2, 2, 1)
+    assert [error["line"] for error in stats["errors"]] == [2, 5]
+    assert [book["copies"] for book in details(client, "Ingest json 2")] == [2]
+
+
+def test_ingest_needs_a_known_format(client, auth):
+    response = client.post("/books/bulk", files={"file": ("books.txt", "title\n")}, headers=auth)
+    assert response.status_code == 400
+    assert ingest(client, auth, "books.txt", "title,author,publisher,category\n", format="csv")["rows"] == 0
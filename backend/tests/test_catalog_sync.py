@@ -0,0 +1,54 @@
+from catalogSync import prune_tombstones
+from database import AsyncSessionLocal
+
+
+def changes(client, since):
+    response = client.get(f"/catalog/changes?since={since}")
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def prune_all(client):
+    async def prune():
+        async with AsyncSessionLocal() as db:
+            pruned = await prune_tombstones(db, days=0)
+            await db.commit()
+            return pruned
+
+    # on the app's event loop, the engine's connections belong to it
+    return client.portal.call(prune)
+
+
+# versions come from the version clock, so a delta has exactly the writes committed after `since`
+def test_changes_follow_the_version_clock(client, auth):
+    # since=0 asks for a full copy, so the clock has to have moved
+    client.post("/categories/", json={"name": "Sync start"}, headers=auth)
+    start = changes(client, 0)
+    assert start["full"]
+
+    book = {"title": "Sync book", "author": "Sync author", "publisher": "Sync press", "category": "Sync", "copies": 1}
+    book_id = client.post("/books/", json=book, headers=auth).json()["id"]
+    added = changes(client, start["version"])
+    assert not added["full"] and added["version"] > start["version"]
+    assert [row["id"] for row in added["books"]] == [book_id]
+    assert {row["name"] for row in added["authors"]} == {"Sync author"}
+    assert all(row["version"] <= added["version"] for row in added["books"])
+    assert changes(client, added["version"])["books"] == []
+
+    assert client.delete(f"/books/delete_book_by_id={book_id}", headers=auth).status_code == 200
+    deleted = changes(client, added["version"])
+    assert deleted["deleted"]["books"] == [book_id] and deleted["books"] == []
+
+
+# a client that missed tombstones which have since been dropped gets a full copy
+def test_pruned_tombstones_force_a_full_copy(client, auth):
+    author_id = client.post("/authors/", json={"name": "Pruned author"}, headers=auth).json()["id"]
+    before = changes(client, 0)["version"]
+    assert client.delete(f"/authors/delete_author={author_id}", headers=auth).status_code == 200
+    assert changes(client, before)["deleted"]["authors"] == [author_id]
+
+    assert prune_all(client) >= 1
+    after_prune = changes(client, before)
+    assert after_prune["full"] and after_prune["deleted"]["authors"] == []
+    assert author_id not in [row["id"] for row in after_prune["authors"]]
+    assert not changes(client, after_prune["version"])["full"]
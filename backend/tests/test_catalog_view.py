@@ -0,0 +1,98 @@
+from sqlalchemy import insert, update
+
+import modelTables
+from catalogSync import record_delete
+from database import AsyncSessionLocal, engine
+
+
+def book_details(client, book_id):
+    return client.get(f"/books/get_book_by_id={book_id}")
+
+
+# another worker, or catalogIngest.py, writing past this worker's read model; it goes through the version clock
+# like any write (see modelTables.py), so the read model picks it up on its next check
+def test_read_model_follows_other_workers_writes(client, auth):
+    book = {"title": "Shared book", "author": "Shared author", "publisher": "Shared press", "category": "Shared",
+            "copies": 4}
+    book_id = client.post("/books/", json=book, headers=auth).json()["id"]
+    assert book_details(client, book_id).json()["copies"] == 4
+
+    with engine.begin() as connection:
+        connection.execute(update(modelTables.Book).where(modelTables.Book.id == book_id).values(copies=1))
+        connection.execute(update(modelTables.Author).where(modelTables.Author.name == "Shared author")
+                           .values(name="Shared author relabelled"))
+        new_id = connection.execute(insert(modelTables.Book).values(
+            title="Ingested book", author=None, publisher=None, category=None, copies=2)).inserted_primary_key[0]
+
+    details = book_details(client, book_id).json()
+    assert (details["copies"], details["author"]) == (1, "Shared author relabelled")
+    assert book_details(client, new_id).json()["title"] == "Ingested book"
+    assert [row["id"] for row in client.get("/bookSearch/get_book_by_author=relabelled").json()] == [book_id]
+
+    async def delete_elsewhere():
+        async with AsyncSessionLocal() as db:
+            await db.execute(modelTables.Book.__table__.delete().where(modelTables.Book.id == new_id))
+            await record_delete(db, "books", new_id)
+            await db.commit()
+
+    client.portal.call(delete_elsewhere)
+    assert book_details(client, new_id).status_code == 404
+
+
+# a worker's first read loads the read model, a read after another write catches up and the next one is served warm;
+# all three answer the same, and within the route's budget
+def test_cold_catch_up_and_warm_reads_agree(client, auth):
+    from catalogView import catalog_view
+    from responseCache import response_cache
+
+    book = {"title": "Tiered book", "author": "Tiered author", "publisher": "Tiered press", "category": "Tiered",
+            "copies": 2}
+    book_id = client.post("/books/", json=book, headers=auth).json()["id"]
+    category_id = next(ref["id"] for ref in client.get("/categories/get_all").json() if ref["name"] == "Tiered")
+    writes = iter(range(1_000_000))
+
+    for path in (f"/books/get_book_by_id={book_id}", "/books/get_all", "/books/get_details", "/categories/get_all",
+                 f"/categories/get_by_id={category_id}", "/bookSearch/get_book_by_title=Tiered book",
+                 "/bookSearch/get_book_by_author=Tiered author", "/bookSearch/get_book_by_publisher=Tiered press",
+                 "/bookSearch/get_book_by_title_author_publisher/Tiered book/Tiered author/Tiered press",
+                 "/bookSearch/get_searched_Books/search=tiered", "/bookSearch/fuzzy_search=tierd bok",
+                 f"/bookSearch/get_books_by_category={category_id}/search=tiered"):
+        catalog_view.invalidate()
+        response_cache.clear()
+        cold = client.get(path)
+        # a write to an unrelated table moves the version clock
+        client.post("/publishers/", json={"name": f"Tiered clock {next(writes)}"}, headers=auth)
+        caught_up = client.get(path)
+        warm = client.get(path)
+        assert cold.status_code == caught_up.status_code == warm.status_code == 200, path
+        assert cold.json() == caught_up.json() == warm.json(), path
+        assert "Tiered" in cold.text, path
+
+
+# books reach the view in any order (an import with explicit ids, another worker's older write), pages stay in id
+# order and skip removed books
+def test_pages_stay_in_id_order(client, auth):
+    from catalogView import CatalogView
+
+    view = CatalogView()
+
+    async def page(after=None, limit=None):
+        async with AsyncSessionLocal() as db:
+            return [book["id"] for book in await view.page(db, after, limit)]
+
+    async def get_all():
+        async with AsyncSessionLocal() as db:
+            return [book["id"] for book in await view.get_all(db)]
+
+    loaded = client.portal.call(page)
+    assert loaded == sorted(loaded) and loaded
+    top = loaded[-1]
+    for book_id in (top + 20, top + 10, -5, top + 15):
+        view.put_book(book_id, {"title": f"Placed {book_id}", "copies": 1, "author": None, "publisher": None,
+                                "category": None}, None, None, None)
+    view.remove_book(top + 10)
+    view.remove_book(top + 99)
+
+    assert client.portal.call(page) == [-5, *loaded, top + 15, top + 20]
+    assert client.portal.call(lambda: page(top, 2)) == [top + 15, top + 20]
+    assert client.portal.call(get_all) == [-5, *loaded, top + 15, top + 20]
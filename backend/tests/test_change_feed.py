@@ -0,0 +1,102 @@
+import asyncio
+import json
+
+import changeFeed
+from changeFeed import change_feed
+
+FRAME_TIMEOUT_SECONDS = 5
+
+
+# one subscriber of the feed, read on the app's event loop like the /changes/stream body (the HTTP stream never ends)
+class Subscriber:
+    def __init__(self, client, **params):
+        self.client = client
+        self.stream = change_feed.stream(**params)
+        assert self.frame() == f"retry: {changeFeed.CHANGE_FEED_RETRY_MS}\n\n"
+
+    def frame(self):
+        async def next_frame():
+            return await asyncio.wait_for(self.stream.__anext__(), FRAME_TIMEOUT_SECONDS)
+        return self.client.portal.call(next_frame)
+
+    # (event id, kind, data) of the next event
+    def event(self):
+        fields = dict(line.split(": ", 1) for line in self.frame().strip().split("\n"))
+        return fields["id"], fields["event"], json.loads(fields["data"])
+
+    def close(self):
+        self.client.portal.call(self.stream.aclose)
+
+
+def add_book(client, auth, title, category):
+    return client.post("/books/", json={"title": title, "author": "Feed author", "publisher": "Feed press",
+                                        "category": category, "copies": 2}, headers=auth).json()["id"]
+
+
+# a checkout sends the book's new copies and the issue's status, a deleted book its id; a subscription for one book
+# sees only that book's events
+def test_checkouts_and_returns_are_pushed(client, auth):
+    watched = add_book(client, auth, "Feed watched", "Feed watched")
+    other = add_book(client, auth, "Feed other", "Feed other")
+    user_id = client.post("/users/", json={"username": "feed reader", "email": "feed@example.com", "password": "x"},
+                          headers=auth).json()["id"]
+    book_feed, everything = Subscriber(client, book_id=watched), Subscriber(client)
+    try:
+        # the other book first, only the unfiltered feed gets it
+        client.put(f"/books/update_book_by_id={other}", json={
+            "title": "Feed other", "author": "Feed author", "publisher": "Feed press", "category": "Feed other",
+            "copies": 5}, headers=auth)
+        _, kind, data = everything.event()
+        assert (kind, data["id"], data["copies"]) == ("book", other, 5)
+
+        issue_id = client.post("/bookIssues/", json={"book_id": watched, "user_id": user_id}, headers=auth).json()["id"]
+        for feed in (book_feed, everything):
+            _, kind, data = feed.event()
+            assert (kind, data["id"], data["copies"]) == ("book", watched, 1)
+            _, kind, data = feed.event()
+            assert (kind, data) == ("issue", {"id": issue_id, "book_id": watched, "user_id": user_id, "status": "issued"})
+
+        client.put(f"/bookIssues/return_bookIssue={issue_id}", headers=auth)
+        for feed in (book_feed, everything):
+            assert [feed.event()[1:] for _ in range(2)] == [
+                ("book", {"id": watched, "title": "Feed watched", "author": "Feed author", "publisher": "Feed press",
+                          "category": "Feed watched", "copies": 2}),
+                ("issue", {"id": issue_id, "book_id": watched, "user_id": user_id, "status": "returned"}),
+            ]
+
+        client.delete(f"/books/delete_book_by_id={other}", headers=auth)
+        assert everything.event()[1:] == ("book_removed", {"id": other})
+    finally:
+        book_feed.close()
+        everything.close()
+
+
+# a client reconnecting with Last-Event-ID gets the events it missed, one with an id this process doesn't know
+# (another worker, an earlier run) is told to resync
+def test_reconnect_resumes_from_last_event_id(client, auth):
+    feed = Subscriber(client)
+    try:
+        first = add_book(client, auth, "Feed resumed", "Feed resumed")
+        last_event_id, _, data = feed.event()
+        assert data["id"] == first
+    finally:
+        feed.close()
+
+    second = add_book(client, auth, "Feed missed", "Feed missed")
+    resumed = Subscriber(client, last_event_id=last_event_id)
+    try:
+        _, kind, data = resumed.event()
+        assert (kind, data["id"]) == ("book", second)
+    finally:
+        resumed.close()
+
+    stranger = Subscriber(client, last_event_id="elsewhere-12")
+    try:
+        assert stranger.event()[1] == "resync"
+    finally:
+        stranger.close()
+
+
+def test_a_full_feed_turns_subscribers_away(client, monkeypatch):
+    monkeypatch.setattr(changeFeed, "CHANGE_FEED_MAX_SUBSCRIBERS", 0)
+    assert client.get("/changes/stream").status_code == 503
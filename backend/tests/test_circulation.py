@@ -0,0 +1,58 @@
+def ok(response, status_code=200):
+    assert response.status_code == status_code, (response.request.method, str(response.request.url), response.text)
+    return response.json()
+
+
+def copies(client, book_id):
+    return ok(client.get(f"/books/get_book_by_id={book_id}"))["copies"]
+
+
+def status_of(client, auth, issue_id):
+    return ok(client.get(f"/bookIssues/get_by_id={issue_id}", headers=auth))["issue_status"]
+
+
+# an anonymous request waits as pending without taking a copy, a librarian approves it, the return puts the copy
+# back and only a returned record can be deleted as returned
+def test_request_approve_return_delete(client, auth):
+    book_id = ok(client.post("/books/", json={"title": "Desk book", "author": "Desk author", "publisher": "Desk press",
+                                              "category": "Desk", "copies": 2}, headers=auth))["id"]
+    user_id = ok(client.post("/users/", json={"username": "desk reader", "email": "desk.reader@example.com",
+                                              "password": "x"}, headers=auth), 201)["id"]
+
+    issue_id = ok(client.post("/bookIssues/", json={"book_id": book_id, "user_id": user_id}))["id"]
+    assert (status_of(client, auth, issue_id), copies(client, book_id)) == ("pending", 2)
+    ok(client.post("/bookIssues/", json={"book_id": book_id, "user_id": user_id}, headers=auth), 400)
+    ok(client.delete(f"/bookIssues/delete_returned_book={issue_id}", headers=auth), 400)
+
+    approved = ok(client.put(f"/update_bookIssue={issue_id}", headers=auth))
+    desk_id = next(librarian["librarian_id"] for librarian in ok(client.get("/librariains/get_all", headers=auth))
+                   if librarian["librarian_name"] == "desk")
+    assert (approved["issue_status"], approved["issued_by"]) == ("issued", desk_id)
+    assert copies(client, book_id) == 1
+    ok(client.put("/update_bookIssue=999999", headers=auth), 404)
+
+    ok(client.put(f"/bookIssues/return_bookIssue={issue_id}", headers=auth))
+    assert (status_of(client, auth, issue_id), copies(client, book_id)) == ("returned", 2)
+    ok(client.put(f"/bookIssues/return_bookIssue={issue_id}", headers=auth), 400)
+    ok(client.put("/bookIssues/return_bookIssue=999999", headers=auth), 404)
+
+    ok(client.delete(f"/bookIssues/delete_returned_book={issue_id}", headers=auth))
+    ok(client.get(f"/bookIssues/get_by_id={issue_id}", headers=auth), 404)
+    ok(client.delete(f"/bookIssues/delete_returned_book={issue_id}", headers=auth), 404)
+
+
+# deleting a loan that is still out puts its copy back and frees the reader
+def test_deleting_an_open_loan_puts_the_copy_back(client, auth):
+    book_id = ok(client.post("/books/", json={"title": "Desk book 2", "author": "Desk author", "publisher": "Desk press",
+                                              "category": "Desk", "copies": 1}, headers=auth))["id"]
+    user_id = ok(client.post("/users/", json={"username": "desk reader 2", "email": "desk.reader2@example.com",
+                                              "password": "x"}, headers=auth), 201)["id"]
+    issue_id = ok(client.post("/bookIssues/", json={"book_id": book_id, "user_id": user_id}, headers=auth))["id"]
+    assert copies(client, book_id) == 0
+    # no copy left for anyone else
+    ok(client.post("/bookIssues/", json={"book_id": book_id, "user_id": 999999}, headers=auth), 400)
+
+    ok(client.delete(f"/bookIssues/delete_bookIssue={issue_id}"))
+    assert copies(client, book_id) == 1
+    ok(client.delete(f"/bookIssues/delete_bookIssue={issue_id}"), 404)
+    assert ok(client.get(f"/users/get_user_by_id={user_id}", headers=auth))["has_issued"] is False
@@ -0,0 +1,69 @@
+import sqlite3
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from conftest import DB_PATH
+
+COPIES = 3
+READERS = 12
+ROUNDS = 4
+
+
+def book_copies(book_id):
+    with sqlite3.connect(DB_PATH, timeout=30) as connection:
+        return connection.execute("SELECT copies FROM books WHERE id = ?", (book_id,)).fetchone()[0]
+
+
+# many desks issuing and returning one hot book at once: every checkout is a conditional UPDATE (see
+# circulation.py), so copies never go below zero and end up at what was issued and not returned;
+# every loan is also returned twice at the same time and only one of the returns may put the copy back
+def test_concurrent_issue_and_return_of_one_book(client, auth):
+    book = {"title": "Hot book", "author": "Hot author", "publisher": "Hot press", "category": "Hot", "copies": COPIES}
+    book_id = client.post("/books/", json=book, headers=auth).json()["id"]
+    user_ids = [
+        client.post("/users/", json={"username": f"hot reader {n}", "email": f"hot{n}@example.com", "password": "x"},
+                    headers=auth).json()["id"]
+        for n in range(READERS)
+    ]
+
+    outcomes = Counter()
+    lock = threading.Lock()
+    done = threading.Event()
+    lowest = [COPIES]
+
+    def watch_copies():
+        while not done.is_set():
+            lowest[0] = min(lowest[0], book_copies(book_id))
+
+    def desk(user_id, returns):
+        for round_number in range(ROUNDS):
+            issued = client.post("/bookIssues/", json={"book_id": book_id, "user_id": user_id}, headers=auth)
+            assert issued.status_code in (200, 400), issued.text
+            with lock:
+                outcomes["issued" if issued.status_code == 200 else "unavailable"] += 1
+            # the last round keeps the book
+            if issued.status_code != 200 or round_number == ROUNDS - 1:
+                continue
+            path = f"/bookIssues/return_bookIssue={issued.json()['id']}"
+            for returned in returns.map(lambda _: client.put(path, headers=auth), range(2)):
+                assert returned.status_code in (200, 400), returned.text
+                with lock:
+                    outcomes["returned" if returned.status_code == 200 else "returned twice"] += 1
+
+    watcher = threading.Thread(target=watch_copies)
+    watcher.start()
+    try:
+        with ThreadPoolExecutor(READERS) as desks, ThreadPoolExecutor(READERS * 2) as returns:
+            for future in [desks.submit(desk, user_id, returns) for user_id in user_ids]:
+                future.result()
+    finally:
+        done.set()
+        watcher.join()
+
+    assert outcomes["unavailable"] > 0
+    assert outcomes["returned"] == outcomes["returned twice"]
+    assert lowest[0] >= 0
+    assert 0 <= outcomes["issued"] - outcomes["returned"] <= COPIES
+    assert book_copies(book_id) == COPIES - (outcomes["issued"] - outcomes["returned"])
+    assert client.get(f"/books/get_book_by_id={book_id}").json()["copies"] == book_copies(book_id)
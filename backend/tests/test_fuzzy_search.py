@@ -0,0 +1,51 @@
+from searchIndex import SearchIndex
+
+TITLES = {
+    1: "Harry Potter and the Philosopher's Stone",
+    2: "Harry Potter and the Chamber of Secrets",
+    3: "Harriet the Spy",
+    4: "The Lord of the Rings",
+    5: "Potter's Field",
+    6: "Harry Potter",
+}
+
+
+def fuzzy(client, query, limit=None):
+    response = client.get(f"/bookSearch/fuzzy_search={query}" + (f"?limit={limit}" if limit else ""))
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+# values containing more of the query score higher, and of two that contain all of it the shorter one ranks first
+def test_similar_scores_by_shared_ngrams():
+    index = SearchIndex(text_fields=("title",))
+    for book_id, title in TITLES.items():
+        index.add(book_id, {"title": title})
+
+    scores = index.similar("title", "harry poter")
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    assert ranked[0] == "harry potter"
+    assert set(ranked[1:3]) == {TITLES[1].lower(), TITLES[2].lower()}
+    assert "the lord of the rings" not in scores
+    assert scores[TITLES[1].lower()] > scores.get(TITLES[3].lower(), 0)
+    # queries too short for n-grams fall back to substring matches
+    assert set(index.similar("title", "sp")) == {TITLES[3].lower()}
+    assert index.similar("title", "   ") == {}
+
+
+# misspelt queries find the books, best first with a score, limited to `limit`; a title match outranks an equally
+# good author match
+def test_fuzzy_search_ranks_books(client, auth):
+    for title, author in (("Fuzzy Gardening Basics", "Fuzzy Writer"), ("Fuzzy Gardening for Experts", "Fuzzy Writer"),
+                          ("Cooking at Home", "Fuzzy Gardening Basics")):
+        client.post("/books/", json={"title": title, "author": author, "publisher": "Fuzzy press",
+                                     "category": "Fuzzy", "copies": 1}, headers=auth)
+
+    results = fuzzy(client, "fuzy gardenning basics")
+    assert [book["title"] for book in results[:3]] == ["Fuzzy Gardening Basics", "Cooking at Home",
+                                                       "Fuzzy Gardening for Experts"]
+    scores = [book["score"] for book in results]
+    assert scores == sorted(scores, reverse=True) and 0 < scores[-1] and scores[0] <= 1
+    assert [book["title"] for book in fuzzy(client, "fuzy gardenning basics", limit=1)] == ["Fuzzy Gardening Basics"]
+    assert fuzzy(client, "qqqqqqqq") == []
+    assert client.get("/bookSearch/fuzzy_search=x?limit=0").status_code == 422
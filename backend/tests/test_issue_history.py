@@ -0,0 +1,74 @@
+from datetime import datetime
+
+import orjson
+from sqlalchemy import update
+
+import modelTables
+from archive import archive_batch
+from database import AsyncSessionLocal, engine
+from pagination import NEXT_CURSOR_HEADER
+
+# issue times of the records, two pairs share a time so the id breaks the tie; the oldest two are archived, the
+# others are newer than what the other tests archive
+ISSUE_TIMES = [datetime(1980, 1, 1), datetime(1980, 1, 2), datetime(2010, 1, 1), datetime(2010, 1, 1),
+               datetime(2010, 6, 1), datetime(2015, 1, 1), datetime(2015, 1, 1)]
+
+
+def history(client, user_id, query=""):
+    response = client.get(f"/get_bookIssues_by_user={user_id}?{query}")
+    assert response.status_code == 200, response.text
+    return response
+
+
+# a user's history, live and archived records together, comes newest first on (issue_time, id) in pages of any
+# size without skipping or repeating the records that share a time, and streams in the same order
+def test_history_pages_newest_first(client, auth):
+    book_id = client.post("/books/", json={"title": "History book", "author": "History author",
+                                           "publisher": "History press", "category": "History", "copies": 2},
+                          headers=auth).json()["id"]
+    user_id, other_id = (client.post("/users/", json={"username": name, "email": f"{name}@example.com", "password": "x"},
+                                     headers=auth).json()["id"] for name in ("historian", "other historian"))
+    # a user holds one book at a time, every loan but the last is returned
+    issue_ids = []
+    for _ in ISSUE_TIMES:
+        if issue_ids:
+            assert client.put(f"/bookIssues/return_bookIssue={issue_ids[-1]}", headers=auth).status_code == 200
+        issue_ids.append(client.post("/bookIssues/", json={"book_id": book_id, "user_id": user_id},
+                                     headers=auth).json()["id"])
+    client.post("/bookIssues/", json={"book_id": book_id, "user_id": other_id}, headers=auth)
+    with engine.begin() as connection:
+        for issue_id, issue_time in zip(issue_ids, ISSUE_TIMES):
+            connection.execute(update(modelTables.BookIssueRecord).where(modelTables.BookIssueRecord.id == issue_id)
+                               .values(issue_time=issue_time))
+
+    async def archive():
+        async with AsyncSessionLocal() as db:
+            archived = await archive_batch(db, datetime(1981, 1, 1), 10)
+            await db.commit()
+            return archived
+
+    assert client.portal.call(archive) == 2
+
+    newest_first = sorted(zip(ISSUE_TIMES, issue_ids), reverse=True)
+    expected = [issue_id for _, issue_id in newest_first]
+    full = history(client, user_id).json()
+    assert [row["id"] for row in full] == expected
+    assert NEXT_CURSOR_HEADER not in history(client, user_id).headers
+
+    for limit in (1, 2, 3):
+        ids, cursor = [], None
+        while True:
+            response = history(client, user_id, f"limit={limit}" + (f"&before={cursor}" if cursor else ""))
+            ids += [row["id"] for row in response.json()]
+            cursor = response.headers.get(NEXT_CURSOR_HEADER)
+            if cursor is None:
+                break
+        assert ids == expected, limit
+
+    streamed = [orjson.loads(line) for line in history(client, user_id, "stream=true").content.splitlines()]
+    assert [row["id"] for row in streamed] == expected
+
+
+def test_history_of_unknown_user(client):
+    assert client.get("/get_bookIssues_by_user=999999").status_code == 404
+    assert client.get("/get_bookIssues_by_user=1?before=yesterday").status_code == 400
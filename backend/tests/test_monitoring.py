@@ -0,0 +1,32 @@
+import pytest
+
+
+# every request is counted per route template, with its statements, so /metrics has one series per route
+def test_metrics_count_requests_per_route(client):
+    client.get("/books/get_book_by_id=999999")
+    client.get("/books/get_book_by_id=999998")
+    metrics = client.get("/metrics")
+    assert metrics.status_code == 200 and metrics.headers["content-type"].startswith("text/plain")
+    series = [line for line in metrics.text.splitlines() if "/books/get_book_by_id={book_id}" in line]
+    assert series and "get_book_by_id=999999" not in metrics.text
+
+
+@pytest.mark.parametrize("path, keys", [
+    ("/stats/pool", {"api", "schema", "replicas", "read_routing"}),
+    ("/stats/hashing", {"workers", "queue_limit", "in_flight"}),
+    ("/stats/change_feed", {"subscribers", "published", "overflowed", "history"}),
+    ("/stats/archive", {"archived", "runs", "after_days", "interval_seconds"}),
+])
+def test_stats(client, path, keys):
+    response = client.get(path)
+    assert response.status_code == 200
+    assert keys <= set(response.json())
+
+
+def test_health_and_docs(client):
+    assert client.get("/health/live").json() == {"status": "alive"}
+    assert client.get("/health/ready").status_code == 200
+    assert client.get("/stats/response_cache").status_code == 200
+    assert "/books/get_details" in client.get("/openapi.json").json()["paths"]
+    for path in ("/docs", "/docs/oauth2-redirect", "/redoc"):
+        assert client.get(path).status_code == 200
@@ -0,0 +1,62 @@
+import orjson
+
+from pagination import NEXT_CURSOR_HEADER
+
+
+# every page through the X-Next-After cursor, until a page comes back without one
+def walk(client, path, limit, headers=None):
+    rows, after, pages = [], None, 0
+    while True:
+        query = f"limit={limit}" + (f"&after={after}" if after is not None else "")
+        response = client.get(f"{path}?{query}", headers=headers)
+        assert response.status_code == 200, response.text
+        page = response.json()
+        assert len(page) <= limit
+        rows += page
+        pages += 1
+        after = response.headers.get(NEXT_CURSOR_HEADER)
+        if after is None:
+            return rows, pages
+        assert int(after) == page[-1]["id"]
+
+
+def stream(client, path, headers=None):
+    response = client.get(f"{path}?stream=true", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    return [orjson.loads(line) for line in response.content.splitlines()]
+
+
+# paging, streaming and the full list give the same rows in id order, none skipped or repeated
+def test_keyset_pages_and_streams_match_the_full_list(client, auth):
+    for n in range(7):
+        client.post("/books/", json={"title": f"Paged book {n}", "author": "Paged author", "publisher": "Paged press",
+                                     "category": f"Paged {n}", "copies": 1}, headers=auth)
+        client.post("/users/", json={"username": f"paged {n}", "email": f"paged{n}@example.com", "password": "x"},
+                    headers=auth)
+
+    for path, headers in (("/books/get_details", None), ("/books/get_all", None), ("/categories/get_all", None),
+                          ("/users/get_users", auth)):
+        full = client.get(path, headers=headers).json()
+        assert NEXT_CURSOR_HEADER not in client.get(path, headers=headers).headers
+        ids = [row["id"] for row in full]
+        assert ids == sorted(ids) and len(ids) >= 7
+
+        for limit in (1, 3, len(full)):
+            rows, pages = walk(client, path, limit, headers)
+            assert [row["id"] for row in rows] == ids, (path, limit)
+            # a last page that happens to be full needs one more, empty, request
+            assert pages == len(full) // limit + 1
+        # served again from the response cache, the cursor comes with it
+        assert walk(client, path, 3, headers)[0] == full
+
+        streamed = stream(client, path, headers)
+        assert [row["id"] for row in streamed] == ids
+        if path == "/books/get_details":
+            assert streamed == full
+
+
+def test_a_page_after_the_last_id_is_empty(client):
+    last_id = client.get("/books/get_details").json()[-1]["id"]
+    response = client.get(f"/books/get_details?limit=5&after={last_id}")
+    assert response.json() == [] and NEXT_CURSOR_HEADER not in response.headers
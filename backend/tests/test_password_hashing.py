@@ -0,0 +1,45 @@
+from passlib.context import CryptContext
+from passlib.hash import sha256_crypt
+from sqlalchemy import select, update
+
+import modelTables
+import passwordHashing
+from database import engine
+
+
+def stored_hash(username):
+    with engine.connect() as connection:
+        return connection.scalar(select(modelTables.Librarian.password)
+                                 .where(modelTables.Librarian.librarian_name == username))
+
+
+def sign_in(client, username, password):
+    return client.post("/token", data={"username": username, "password": password}).status_code
+
+
+# the policy moves on (more bcrypt rounds, bcrypt instead of an older scheme): a stored hash that doesn't meet it
+# is replaced on the next successful sign in, and only then
+def test_sign_in_upgrades_legacy_hashes(client, monkeypatch):
+    client.post("/librarians/sign_up", data={"username": "legacy desk", "password": "pw"})
+    legacy = stored_hash("legacy desk")
+    rounds = passwordHashing.BCRYPT_ROUNDS
+    assert legacy.startswith(f"$2b${rounds:02d}$")
+
+    monkeypatch.setattr(passwordHashing, "pwd_context", CryptContext(
+        schemes=["bcrypt", "sha256_crypt"], deprecated="auto",
+        bcrypt__default_rounds=rounds + 1, bcrypt__min_rounds=rounds + 1,
+    ))
+    assert sign_in(client, "legacy desk", "wrong") == 401
+    assert stored_hash("legacy desk") == legacy
+
+    assert sign_in(client, "legacy desk", "pw") == 200
+    upgraded = stored_hash("legacy desk")
+    assert upgraded.startswith(f"$2b${rounds + 1:02d}$")
+    assert sign_in(client, "legacy desk", "pw") == 200
+    assert stored_hash("legacy desk") == upgraded
+
+    with engine.begin() as connection:
+        connection.execute(update(modelTables.Librarian).where(modelTables.Librarian.librarian_name == "legacy desk")
+                           .values(password=sha256_crypt.hash("pw")))
+    assert sign_in(client, "legacy desk", "pw") == 200
+    assert stored_hash("legacy desk").startswith(f"$2b${rounds + 1:02d}$")
@@ -0,0 +1,69 @@
+import logging
+
+import pytest
+
+import queryBudget
+from main import app
+from queryBudget import QueryBudgetExceeded, ROUTE_BUDGETS, missing_budgets, query_budget
+
+# every test runs with LIBRARY_QUERY_BUDGETS=enforce (see conftest.py), so each request the other test files make
+# is held to its route's budget; these tests cover the machinery itself
+
+
+def test_every_route_has_a_budget_and_every_budget_a_route():
+    assert missing_budgets(app) == []
+    routes = {(method, route.path) for route in app.routes for method in getattr(route, "methods", None) or ()}
+    assert sorted(set(ROUTE_BUDGETS) - routes) == []
+
+
+def test_a_request_over_budget_raises_when_enforced_and_is_logged_when_warned(client, monkeypatch, caplog):
+    monkeypatch.setitem(ROUTE_BUDGETS, ("GET", "/categories/get_all"), -1)
+    with pytest.raises(QueryBudgetExceeded, match=r"GET /categories/get_all ran \d+ statements, its budget is -1"):
+        client.get("/categories/get_all")
+
+    monkeypatch.setattr(queryBudget, "QUERY_BUDGET_MODE", "warn")
+    with caplog.at_level(logging.WARNING, logger="library.query_budgets"):
+        assert client.get("/categories/get_all").status_code == 200
+    assert "its budget is -1" in caplog.text
+
+    # a route without a budget is an error of its own
+    monkeypatch.setattr(queryBudget, "QUERY_BUDGET_MODE", "enforce")
+    monkeypatch.delitem(ROUTE_BUDGETS, ("GET", "/categories/get_all"))
+    with pytest.raises(QueryBudgetExceeded, match="has no query budget"):
+        client.get("/categories/get_all")
+
+
+# the middleware counts the statements a request really ran: an unknown user is one lookup, an unauthenticated
+# request none at all
+def test_requests_are_checked_with_their_statement_counts(client, budgeted_requests):
+    client.post("/token", data={"username": "nobody at the desk", "password": "pw"})
+    client.get("/users/me")
+    assert budgeted_requests[("POST", "/token")][-1] == 1
+    assert budgeted_requests[("GET", "/users/me")][-1] == 0
+
+
+def test_query_budget_block_and_decorator(client, auth):
+    with query_budget(2) as budget:
+        client.get("/users/get_users", headers=auth)
+    assert 1 <= len(budget.statements) <= 2
+    with pytest.raises(QueryBudgetExceeded, match="budget is 0"):
+        with query_budget(0):
+            client.get("/users/get_users", headers=auth)
+
+    @query_budget(0)
+    def count_nothing():
+        return client.get("/health/live").status_code
+
+    @query_budget(0)
+    def list_users():
+        return client.get("/users/get_users", headers=auth)
+
+    assert count_nothing() == 200
+    with pytest.raises(QueryBudgetExceeded):
+        list_users()
+
+    @query_budget(0)
+    async def async_nothing():
+        return "done"
+
+    assert client.portal.call(async_nothing) == "done"
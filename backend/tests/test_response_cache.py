@@ -0,0 +1,33 @@
+from sqlalchemy import delete, update
+
+import modelTables
+from database import engine
+
+
+def categories(client, **headers):
+    return client.get("/categories/get_all?limit=1000", headers=headers)
+
+
+# ETags come from the versions in the database, so another worker's writes (or catalogIngest.py's) retire them like
+# this worker's own, and a renamed or deleted category is never answered with a 304 or the cached list
+def test_etags_follow_other_workers_writes(client, auth):
+    category_id = client.post("/categories/", json={"name": "Cached category"}, headers=auth).json()["id"]
+    first = categories(client)
+    etag = first.headers["ETag"]
+    assert categories(client, **{"If-None-Match": etag}).status_code == 304
+
+    with engine.begin() as connection:
+        connection.execute(update(modelTables.Category).where(modelTables.Category.id == category_id)
+                           .values(name="Cached category renamed"))
+    renamed = categories(client, **{"If-None-Match": etag})
+    assert renamed.status_code == 200 and renamed.headers["ETag"] != etag
+    assert {"id": category_id, "name": "Cached category renamed"} in [
+        {"id": row["id"], "name": row["name"]} for row in renamed.json()]
+
+    with engine.begin() as connection:
+        connection.execute(delete(modelTables.Category).where(modelTables.Category.id == category_id))
+        connection.execute(modelTables.CatalogTombstone.__table__.insert().values(table_name="categories",
+                                                                                 row_id=category_id))
+    deleted = categories(client, **{"If-None-Match": renamed.headers["ETag"]})
+    assert deleted.status_code == 200
+    assert category_id not in [row["id"] for row in deleted.json()]
@@ -0,0 +1,17 @@
+import pytest
+
+from benchmarks import roundtrips
+
+
+@pytest.fixture(scope="module")
+def results(client, auth, query_counter):
+    return roundtrips.run(client, auth, query_counter)
+
+
+def test_every_write_endpoint_answers(results):
+    assert [(result.label, result.status) for result in results if result.status != result.expected_status] == []
+
+
+def test_every_write_endpoint_stays_within_budget(results):
+    assert [result for result in results if result.budget is None] == []
+    assert [result for result in results if roundtrips.over_budget(result)] == []
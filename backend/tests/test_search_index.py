@@ -0,0 +1,66 @@
+import random
+
+from searchIndex import SearchIndex
+
+WORDS = ("harry", "potter", "stone", "the", "and", "of", "ring", "lord", "hobbit", "dune", "a", "Ab", "ABC")
+
+
+def substring_scan(docs, field, query):
+    return {doc_id for doc_id, doc in docs.items() if query.lower() in (doc.get(field) or "").lower()}
+
+
+# random titles and authors with shared words, queries shorter and longer than an n-gram, before and after
+# documents are replaced and removed: the index answers exactly what a case-insensitive substring scan does
+def test_search_matches_a_substring_scan():
+    rng = random.Random(7)
+    index = SearchIndex(text_fields=("title", "author"), keyword_fields=("category",))
+    docs = {}
+
+    def random_doc():
+        return {"title": " ".join(rng.choices(WORDS, k=rng.randint(1, 4))),
+                "author": rng.choice((None, "", "Rowling", "Tolkien", "J. R. R. Tolkien", "Herbert")),
+                "category": rng.choice(("fantasy", "scifi"))}
+
+    def check():
+        for field in ("title", "author"):
+            values = [doc.get(field) or "" for doc in docs.values()]
+            queries = ["", "a", "AB", "zzz", "the ring", "TOLK"]
+            for value in rng.sample(values, min(len(values), 20)):
+                start = rng.randint(0, max(len(value) - 1, 0))
+                queries.append(value[start:start + rng.randint(1, 8)])
+            for query in queries:
+                assert index.search(field, query) == substring_scan(docs, field, query), (field, query)
+        assert index.lookup("category", "fantasy") == {
+            doc_id for doc_id, doc in docs.items() if doc["category"] == "fantasy"}
+
+    for doc_id in range(200):
+        docs[doc_id] = random_doc()
+        index.add(doc_id, docs[doc_id])
+    check()
+
+    for doc_id in rng.sample(range(200), 60):
+        docs[doc_id] = random_doc()
+        index.add(doc_id, docs[doc_id])
+    for doc_id in rng.sample(range(200), 60):
+        docs.pop(doc_id, None)
+        index.remove(doc_id)
+    check()
+    assert len(index) == len(docs)
+
+
+# the /bookSearch endpoints answer from the index, checked against a scan of every book's details
+def test_search_endpoints_match_a_scan(client, auth):
+    for title, author in (("Index Harry", "Index Rowling"), ("index harriet", "Index Rowling"),
+                          ("Index Dune", "Index Herbert")):
+        client.post("/books/", json={"title": title, "author": author, "publisher": "Index press",
+                                     "category": "Index", "copies": 1}, headers=auth)
+    books = client.get("/books/get_details").json()
+
+    for query in ("index harr", "ROWLING", "ne", "index"):
+        title_ids = {book["id"] for book in books if query.lower() in (book["title"] or "").lower()}
+        author_ids = {book["id"] for book in books if query.lower() in (book["author"] or "").lower()}
+        publisher_ids = {book["id"] for book in books if query.lower() in (book["publisher"] or "").lower()}
+        assert [book["id"] for book in client.get(f"/bookSearch/get_book_by_title={query}").json()] == sorted(title_ids)
+        assert [book["id"] for book in client.get(f"/bookSearch/get_book_by_author={query}").json()] == sorted(author_ids)
+        searched = client.get(f"/bookSearch/get_searched_Books/search={query}").json()
+        assert [book["id"] for book in searched] == sorted(title_ids | author_ids | publisher_ids)
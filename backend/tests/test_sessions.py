@@ -0,0 +1,104 @@
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+import main
+import modelTables
+import sessions
+from database import engine
+from principalCache import PrincipalCache
+
+
+def sign_in_status(client, username, password):
+    return client.post("/token", data={"username": username, "password": password}).status_code
+
+
+def sign_in(client, username, password="pw"):
+    response = client.post("/token", data={"username": username, "password": password})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+# what a sign out on another worker leaves behind: the session's row marked revoked
+def revoke_elsewhere(headers):
+    token = headers["Authorization"].removeprefix("Bearer ")
+    session_id = main.jwt.decode(token, main.SECRET_KEY, algorithms=[main.ALGORITHM])["sid"]
+    with engine.begin() as connection:
+        connection.execute(update(modelTables.LibrarianSession)
+                           .where(modelTables.LibrarianSession.session_id == session_id)
+                           .values(revoked_at=datetime.now()))
+
+
+# every sign in is its own session: signing one out rejects its token everywhere and leaves the others alone
+def test_a_signed_out_token_is_rejected(client):
+    client.post("/librarians/sign_up", data={"username": "session desk", "password": "pw"})
+    first, second = sign_in(client, "session desk"), sign_in(client, "session desk")
+    assert client.get("/users/me", headers=first).json()["librarian_name"] == "session desk"
+
+    assert client.post("/librarians/sign_out", headers=first).status_code == 200
+    assert client.get("/users/me", headers=first).status_code == 401
+    assert client.get("/users/get_users", headers=first).status_code == 401
+    assert client.post("/librarians/sign_out", headers=first).status_code == 401
+    # an optional librarian route doesn't fall back to anonymous with a revoked token
+    assert client.post("/bookIssues/", json={"book_id": 1, "user_id": 1}, headers=first).status_code == 401
+    assert client.get("/users/me", headers=second).status_code == 200
+
+
+# a sign out handled by another worker only reaches this one through the librarian_sessions table
+def test_a_session_revoked_by_another_worker_is_rejected(client):
+    client.post("/librarians/sign_up", data={"username": "other worker desk", "password": "pw"})
+    headers = sign_in(client, "other worker desk")
+    assert client.get("/users/me", headers=headers).status_code == 200
+    revoke_elsewhere(headers)
+    assert client.get("/users/me", headers=headers).status_code == 401
+
+
+# with the principal cache on, this worker serves the token without the table until its next revocation check
+def test_a_cached_session_revoked_by_another_worker_is_rejected(client, monkeypatch):
+    monkeypatch.setattr(main, "principal_cache", PrincipalCache(16, 300))
+    monkeypatch.setattr(sessions, "SESSION_REVOCATION_CHECK_SECONDS", 3600)
+    client.post("/librarians/sign_up", data={"username": "cached desk", "password": "pw"})
+    headers = sign_in(client, "cached desk")
+    assert client.get("/users/me", headers=headers).status_code == 200
+    assert len(main.principal_cache) == 1
+    revoke_elsewhere(headers)
+    monkeypatch.setattr(sessions.session_registry, "_synced_at", time.monotonic())
+    assert client.get("/users/me", headers=headers).status_code == 200
+
+    monkeypatch.setattr(sessions, "SESSION_REVOCATION_CHECK_SECONDS", 0)
+    assert client.get("/users/me", headers=headers).status_code == 401
+    assert len(main.principal_cache) == 0
+
+    # later checks only read what was revoked since
+    later = sign_in(client, "cached desk")
+    assert client.get("/users/me", headers=later).status_code == 200
+    assert client.get("/users/me", headers=later).status_code == 200
+    revoke_elsewhere(later)
+    assert client.get("/users/me", headers=later).status_code == 401
+
+
+# a correctly signed token whose session was never opened, or whose signature doesn't match, is no session
+def test_unknown_sessions_and_bad_signatures_are_rejected(client, auth):
+    forged = main.create_access_token({"sub": "desk", "lid": 1, "sid": "never-opened"}, timedelta(minutes=5))
+    assert client.get("/users/me", headers={"Authorization": f"Bearer {forged}"}).status_code == 401
+    tampered = sign_in(client, "desk", "desk")["Authorization"][:-2] + "xx"
+    assert client.get("/users/me", headers={"Authorization": tampered}).status_code == 401
+
+
+# sign up opens a session right away, a name is taken once, a wrong password or a missing token gets a 401
+def test_librarian_accounts(client):
+    signed_up = client.post("/librarians/sign_up", data={"username": "account desk", "password": "pw"})
+    assert signed_up.status_code == 200
+    headers = {"Authorization": f"Bearer {signed_up.json()['access_token']}"}
+    assert client.get("/users/me", headers=headers).json()["librarian_name"] == "account desk"
+    assert client.post("/librarians/sign_up", data={"username": "account desk", "password": "pw"}).status_code == 422
+    assert sign_in_status(client, "account desk", "wrong") == 401
+    assert sign_in_status(client, "nobody at the desk", "pw") == 401
+    assert client.get("/users/me").status_code == 401
+
+    librarians = client.get("/librariains/get_all", headers=headers).json()
+    librarian_id = next(row["librarian_id"] for row in librarians if row["librarian_name"] == "account desk")
+    assert client.get(f"/librarians/get_by_id={librarian_id}", headers=headers).json()["librarian_name"] == "account desk"
+    assert client.get("/librarians/get_by_id=999999", headers=headers).status_code == 404
+    assert client.get("/librariains/get_all").status_code == 401
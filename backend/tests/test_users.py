@@ -0,0 +1,36 @@
+def ok(response, status_code=200):
+    assert response.status_code == status_code, (response.request.method, str(response.request.url), response.text)
+    return response.json()
+
+
+# users are managed by librarians; a reader with a book out is listed as issued until the book comes back
+def test_users_are_created_updated_and_deleted(client, auth):
+    user = {"username": "member", "email": "member@example.com", "password": "pw"}
+    ok(client.post("/users/", json=user), 401)
+    user_id = ok(client.post("/users/", json=user, headers=auth), 201)["id"]
+    assert ok(client.get(f"/users/get_user_by_id={user_id}", headers=auth))["email"] == "member@example.com"
+    assert user_id in [row["id"] for row in ok(client.get("/users/get_users", headers=auth))]
+    assert ok(client.get("/users/check_user_in_db=member")) == user_id
+    assert ok(client.get("/users/check_user_in_db=nobody at all")) == 0
+
+    ok(client.put(f"/user/update_user_name={user_id}?updated_name=member renamed", headers=auth))
+    assert ok(client.get("/users/check_user_in_db=member renamed")) == user_id
+    ok(client.put("/user/update_user_name=999999?updated_name=nobody", headers=auth), 404)
+    updated = ok(client.put(f"/users/update_user={user_id}", json={**user, "email": "member@example.org"}, headers=auth))
+    assert (updated["id"], updated["username"], updated["email"]) == (user_id, "member", "member@example.org")
+    ok(client.put("/users/update_user=999999", json=user, headers=auth), 404)
+
+    book_id = ok(client.post("/books/", json={"title": "Member book", "author": "Member author",
+                                              "publisher": "Member press", "category": "Member", "copies": 1},
+                             headers=auth))["id"]
+    issue_id = ok(client.post("/bookIssues/", json={"book_id": book_id, "user_id": user_id}, headers=auth))["id"]
+    assert user_id in [row["id"] for row in ok(client.get("/userSearch/get_issued_user", headers=auth))]
+    ok(client.put(f"/bookIssues/return_bookIssue={issue_id}", headers=auth))
+    assert user_id not in [row["id"] for row in ok(client.get("/userSearch/get_issued_user", headers=auth))]
+
+    # the history stays, without the user
+    ok(client.delete(f"/users/delete_user_by_id={user_id}", headers=auth))
+    ok(client.get(f"/users/get_user_by_id={user_id}", headers=auth), 404)
+    ok(client.delete(f"/users/delete_user_by_id={user_id}", headers=auth), 404)
+    [record] = [row for row in ok(client.get("/bookIssues/get_all")) if row["id"] == issue_id]
+    assert (record["bookname"], record["username"], record["issue_status"]) == ("Member book", None, "returned")
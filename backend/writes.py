@@ -0,0 +1,59 @@
+from sqlalchemy import select, insert, update, delete, exists, literal
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# single round trip writes for the CRUD endpoints
+# nothing is read back after a write and there is no existence check before it: updates and deletes check the
+# rowcount and inserts take the new id from the cursor; callers commit
+# writes return the id and the values written, not a model: the row version is only stamped at commit (see
+# modelTables.py), so a model built here would carry a version that isn't the row's
+# see ROUTE_BUDGETS in queryBudget.py for the statements each endpoint runs
+
+
+def _id_column(model):
+    return model.__mapper__.primary_key[0]
+
+
+# path ids arrive as strings, one that isn't a valid id matches no row
+def coerce_id(model, row_id):
+    try:
+        return _id_column(model).type.python_type(row_id)
+    except (TypeError, ValueError):
+        return None
+
+
+# update one row by id, returns {id, **values} or None when there is no such row
+async def update_one(db: AsyncSession, model, row_id, values: dict):
+    row_id = coerce_id(model, row_id)
+    if row_id is None:
+        return None
+    id_column = _id_column(model)
+    result = await db.execute(
+        update(model).where(id_column == row_id).values(values),
+        execution_options={"synchronize_session": False},
+    )
+    if result.rowcount != 1:
+        return None
+    return {id_column.key: row_id, **values}
+
+
+# delete one row by id (and any extra conditions), False when no row matched
+async def delete_one(db: AsyncSession, model, row_id, *where):
+    row_id = coerce_id(model, row_id)
+    if row_id is None:
+        return False
+    result = await db.execute(
+        delete(model).where(_id_column(model) == row_id, *where),
+        execution_options={"synchronize_session": False},
+    )
+    return result.rowcount == 1
+
+
+# insert `values` unless a row matching `where` exists, as one INSERT .. SELECT .. WHERE NOT EXISTS
+# returns {id, **values}, or None when a row already existed
+async def insert_unless_exists(db: AsyncSession, model, values: dict, *where):
+    result = await db.execute(
+        insert(model).from_select(list(values), select(*(literal(value) for value in values.values())).where(~exists().where(*where)))
+    )
+    if result.rowcount != 1:
+        return None
+    return {_id_column(model).key: result.lastrowid, **values}
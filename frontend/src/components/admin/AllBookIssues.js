@@ -1,6 +1,7 @@
 import axios from "axios";
 import React, { useEffect, useState } from "react";
 import { NotificationManager } from "react-notifications";
+import { subscribeToChanges } from "../utils/commonFunctionalities";
 
 function AllBookIssues() {
   const api = "http://127.0.0.1:8000";
@@ -20,17 +21,34 @@ function AllBookIssues() {
     }
   };
 
+  // apply one issue record change to the list, new records need their book and user names so they are fetched
+  const updateIssueStatus = (bookIssueId, issueStatus) => {
+    setAllBookIssues((bookIssues) => {
+      if (!bookIssues.some((issue) => issue.id === bookIssueId)) {
+        issueStatus !== "deleted" && getAllBookIssues();
+        return bookIssues;
+      }
+      return issueStatus === "deleted"
+        ? bookIssues.filter((issue) => issue.id !== bookIssueId)
+        : bookIssues.map((issue) =>
+            issue.id === bookIssueId
+              ? { ...issue, issue_status: issueStatus }
+              : issue
+          );
+    });
+  };
+
   const handlePendingIssueBook = async (bookIssueId) => {
     if (bookIssueId !== "") {
       try {
         await axios
-          .put(`${api}/update_bookIssue=${bookIssueId}`)
+          .put(`${api}/update_bookIssue=${bookIssueId}`, {}, { headers })
           .then((res) => {
             res?.data &&
               NotificationManager.success(
                 "Book issue record updated successfully"
               );
-            getAllBookIssues();
+            res?.data && updateIssueStatus(bookIssueId, res.data.issue_status);
           });
       } catch (err) {
         NotificationManager.error(err.response.data.detail);
@@ -47,7 +65,7 @@ function AllBookIssues() {
           })
           .then((res) => {
             res?.data && NotificationManager.success(res.data?.message);
-            getAllBookIssues();
+            updateIssueStatus(bookIssueId, "deleted");
           });
       } catch {
         NotificationManager.error("Error in removing returned book record!");
@@ -57,6 +75,14 @@ function AllBookIssues() {
 
   useEffect(() => {
     getAllBookIssues();
+    return subscribeToChanges(
+      {},
+      {
+        issue: (change) => updateIssueStatus(change.id, change.status),
+        resync: getAllBookIssues,
+      }
+    );
+    // eslint-disable-next-line react-hooks/exhaustive-deps
   }, []);
 
   return (
@@ -3,6 +3,7 @@ import React, { useEffect, useState } from "react";
 import { Box, Modal, Typography } from "@mui/material";
 import { NotificationManager } from "react-notifications";
 import { DriveFileRenameOutline, Delete } from "@mui/icons-material";
+import { syncCatalog } from "../utils/commonFunctionalities";
 
 function AllBooks() {
   const api = "http://127.0.0.1:8000";
@@ -37,9 +38,7 @@ function AllBooks() {
 
   const getAllBooks = async () => {
     try {
-      await axios.get(`${api}/books/get_details`).then((res) => {
-        res?.data && setAllBooks(res.data);
-      });
+      setAllBooks(await syncCatalog());
     } catch {
       NotificationManager.error("Error in getting all books!");
     }
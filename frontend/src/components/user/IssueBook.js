@@ -9,6 +9,7 @@ import {
   NotificationManager,
 } from "react-notifications";
 import BookDetails from "../utils/BookDetails";
+import { subscribeToChanges } from "../utils/commonFunctionalities";
 
 function IssueBook() {
   const navigate = useNavigate();
@@ -129,6 +130,27 @@ function IssueBook() {
     getBooksToShow();
   }, [issueDetails]);
 
+  // keep the copies of the listed books current from the change feed
+  useEffect(
+    () =>
+      subscribeToChanges(
+        {},
+        {
+          book: (changed) =>
+            setSearchedBooks((books) =>
+              books.map((book) => (book.id === changed.id ? changed : book))
+            ),
+          book_removed: (removed) =>
+            setSearchedBooks((books) =>
+              books.filter((book) => book.id !== removed.id)
+            ),
+          // a fresh copy of the form re-runs the search
+          resync: () => setIssueDetails((details) => ({ ...details })),
+        }
+      ),
+    []
+  );
+
   return (
     <div>
       <NotificationContainer />
@@ -9,6 +9,7 @@ import {
 import ClassIcon from "@mui/icons-material/Class";
 import SearchIcon from "@mui/icons-material/Search";
 import AutoStoriesIcon from "@mui/icons-material/AutoStories";
+import { syncCatalog } from "../utils/commonFunctionalities";
 
 function UserHome() {
   const navigate = useNavigate();
@@ -18,13 +19,9 @@ function UserHome() {
   const [books, setBooks] = useState([]);
 
   const getAllBooks = () => {
-    try {
-      axios.get(`${api}/books/get_details`).then((res) => {
-        res?.data && setBooks(res.data);
-      });
-    } catch (err) {
-      NotificationManager.error(err);
-    }
+    syncCatalog()
+      .then((catalogBooks) => setBooks(catalogBooks))
+      .catch(() => NotificationManager.error("Error in getting all books!"));
   };
 
   const getBookCategories = () => {
@@ -42,8 +39,16 @@ function UserHome() {
       try {
         await axios
           .get(`${api}/bookSearch/get_searched_Books/search=${search}`)
-          .then((res) => {
-            res.data && setBooks(res.data);
+          .then(async (res) => {
+            if (res.data?.length) {
+              setBooks(res.data);
+              return;
+            }
+            // nothing contains the search as typed, show the closest matches (typos included)
+            const fuzzyRes = await axios.get(
+              `${api}/bookSearch/fuzzy_search=${search}`
+            );
+            fuzzyRes?.data && setBooks(fuzzyRes.data);
           });
       } catch (err) {
         NotificationManager.error(err);
@@ -1,7 +1,7 @@
 import React, { useEffect, useState } from "react";
 import axios from "axios";
 import "./bookDetails.css";
-import { checkUser } from "./commonFunctionalities";
+import { checkUser, subscribeToChanges } from "./commonFunctionalities";
 import { NotificationManager } from "react-notifications";
 import AutoStoriesIcon from "@mui/icons-material/AutoStories";
 
@@ -30,10 +30,15 @@ function BookDetails({ book, setOpenIssueBook }) {
     };
 
     try {
-      await axios.post(`${api}/bookIssues/`, bookIssueDetails).then((res) => {
-        setOpenIssueBook("");
-        NotificationManager.success("Book issued proceeded successfully");
-      });
+      // signed in librarians issue right away, otherwise the request waits for a librarian
+      const token = localStorage.getItem("token");
+      const headers = token ? { Authorization: `Bearer ${token}` } : {};
+      await axios
+        .post(`${api}/bookIssues/`, bookIssueDetails, { headers })
+        .then((res) => {
+          setOpenIssueBook("");
+          NotificationManager.success("Book issued proceeded successfully");
+        });
     } catch (err) {
       NotificationManager.error(err.response.data.detail);
     }
@@ -71,6 +76,13 @@ function BookDetails({ book, setOpenIssueBook }) {
 
   useEffect(() => {
     getBookDetails();
+    // copies change while the modal is open, follow them instead of refetching
+    if (book && book !== "myModal") {
+      return subscribeToChanges(
+        { book_id: book },
+        { book: setBookDetails, resync: getBookDetails }
+      );
+    }
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [book]);
 
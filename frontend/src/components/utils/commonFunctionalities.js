@@ -3,13 +3,11 @@ import { jwtDecode } from "jwt-decode";
 import { NotificationManager } from "react-notifications";
 
 const api = "http://127.0.0.1:8000";
-const token = localStorage.getItem("token");
-const headers = {
-  Authorization: `Bearer ${token}`,
-};
 
 // check for token active or not
+// the token is read on every call, a login or logout doesn't reload the module
 export const checkToken = () => {
+  const token = localStorage.getItem("token");
   let decodedToken = token && jwtDecode(token);
   let currentDate = new Date();
 
@@ -24,15 +22,19 @@ export const checkToken = () => {
   }
 };
 
+// the local session is cleared whatever the server replies, an expired or revoked token can't sign out
 export const handleLogout = async () => {
+  const headers = {
+    Authorization: `Bearer ${localStorage.getItem("token")}`,
+  };
   try {
-    await axios.post(`${api}/librarians/sign_out`).then((res) => {
-      NotificationManager.success("Librarian signed out sussessfully");
-      localStorage.clear();
-      // window.location.reload();
-    });
+    await axios.post(`${api}/librarians/sign_out`, {}, { headers });
+    NotificationManager.success("Librarian signed out sussessfully");
   } catch (err) {
     NotificationManager.error(err);
+  } finally {
+    localStorage.clear();
+    // window.location.reload();
   }
 };
 
@@ -49,3 +51,79 @@ export const checkUser = async (username) => {
     }
   }
 };
+
+// live book and issue updates from the change feed (Server-Sent Events)
+// params narrows the stream ({ book_id } or { category_id }), handlers are keyed by
+// event name (book, book_removed, issue, resync); returns a function closing the stream
+export const subscribeToChanges = (params, handlers) => {
+  const query = new URLSearchParams(params).toString();
+  const source = new EventSource(
+    `${api}/changes/stream${query ? `?${query}` : ""}`
+  );
+  Object.entries(handlers).forEach(([event, handler]) => {
+    source.addEventListener(event, (e) => handler(JSON.parse(e.data)));
+  });
+  return () => source.close();
+};
+
+// local copy of the catalog kept in IndexedDB (localStorage holds only about 5 MB) and brought up to date
+// with /catalog/changes, so only the books, authors, publishers and categories changed since the last sync
+// are downloaded; resolves to the book details (with author, publisher and category names) ordered by id
+const catalogTables = ["books", "authors", "publishers", "categories"];
+
+const catalogStore = (mode, use) =>
+  new Promise((resolve, reject) => {
+    const open = indexedDB.open("library", 1);
+    open.onupgradeneeded = () => open.result.createObjectStore("catalog");
+    open.onerror = () => reject(open.error);
+    open.onsuccess = () => {
+      const request = use(
+        open.result.transaction("catalog", mode).objectStore("catalog")
+      );
+      request.onsuccess = () => resolve(request.result);
+      request.onerror = () => reject(request.error);
+    };
+  });
+
+// without IndexedDB (or with a broken one) there is no local copy and every sync is a full copy
+const loadCatalog = () =>
+  catalogStore("readonly", (store) => store.get("catalog")).catch(() => null);
+
+// a copy that doesn't fit the quota isn't kept; the one stored before stays, and its version
+// still gets the right delta next time
+const saveCatalog = (catalog) =>
+  catalogStore("readwrite", (store) => store.put(catalog, "catalog")).catch(
+    () => null
+  );
+
+export const syncCatalog = async () => {
+  // the copy older versions kept in localStorage
+  localStorage.removeItem("catalog");
+  let catalog = await loadCatalog();
+  const res = await axios.get(`${api}/catalog/changes`, {
+    params: { since: catalog?.version || 0 },
+  });
+  const changes = res.data;
+  if (changes.full || !catalog) {
+    catalog = { books: {}, authors: {}, publishers: {}, categories: {} };
+  }
+  catalogTables.forEach((table) => {
+    changes[table].forEach((row) => {
+      catalog[table][row.id] = row;
+    });
+    changes.deleted[table].forEach((id) => {
+      delete catalog[table][id];
+    });
+  });
+  catalog.version = changes.version;
+  await saveCatalog(catalog);
+
+  return Object.values(catalog.books).map((book) => ({
+    id: book.id,
+    title: book.title,
+    author: catalog.authors[book.author]?.name ?? null,
+    publisher: catalog.publishers[book.publisher]?.name ?? null,
+    category: catalog.categories[book.category]?.name ?? null,
+    copies: book.copies,
+  }));
+};
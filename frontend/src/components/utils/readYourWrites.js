@@ -0,0 +1,22 @@
+import axios from "axios";
+
+// read-your-writes with read replicas: a write response carries X-Primary-Until, and until then
+// every request sends it back so the backend reads from the primary and this tab sees its own writes
+// (see readReplicas.py); kept in sessionStorage so a reload right after a write keeps it
+const header = "X-Primary-Until";
+
+axios.interceptors.request.use((config) => {
+  const until = sessionStorage.getItem("primaryUntil");
+  if (until && Number(until) * 1000 > Date.now()) {
+    config.headers[header] = until;
+  }
+  return config;
+});
+
+axios.interceptors.response.use((res) => {
+  const until = res.headers[header.toLowerCase()];
+  if (until) {
+    sessionStorage.setItem("primaryUntil", until);
+  }
+  return res;
+});
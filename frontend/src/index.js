@@ -4,6 +4,7 @@ import "./index.css";
 import App from "./App";
 import reportWebVitals from "./reportWebVitals";
 import "react-notifications/lib/notifications.css";
+import "./components/utils/readYourWrites";
 
 const root = ReactDOM.createRoot(document.getElementById("root"));
 root.render(